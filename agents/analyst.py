@@ -1,60 +1,96 @@
-import os
 import asyncio
-import json
-import re
-from google import genai
+from sqlalchemy.orm import undefer
 from database import get_db, Influencer
 from dotenv import load_dotenv
+from agents.base import LoopLocalSemaphore, model_for
+from agents.query_scheduler import refresh_query_fit_scores
+from utils.registry import get_gemini_client
+from utils.json_stream import parse_json_array
+from utils import resilience, tracing
+from utils.prompt_cache import PromptPrefix
 from utils.logger import get_logger
-from config import BATCH_SIZE, MAX_CONCURRENT_API
+from config import (
+    BATCH_SIZE, MAX_CONCURRENT_API, FIT_SCORE_THRESHOLD, TOP_PICK_THRESHOLD, ESCALATION_MARGIN, LLM_CALL_TIMEOUT,
+)
 
 load_dotenv()
 logger = get_logger("analyst")
 
-_gemini_client = None
-def _get_client():
-    global _gemini_client
-    if _gemini_client is None:
-        _gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _gemini_client
+# Gemini structured output: the model must return exactly this array shape
+SCORE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "INTEGER"},
+            "fit_score": {"type": "INTEGER"},
+            "fit_reason": {"type": "STRING"},
+            "price_min": {"type": "NUMBER"},
+            "price_max": {"type": "NUMBER"},
+        },
+        "required": ["id", "fit_score", "fit_reason", "price_min", "price_max"],
+        "propertyOrdering": ["id", "fit_score", "fit_reason", "price_min", "price_max"],
+    },
+}
+
+# Fixed scoring rubric + few-shot output: identical for every batch, so it is sent as a stable
+# system_instruction prefix (see utils.prompt_cache); only the brand requirement and candidate lines
+# go in each request
+SCORING_RUBRIC = """You are a senior influencer marketing strategist. You evaluate batches of influencer candidates
+for a brand. Each request gives the brand requirement, an optional budget range and the candidate list.
+
+Tasks:
+1. **Fit Score (1-100)**: Rate brand fit considering:
+   - Content relevance to the brand requirement (most important, 40% weight)
+   - Follower count and audience size (20% weight)
+   - Platform suitability for the brand (20% weight)
+   - Budget fit if budget is specified (20% weight)
+   - Be STRICT: generic/irrelevant creators should score below 30
+   - Only truly relevant niche creators should score above 70
+
+2. **Price Range (USD)**: Estimate per-collaboration cost:
+   Pricing tiers by follower count:
+   - Nano (<10K): $50-$200 (fixed)
+   - Micro (10K-100K): followers × $0.02-$0.05
+   - Mid (100K-500K): followers × $0.05-$0.08
+   - Macro (500K+): followers × $0.08-$0.12
+
+   Platform multipliers:
+   - YouTube: ×1.0 (baseline)
+   - Instagram: ×0.6
+   - TikTok: ×0.4 (high engagement: ×0.6-0.8)
+
+   Premiums: niche specialist +20-50%, high engagement +10-30%
+   If followers = 0 and unverified: set price_min=0, price_max=0
+
+3. **Fit Reason**: Brief explanation (English, under 60 chars) of why this creator fits or doesn't.
+
+Output: a JSON array with one object per creator (id = the candidate's ID), e.g.
+[
+  {"id": 0, "fit_score": 85, "fit_reason": "Pet memorial niche, strong audience alignment", "price_min": 500, "price_max": 1200},
+  {"id": 1, "fit_score": 25, "fit_reason": "Gaming content, no brand relevance", "price_min": 50, "price_max": 100}
+]"""
+
+RUBRIC_PREFIX = PromptPrefix("analyst-rubric", SCORING_RUBRIC)
+
+
+def is_borderline(score) -> bool:
+    """Scores this close to a decision threshold are worth a second opinion from the stronger model."""
+    if not isinstance(score, (int, float)):
+        return False
+    return any(abs(score - t) <= ESCALATION_MARGIN for t in (FIT_SCORE_THRESHOLD, TOP_PICK_THRESHOLD))
 
 
 class AnalystAgent:
     def __init__(self):
-        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_API)
+        self.semaphore = LoopLocalSemaphore(MAX_CONCURRENT_API)
 
     def _parse_json_response(self, text: str) -> list:
-        """Multi-layer fallback JSON parsing."""
-        # Attempt 1: Direct parse
-        try:
-            result = json.loads(text)
-            if isinstance(result, list):
-                return result
-        except json.JSONDecodeError:
-            pass
-
-        # Attempt 2: Extract from markdown code block
-        m = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', text)
-        if m:
-            try:
-                result = json.loads(m.group(1))
-                if isinstance(result, list):
-                    return result
-            except json.JSONDecodeError:
-                pass
-
-        # Attempt 3: Regex match first JSON array
-        m = re.search(r'\[[\s\S]*?\](?=\s*$|\s*[^,\]\}])', text)
-        if m:
-            try:
-                result = json.loads(m.group(0))
-                if isinstance(result, list):
-                    return result
-            except json.JSONDecodeError:
-                pass
-
-        logger.warning(f"All JSON parse attempts failed, raw response: {text[:300]}...")
-        return []
+        """Structured output is normally valid JSON; otherwise recover the intact items one by one."""
+        results = [r for r in parse_json_array(text) if isinstance(r, dict)]
+        if not results:
+            logger.warning(f"JSON parse failed, raw response: {(text or '')[:300]}...")
+        return results
 
     def _validate_score(self, res: dict) -> dict:
         """Validate and correct AI scoring output."""
@@ -79,7 +115,7 @@ class AnalystAgent:
 
         return res
 
-    async def analyze_batch(self, brand_requirement: str, influencers: list, budget_range: tuple = None) -> bool:
+    def _batch_prompt(self, brand_requirement: str, influencers: list, budget_range: tuple = None) -> str:
         inf_list_text = ""
         for i, inf in enumerate(influencers):
             snippet = (inf.tags or '')[:300]
@@ -99,85 +135,147 @@ IMPORTANT: Use budget to inform scoring:
 - Still include all influencers but clearly note budget fit in the reason
 """
 
-        prompt = f"""You are a senior influencer marketing strategist. Evaluate these candidates.
+        return f"""Evaluate these candidates.
 
 Brand requirement: '{brand_requirement}'
 {budget_hint}
 Candidates:
-{inf_list_text}
-
-Tasks:
-1. **Fit Score (1-100)**: Rate brand fit considering:
-   - Content relevance to the brand requirement (most important, 40% weight)
-   - Follower count and audience size (20% weight)
-   - Platform suitability for the brand (20% weight)
-   - Budget fit if budget is specified (20% weight)
-   - Be STRICT: generic/irrelevant creators should score below 30
-   - Only truly relevant niche creators should score above 70
-
-2. **Price Range (USD)**: Estimate per-collaboration cost:
-   Pricing tiers by follower count:
-   - Nano (<10K): $50-$200 (fixed)
-   - Micro (10K-100K): followers × $0.02-$0.05
-   - Mid (100K-500K): followers × $0.05-$0.08
-   - Macro (500K+): followers × $0.08-$0.12
-
-   Platform multipliers:
-   - YouTube: ×1.0 (baseline)
-   - Instagram: ×0.6
-   - TikTok: ×0.4 (high engagement: ×0.6-0.8)
-
-   Premiums: niche specialist +20-50%, high engagement +10-30%
-   If followers = 0 and unverified: set price_min=0, price_max=0
-
-3. **Fit Reason**: Brief explanation (English, under 60 chars) of why this creator fits or doesn't.
-
-Output format (strict JSON array, no extra text):
-[
-  {{"id": 0, "fit_score": 85, "fit_reason": "Pet memorial niche, strong audience alignment", "price_min": 500, "price_max": 1200}},
-  {{"id": 1, "fit_score": 25, "fit_reason": "Gaming content, no brand relevance", "price_min": 50, "price_max": 100}}
-]"""
+{inf_list_text}"""
 
+    async def _score(self, model: str, brand_requirement: str, influencers: list, budget_range: tuple = None,
+                     task: str = "scoring") -> dict:
+        """One scoring call on `model`; returns {index into influencers: validated result}."""
+        prompt = self._batch_prompt(brand_requirement, influencers, budget_range)
         async with self.semaphore:
-            try:
-                response = await asyncio.to_thread(
-                    _get_client().models.generate_content,
-                    model="gemini-2.0-flash",
-                    contents=prompt
-                )
-
-                results = self._parse_json_response(response.text)
-                if not results:
-                    logger.error(f"Batch parse failed, {len(influencers)} candidates unscored")
-                    return False
-
-                updated = 0
-                for res in results:
-                    res = self._validate_score(res)
-                    idx = res.get('id')
-                    if idx is not None and 0 <= idx < len(influencers):
-                        target = influencers[idx]
-                        target.fit_score = res.get('fit_score')
-                        target.fit_reason = res.get('fit_reason')
-                        target.price_min = res.get('price_min')
-                        target.price_max = res.get('price_max')
-                        updated += 1
-
-                logger.info(f"Batch scoring complete: {updated}/{len(influencers)} updated")
-                return True
+            response = await resilience.call(
+                RUBRIC_PREFIX.generate,
+                get_gemini_client(),
+                model,
+                prompt,
+                name=f"gemini:{model}", timeout=LLM_CALL_TIMEOUT, hedge=True, api="gemini", task=task,
+                response_mime_type="application/json",
+                response_schema=SCORE_SCHEMA,
+            )
+        scored = {}
+        for res in self._parse_json_response(response.text):
+            res = self._validate_score(res)
+            idx = res.get('id')
+            if isinstance(idx, int) and 0 <= idx < len(influencers):
+                scored[idx] = res
+        return scored
 
+    async def analyze_batch(self, brand_requirement: str, influencers: list, budget_range: tuple = None) -> bool:
+        """
+        Tiered scoring: the whole batch goes to the fast "scoring" model; candidates whose score lands
+        within ESCALATION_MARGIN of FIT_SCORE_THRESHOLD or TOP_PICK_THRESHOLD are re-scored by the
+        "scoring_escalation" model, whose verdict wins.
+        """
+        try:
+            with tracing.span("analyst.score", model=model_for("scoring"), candidates=len(influencers)):
+                scored = await self._score(model_for("scoring"), brand_requirement, influencers, budget_range)
+        except Exception as e:
+            logger.error(f"Analyst batch evaluation failed: {e}")
+            return False
+        if not scored:
+            logger.error(f"Batch parse failed, {len(influencers)} candidates unscored")
+            return False
+
+        escalation_model = model_for("scoring_escalation")
+        borderline = [idx for idx, res in scored.items() if is_borderline(res.get('fit_score'))]
+        if borderline and escalation_model != model_for("scoring"):
+            try:
+                with tracing.span("analyst.escalate", model=escalation_model, candidates=len(borderline)):
+                    rescored = await self._score(
+                        escalation_model, brand_requirement, [influencers[i] for i in borderline], budget_range,
+                        task="scoring_escalation",
+                    )
+                for sub_idx, res in rescored.items():
+                    scored[borderline[sub_idx]] = res
+                logger.info(f"Escalated {len(rescored)}/{len(borderline)} borderline candidates to {escalation_model}")
             except Exception as e:
-                logger.error(f"Analyst batch evaluation failed: {e}")
-                return False
+                logger.warning(f"Escalation failed, keeping first-pass scores: {e}")
 
-    async def run(self, brand_requirement: str, budget_range: tuple = None):
+        for idx, res in scored.items():
+            target = influencers[idx]
+            target.fit_score = res.get('fit_score')
+            target.fit_reason = res.get('fit_reason')
+            target.price_min = res.get('price_min')
+            target.price_max = res.get('price_max')
+
+        logger.info(f"Batch scoring complete: {len(scored)}/{len(influencers)} updated")
+        return True
+
+    async def _score_ids(self, brand_requirement: str, ids: list, budget_range: tuple = None) -> set:
+        """Score one micro-batch in its own session; returns the query_ids of its creators."""
         with get_db() as db:
-            pending_list = db.query(Influencer).filter(Influencer.fit_score == None).all()
+            with tracing.span("db.read", table="influencers"):
+                influencers = db.query(Influencer).options(undefer(Influencer.tags))\
+                    .filter(Influencer.id.in_(ids), Influencer.fit_score == None).all()
+            if not influencers:
+                return set()
+            query_ids = {inf.query_id for inf in influencers}
+            if not await self.analyze_batch(brand_requirement, influencers, budget_range):
+                logger.warning(f"Micro-batch scoring failed ({len(influencers)} candidates)")
+            with tracing.span("db.write", table="influencers", rows=len(influencers)):
+                db.commit()
+        return query_ids
+
+    async def consume(self, brand_requirement: str, queue: asyncio.Queue, budget_range: tuple = None):
+        """
+        Streaming mode: score candidates while the scout is still enriching.
+        The queue carries lists of newly saved influencer IDs; None ends the stream.
+        Every BATCH_SIZE IDs start a micro-batch immediately; the remainder is flushed at the end,
+        then anything else still pending is scored as in run().
+        """
+        buffer, tasks, attempted = [], [], set()
+
+        def launch(ids):
+            if resilience.deadline_expired():
+                return  # left unscored; picked up by the next run
+            attempted.update(ids)
+            tasks.append(asyncio.create_task(self._score_ids(brand_requirement, ids, budget_range)))
+
+        while True:
+            ids = await queue.get()
+            if ids is None:
+                break
+            buffer.extend(ids)
+            while len(buffer) >= BATCH_SIZE:
+                launch(buffer[:BATCH_SIZE])
+                buffer = buffer[BATCH_SIZE:]
+        if buffer:
+            launch(buffer)
+
+        query_ids = set()
+        for i, result in enumerate(await asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(result, Exception):
+                logger.error(f"Micro-batch {i} exception: {result}")
+            else:
+                query_ids |= result
+        logger.info(f"Streamed scoring complete: {len(attempted)} candidates in {len(tasks)} micro-batches")
+        refresh_query_fit_scores(query_ids)
+
+        if resilience.deadline_expired():
+            logger.warning("Run deadline reached, returning partial scores")
+            return
+        await self.run(brand_requirement, budget_range=budget_range, exclude=attempted)
+
+    async def run(self, brand_requirement: str, budget_range: tuple = None, exclude=()):
+        """Score every candidate without a fit_score (except IDs in `exclude`)."""
+        if resilience.deadline_expired():
+            return
+        with get_db() as db:
+            # tags 是延迟加载列，评分提示词要用，随查询一起读取（避免逐行懒加载）
+            with tracing.span("db.read", table="influencers"):
+                pending_list = db.query(Influencer).options(undefer(Influencer.tags))\
+                    .filter(Influencer.fit_score == None).all()
+            pending_list = [inf for inf in pending_list if inf.id not in exclude]
             if not pending_list:
                 logger.info("No candidates pending scoring")
                 return
 
             logger.info(f"Scoring {len(pending_list)} candidates")
+            query_ids = {inf.query_id for inf in pending_list}
 
             batches = [pending_list[i:i + BATCH_SIZE] for i in range(0, len(pending_list), BATCH_SIZE)]
             tasks = [self.analyze_batch(brand_requirement, batch, budget_range) for batch in batches]
@@ -189,5 +287,9 @@ Output format (strict JSON array, no extra text):
                 elif not result:
                     logger.warning(f"Batch {i} scoring failed")
 
-            db.commit()
+            with tracing.span("db.write", table="influencers", rows=len(pending_list)):
+                db.commit()
             logger.info("Analyst scoring complete")
+
+        # Feed scores back into per-query yield so the scheduler can favour productive queries
+        refresh_query_fit_scores(query_ids)
@@ -1,18 +1,47 @@
-import os
 import asyncio
+import threading
+import weakref
 from abc import ABC, abstractmethod
-from google import genai
 from utils.logger import get_logger
-from config import MAX_CONCURRENT_API
+from utils.registry import get_gemini_client
+from utils import resilience
+from config import MAX_CONCURRENT_API, DEFAULT_MODEL, MODEL_ROUTES, LLM_CALL_TIMEOUT
 
-_gemini_client = None
 
+def model_for(task: str) -> str:
+    """按任务选择模型（config.MODEL_ROUTES），未配置的任务使用 DEFAULT_MODEL。"""
+    return MODEL_ROUTES.get(task) or DEFAULT_MODEL
 
-def get_gemini_client():
-    global _gemini_client
-    if _gemini_client is None:
-        _gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _gemini_client
+
+class LoopLocalSemaphore:
+    """
+    按 event loop 分别持有的 asyncio.Semaphore。
+
+    Agent 通过 utils.registry 在进程内共享，而 Streamlit 每次点击都会 asyncio.run 一个新 loop，
+    多个 session 还可能在不同线程里同时运行。asyncio.Semaphore 一旦在某个 loop 上使用过就不能跨 loop 复用，
+    所以每个 loop 单独创建一个，loop 结束后自动回收。
+    """
+
+    def __init__(self, value: int):
+        self._value = value
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _get(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            sem = self._semaphores.get(loop)
+            if sem is None:
+                sem = self._semaphores[loop] = asyncio.Semaphore(self._value)
+            return sem
+
+    async def __aenter__(self):
+        sem = self._get()
+        await sem.acquire()
+        return sem
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._get().release()
 
 
 class BaseAgent(ABC):
@@ -21,14 +50,16 @@ class BaseAgent(ABC):
     name: str = "base"
 
     def __init__(self):
-        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_API)
+        self.semaphore = LoopLocalSemaphore(MAX_CONCURRENT_API)
         self.logger = get_logger(self.name)
         self.client = get_gemini_client()
 
-    async def generate(self, prompt: str, model: str = "gemini-2.0-flash") -> str:
+    async def generate(self, prompt: str, task: str = "default") -> str:
         async with self.semaphore:
-            response = await asyncio.to_thread(
+            model = model_for(task)
+            response = await resilience.call(
                 self.client.models.generate_content,
+                name=f"gemini:{model}", timeout=LLM_CALL_TIMEOUT, hedge=True, api="gemini", task=task,
                 model=model,
                 contents=prompt,
             )
@@ -0,0 +1,152 @@
+"""
+按历史产出调度搜索查询。
+
+每条查询执行后都会在 query_stats 表记录产出（原始结果数、过滤后结果数、新创作者数），
+Analyst 评分后再回填这些创作者的平均 fit_score。QueryScheduler 用这些历史数据：
+- 给 generate_queries 提示"哪些角度对相似需求最有效"
+- 按角度的历史产出给查询排序（先执行的查询翻页更多，后面的更容易饱和）
+- 剪掉历史上从未产出有效结果的查询（搜索请求失败的记录不算，见 QueryStat.failed）
+"""
+import re
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from sqlalchemy import func
+from database import get_db, Influencer, QueryStat
+from utils.logger import get_logger
+
+logger = get_logger("query_scheduler")
+
+# 与 ScoutAgent.generate_queries 提示词中的角度编号一致
+ANGLES = {
+    1: "Core product/niche keywords",
+    2: "Creator type (reviewer, vlogger, educator)",
+    3: "Audience identity (e.g. dog mom, gym newbie)",
+    4: "Content style (haul, unboxing, tutorial)",
+    5: "Related/adjacent topic",
+}
+
+SIMILARITY_FLOOR = 0.1      # 不相似需求的历史仍有少量参考价值
+HISTORY_LIMIT = 500         # 每个平台最多参考的历史查询条数
+NEUTRAL_FIT = 50            # 尚未评分的查询按中性分处理
+
+_WORD_RE = re.compile(r"[a-z0-9]{3,}")
+
+
+def _tokens(text: str) -> set:
+    return set(_WORD_RE.findall((text or "").lower()))
+
+
+def _similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class QueryScheduler:
+    def __init__(self, brand_requirement: str, platform: str):
+        self.brand_requirement = brand_requirement
+        self.platform = platform
+        self._angle_scores: Dict[int, float] = {}
+        self._dead_queries: set = set()
+        self._load_history()
+
+    def _load_history(self):
+        with get_db() as db:
+            rows = db.query(
+                QueryStat.brand_requirement, QueryStat.query, QueryStat.angle,
+                QueryStat.filtered_hits, QueryStat.new_creators, QueryStat.avg_fit_score,
+            ).filter(QueryStat.platform == self.platform, QueryStat.failed.isnot(True))\
+                .order_by(QueryStat.created_at.desc()).limit(HISTORY_LIMIT).all()
+
+        brand_tokens = _tokens(self.brand_requirement)
+        weighted = defaultdict(float)
+        weights = defaultdict(float)
+        productive = set()
+        executed = set()
+        for row in rows:
+            norm = _normalize_query(row.query or "")
+            executed.add(norm)
+            if (row.filtered_hits or 0) > 0:
+                productive.add(norm)
+            if row.angle not in ANGLES:
+                continue
+            w = max(SIMILARITY_FLOOR, _similarity(brand_tokens, _tokens(row.brand_requirement)))
+            fit = row.avg_fit_score if row.avg_fit_score is not None else NEUTRAL_FIT
+            # 产出 = 新创作者数 × 创作者质量
+            weighted[row.angle] += w * (row.new_creators or 0) * fit / 100
+            weights[row.angle] += w
+
+        self._angle_scores = {a: weighted[a] / weights[a] for a in weights if weights[a] > 0}
+        self._dead_queries = executed - productive
+
+    def ranked_angles(self) -> List[int]:
+        """按历史产出从高到低排列的角度编号（无历史的角度排在中间，保留探索机会）。"""
+        if not self._angle_scores:
+            return list(ANGLES)
+        known = sorted(self._angle_scores.values())
+        median = known[len(known) // 2]
+        return sorted(ANGLES, key=lambda a: self._angle_scores.get(a, median), reverse=True)
+
+    def prompt_hint(self) -> str:
+        """给 generate_queries 的提示：哪些角度对相似需求最有效。"""
+        if not self._angle_scores:
+            return ""
+        best = [a for a in self.ranked_angles() if a in self._angle_scores][:2]
+        names = ", ".join(f"{a}. {ANGLES[a]}" for a in best)
+        return (
+            f"- For similar briefs, these angles found the most high-fit creators: {names}. "
+            f"Make those queries especially strong and keep the angle order 1-5.\n"
+        )
+
+    def plan(self, queries: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+        """
+        queries 为 generate_queries 输出的 [(query, angle)]。
+        返回 [(query, angle)]：剪掉历史上无有效结果的查询，并按角度产出排序。
+        """
+        planned = list(queries)
+        alive = [(q, a) for q, a in planned if _normalize_query(q) not in self._dead_queries]
+        if len(alive) < len(planned):
+            logger.info(f"Pruned {len(planned) - len(alive)} queries with no historical results ({self.platform})")
+        if not alive:
+            alive = planned
+
+        order = {angle: rank for rank, angle in enumerate(self.ranked_angles())}
+        alive.sort(key=lambda qa: order.get(qa[1], len(order)))
+        return alive
+
+    def record(self, batch_id: int, query: str, angle: int, stats: dict) -> int:
+        """记录一条查询的产出，返回 query_stats.id（用于把创作者归因到查询）。"""
+        with get_db() as db:
+            row = QueryStat(
+                batch_id=batch_id,
+                brand_requirement=self.brand_requirement,
+                platform=self.platform,
+                query=query,
+                angle=angle,
+                raw_hits=stats.get("raw_hits", 0),
+                filtered_hits=stats.get("filtered_hits", 0),
+                new_creators=stats.get("new_creators", 0),
+                pages=stats.get("pages", 0),
+                failed=stats.get("failed", False),
+            )
+            db.add(row)
+            db.commit()
+            return row.id
+
+
+def refresh_query_fit_scores(query_ids) -> None:
+    """评分完成后，回填这些查询所发现创作者的平均 fit_score。"""
+    query_ids = [q for q in set(query_ids) if q]
+    if not query_ids:
+        return
+    with get_db() as db:
+        averages = db.query(Influencer.query_id, func.avg(Influencer.fit_score))\
+            .filter(Influencer.query_id.in_(query_ids), Influencer.fit_score != None)\
+            .group_by(Influencer.query_id).all()
+        for query_id, avg in averages:
+            db.query(QueryStat).filter_by(id=query_id).update({"avg_fit_score": float(avg)})
+        db.commit()
@@ -1,51 +1,56 @@
 import os
 import asyncio
-from typing import List
-from googleapiclient.discovery import build
-from google import genai
+from typing import List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
 from database import get_db, Influencer, SearchBatch
 from dotenv import load_dotenv
-from utils.youtube_utils import YouTubeProvider
-from utils.instagram_utils import InstagramProvider
-from utils.tiktok_utils import TikTokProvider
+from agents.base import LoopLocalSemaphore, model_for
+from agents.query_scheduler import QueryScheduler
+from utils.registry import get_gemini_client, get_search_service, get_provider
+from utils.url_classifier import get_classifier
+from utils.json_stream import parse_json_array
+from utils import resilience, tracing, usage
 from utils.logger import get_logger
-from config import MAX_CONCURRENT_API, SEARCH_RESULTS_PER_QUERY, QUERIES_PER_PLATFORM, GLOBAL_URL_BLACKLIST
+from config import (
+    MAX_CONCURRENT_API, SEARCH_RESULTS_PER_QUERY, QUERIES_PER_PLATFORM,
+    SEARCH_MAX_PAGES, SEARCH_MIN_NEW_RATIO, STREAM_CHUNK_SIZE,
+    LLM_CALL_TIMEOUT, SEARCH_CALL_TIMEOUT,
+)
 
 load_dotenv()
 logger = get_logger("scout")
 
-_gemini_client = None
-def _get_client():
-    global _gemini_client
-    if _gemini_client is None:
-        _gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _gemini_client
-
-# Cache search service globally — build() is expensive and leaks memory if called repeatedly
-_search_service = None
-def _get_search_service():
-    global _search_service
-    if _search_service is None:
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if api_key:
-            _search_service = build("customsearch", "v1", developerKey=api_key)
-    return _search_service
+# Gemini structured output for generate_queries: one object per query, tagged with its angle number
+QUERY_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "angle": {"type": "INTEGER"},
+            "query": {"type": "STRING"},
+        },
+        "required": ["angle", "query"],
+        "propertyOrdering": ["angle", "query"],
+    },
+}
 
 
 class ScoutAgent:
     def __init__(self, platforms: List[str] = None):
         self.search_engine_id = os.getenv("SEARCH_ENGINE_ID")
-        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_API)
+        self.semaphore = LoopLocalSemaphore(MAX_CONCURRENT_API)
 
-        self._all_providers = {
-            "YouTube": YouTubeProvider(),
-            "Instagram": InstagramProvider(),
-            "TikTok": TikTokProvider(),
-        }
+        # Providers are process-wide singletons (see utils.registry)
         platform_names = platforms or ["YouTube"]
-        self.providers = {p: self._all_providers[p] for p in platform_names if p in self._all_providers}
-
-    async def generate_queries(self, brand_requirement: str, platform_filter: str, brand_name: str = "") -> List[str]:
+        self.providers = {}
+        for p in platform_names:
+            provider = get_provider(p)
+            if provider is not None:
+                self.providers[p] = provider
+
+    async def generate_queries(self, brand_requirement: str, platform_filter: str, brand_name: str = "",
+                               angle_hint: str = "") -> List[Tuple[str, int]]:
+        """Returns [(query, angle)] where angle is the numbered search angle (1-5) in the prompt."""
         brand_context = f"Brand: {brand_name}\n" if brand_name else ""
         prompt = f"""You are an expert influencer search specialist.
 
@@ -64,7 +69,7 @@ CRITICAL RULES:
   3. Audience identity (e.g. dog mom, gym newbie)
   4. Content style (haul, unboxing, tutorial)
   5. Related/adjacent topic
-
+{angle_hint}
 GOOD examples (SHORT, broad):
   {platform_filter} pet memorial urn
   {platform_filter} dog lover vlog
@@ -76,137 +81,258 @@ BAD examples (too long, too specific — Google returns 0 results):
   {platform_filter} plant based protein powder review newbie gym
   {platform_filter} eco friendly sustainable baby products unboxing haul vlog
 
-Output format: One query per line, no numbering, no extra text."""
+Output: a JSON array of {{"angle": <angle number 1-5>, "query": "<query>"}}, one object per angle."""
 
-        response = await asyncio.to_thread(
-            _get_client().models.generate_content,
-            model="gemini-2.0-flash",
-            contents=prompt
+        model = model_for("query_generation")
+        response = await resilience.call(
+            get_gemini_client().models.generate_content,
+            name=f"gemini:{model}", timeout=LLM_CALL_TIMEOUT, hedge=True, api="gemini", task="query_generation",
+            model=model,
+            contents=prompt,
+            config={"response_mime_type": "application/json", "response_schema": QUERY_SCHEMA},
         )
-        raw_queries = [q.strip() for q in response.text.strip().split('\n') if q.strip()]
 
         validated = []
-        for q in raw_queries:
+        for i, item in enumerate(parse_json_array(response.text)):
+            if not isinstance(item, dict):
+                continue
+            q = str(item.get("query") or "").strip()
+            if not q:
+                continue
             if platform_filter not in q:
                 q = f"{platform_filter} {q}"
-            validated.append(q)
+            angle = item.get("angle")
+            validated.append((q, angle if isinstance(angle, int) else i + 1))
 
         queries = validated[:QUERIES_PER_PLATFORM]
         logger.info(f"Generated {len(queries)} queries ({platform_filter}): {queries}")
         return queries
 
-    async def execute_search(self, query: str) -> List[dict]:
+    async def _search_page(self, service, query: str, start: int) -> dict:
+        # Deadline only, no hedging: searches stay sequential (SSL crashes on Cloud). A page abandoned at the
+        # deadline keeps running in its worker thread until the service's per-request socket timeout
+        # (SEARCH_CALL_TIMEOUT); each worker thread has its own connection (see utils.discovery_docs)
         async with self.semaphore:
+            return await resilience.call(
+                service.cse().list(
+                    q=query, cx=self.search_engine_id, num=SEARCH_RESULTS_PER_QUERY, start=start
+                ).execute,
+                name="cse.list", timeout=SEARCH_CALL_TIMEOUT, api="custom_search",
+            )
+
+    @staticmethod
+    def _identity(classifier, url: str):
+        """Creator identity used for saturation tracking: creator key, or URL when no handle. None if rejected."""
+        if not url:
+            return None
+        url_class = classifier.classify(url)
+        if not url_class.accepted:
+            return None
+        return url_class.creator_key or url
+
+    async def execute_search(self, query: str, seen: set = None, stats: dict = None) -> List[dict]:
+        """
+        Adaptive pagination: keep fetching result pages while the share of new creators on the
+        last page stays >= SEARCH_MIN_NEW_RATIO, up to SEARCH_MAX_PAGES pages (1 quota unit each).
+        `seen` holds identities already found in this run and is updated in place.
+        `stats` (optional) receives raw_hits / filtered_hits / new_creators / pages for the query scheduler,
+        plus failed=True when the search service is missing or the first page request failed (the hit counts
+        then say nothing about the query). A failure on a later page keeps the earlier pages' yield.
+        """
+        seen = set() if seen is None else seen
+        stats = {} if stats is None else stats
+        for k in ("raw_hits", "filtered_hits", "new_creators", "pages"):
+            stats.setdefault(k, 0)
+
+        service = get_search_service()
+        if not service:
+            logger.error("Search service not available")
+            stats["failed"] = True
+            return []
+        classifier = get_classifier()
+        all_items = []
+        for page in range(SEARCH_MAX_PAGES):
+            start = page * SEARCH_RESULTS_PER_QUERY + 1
+            if start + SEARCH_RESULTS_PER_QUERY - 1 > 100:  # Custom Search serves at most 100 results
+                break
             try:
-                service = _get_search_service()
-                if not service:
-                    logger.error("Search service not available")
-                    return []
-                res = await asyncio.to_thread(
-                    service.cse().list(
-                        q=query, cx=self.search_engine_id, num=SEARCH_RESULTS_PER_QUERY
-                    ).execute
-                )
-                items = res.get('items', [])
-                logger.info(f"Search returned {len(items)} results: {query[:60]}...")
-                return items
+                res = await self._search_page(service, query, start)
             except Exception as e:
-                logger.error(f"Search failed ({query[:40]}...): {e}")
-                return []
-
-    async def _fetch_single_stats(self, url: str, title: str, snippet: str):
-        """Fetch stats for a single URL."""
-        platform = "Unknown"
-        handle = ""
-        real_subs = 0
-        real_name = title
-        engagement_rate = 0.0
-        verified = False
+                logger.error(f"Search failed ({query[:40]}..., start={start}): {e}")
+                stats["failed"] = page == 0
+                break
 
-        for pname, provider in self.providers.items():
-            if provider.validate_url(url):
-                platform = pname
-                handle = provider.extract_handle(url)
-                try:
-                    async with self.semaphore:
-                        real_subs, fetched_name, engagement_rate = await provider.get_stats(url)
-                    if fetched_name:
-                        real_name = fetched_name
-                    if real_subs > 0:
-                        verified = True
-                except Exception as e:
-                    logger.warning(f"Stats fetch failed ({url}): {e}")
+            items = res.get('items', [])
+            all_items.extend(items)
+            new = 0
+            for item in items:
+                identity = self._identity(classifier, item.get('link'))
+                if identity is None:
+                    continue
+                stats["filtered_hits"] += 1
+                if identity not in seen:
+                    seen.add(identity)
+                    new += 1
+            stats["raw_hits"] += len(items)
+            stats["new_creators"] += new
+            stats["pages"] += 1
+            logger.info(f"Search page {page + 1} returned {len(items)} results ({new} new): {query[:60]}...")
+
+            if len(items) < SEARCH_RESULTS_PER_QUERY or 'nextPage' not in res.get('queries', {}):
                 break
+            if new / len(items) < SEARCH_MIN_NEW_RATIO:
+                logger.info(f"Query saturated after {page + 1} page(s): {query[:60]}...")
+                break
+
+        return all_items
 
+    def _build_result(self, url: str, title: str, snippet: str, platform: str, handle: str, stats) -> dict:
+        real_subs, fetched_name, engagement_rate = stats or (0, "", 0.0)
         return {
-            "name": real_name,
+            "name": fetched_name or title,
             "url": url,
             "platform": platform,
             "platform_handle": handle,
             "follower_count": real_subs,
-            "followers_verified": verified,
+            "followers_verified": real_subs > 0,
             "engagement_rate": engagement_rate,
             "tags": snippet,
         }
 
-    async def save_to_discovery(self, all_raw_results: List[dict], batch_id: int = None) -> int:
+    async def _fetch_platform_stats(self, platform: str, urls: List[str]) -> dict:
+        """
+        Fetch stats for all URLs of one platform through the provider's bulk path. No timeout around the
+        whole platform: each provider request / batch has its own (STATS_CALL_TIMEOUT), and providers stop
+        issuing requests once the run deadline has passed, so nothing keeps spending quota after the run.
+        """
+        provider = self.providers[platform]
+        try:
+            with tracing.span("scout.stats", platform=platform, urls=len(urls)):
+                async with self.semaphore:
+                    return await provider.get_stats_bulk(urls)
+        except Exception as e:
+            # Saved without verified stats rather than dropped (also what happens once the run deadline passes)
+            logger.warning(f"Stats fetch failed ({platform}, {len(urls)} URLs): {e}")
+            return {}
+
+    async def save_to_discovery(self, all_raw_results: List[dict], batch_id: int = None,
+                                sink: Optional[asyncio.Queue] = None) -> int:
+        """
+        Filter, enrich and save new creators. With a `sink`, candidates are enriched and saved in
+        chunks of STREAM_CHUNK_SIZE and each chunk's new influencer IDs are put on the queue as soon
+        as they are committed, so the analyst can start scoring while later chunks are still fetching.
+        """
         seen_urls = set()
+        seen_keys = set()
         valid_items = []
+        classifier = get_classifier()
 
-        with get_db() as db:
-            existing_urls = {row.url for row in db.query(Influencer.url).all()}
+        with tracing.span("db.read", table="influencers"), get_db() as db:
+            existing_urls = set()
+            existing_keys = set()
+            for row in db.query(Influencer.url, Influencer.creator_key):
+                existing_urls.add(row.url)
+                if row.creator_key:
+                    existing_keys.add(row.creator_key)
 
         for item in all_raw_results:
             url = item.get('link')
             if not url:
                 continue
-            url_lower = url.lower()
-            if any(word in url_lower for word in GLOBAL_URL_BLACKLIST):
-                continue
             if url in seen_urls or url in existing_urls:
                 continue
             seen_urls.add(url)
-            valid_items.append(item)
+            # One pass: blacklist + platform rules + platform detection + handle extraction
+            url_class = classifier.classify(url)
+            if not url_class.accepted or url_class.platform not in self.providers:
+                continue
+            # Resolve to creator identity before any API call: /@Foo, /@foo/videos, m.…/@foo?si=… are one creator
+            key = url_class.creator_key
+            if key:
+                if key in seen_keys or key in existing_keys:
+                    continue
+                seen_keys.add(key)
+            valid_items.append((item, url_class))
 
         if not valid_items:
             logger.info("No new candidate URLs found")
             return 0
 
-        logger.info(f"After filtering: {len(valid_items)} new URLs, fetching stats...")
+        logger.info(f"After filtering: {len(valid_items)} new creators, fetching stats...")
 
-        # Fetch stats sequentially to avoid SSL/memory issues on Cloud
-        results = []
-        for item in valid_items:
-            try:
-                result = await self._fetch_single_stats(
-                    item['link'],
-                    item.get('title', ''),
-                    item.get('snippet', '')
-                )
-                results.append(result)
-            except Exception as e:
-                logger.error(f"Stats fetch exception: {e}")
+        # Fetch stats one platform at a time (bulk APIs such as Instagram Graph batch group lookups;
+        # other providers fetch sequentially to avoid SSL/memory issues on Cloud)
+        by_platform = {}
+        for item, url_class in valid_items:
+            by_platform.setdefault(url_class.platform, []).append((item, url_class))
 
         new_count = 0
-        with get_db() as db:
-            for result in results:
-                if result.get("platform") == "Unknown":
-                    continue
-                if batch_id:
-                    result["batch_id"] = batch_id
-                db.add(Influencer(**result))
-                new_count += 1
-                logger.info(f"Added: {result['name']} ({result['platform']}, {result['follower_count']:,})")
-            if batch_id:
-                batch = db.query(SearchBatch).filter_by(id=batch_id).first()
-                if batch:
-                    batch.candidate_count = new_count
-            db.commit()
+        for platform, entries in by_platform.items():
+            chunk_size = STREAM_CHUNK_SIZE if sink is not None else len(entries)
+            for i in range(0, len(entries), chunk_size):
+                chunk = entries[i:i + chunk_size]
+                urls = [url_class.canonical_url or item['link'] for item, url_class in chunk]
+                stats = await self._fetch_platform_stats(platform, urls)
+                ids = self._save_results(self._chunk_results(chunk, stats), batch_id)
+                new_count += len(ids)
+                if sink is not None and ids:
+                    await sink.put(ids)
 
         return new_count
 
-    async def run(self, brand_requirement: str, brand_name: str = "", batch_id: int = None) -> tuple:
-        """Returns (new_count, batch_id) so the UI can auto-focus on the new batch."""
+    def _chunk_results(self, chunk, stats: dict) -> List[dict]:
+        results = []
+        for item, url_class in chunk:
+            url = url_class.canonical_url or item['link']
+            result = self._build_result(
+                url, item.get('title', ''), item.get('snippet', ''),
+                url_class.platform, url_class.handle, stats.get(url),
+            )
+            result["creator_key"] = url_class.creator_key
+            result["query_id"] = item.get("query_id")
+            results.append(result)
+        return results
+
+    def _save_results(self, results: List[dict], batch_id: int = None) -> List[int]:
+        with tracing.span("db.write", table="influencers", rows=len(results)), get_db() as db:
+            try:
+                return self._insert_results(db, results, batch_id)
+            except IntegrityError:
+                # Another session saved some of the same creators in the meantime — drop those and retry once
+                db.rollback()
+                keys = [r["creator_key"] for r in results if r["creator_key"]]
+                urls = [r["url"] for r in results]
+                taken = {row.creator_key for row in db.query(Influencer.creator_key).filter(Influencer.creator_key.in_(keys))}
+                taken |= {row.url for row in db.query(Influencer.url).filter(Influencer.url.in_(urls))}
+                results = [r for r in results if r["url"] not in taken and r["creator_key"] not in taken]
+                return self._insert_results(db, results, batch_id)
+
+    def _insert_results(self, db, results: List[dict], batch_id: int = None) -> List[int]:
+        """Insert one chunk and return the new influencer IDs (candidate_count accumulates across chunks)."""
+        added = []
+        for result in results:
+            if batch_id:
+                result["batch_id"] = batch_id
+            inf = Influencer(**result)
+            db.add(inf)
+            added.append(inf)
+            logger.info(f"Added: {result['name']} ({result['platform']}, {result['follower_count']:,})")
+        if batch_id:
+            batch = db.query(SearchBatch).filter_by(id=batch_id).first()  # autoflush assigns the new IDs
+            if batch:
+                batch.candidate_count = (batch.candidate_count or 0) + len(added)
+        db.flush()
+        ids = [inf.id for inf in added]
+        db.commit()
+        return ids
+
+    async def run(self, brand_requirement: str, brand_name: str = "", batch_id: int = None,
+                  sink: Optional[asyncio.Queue] = None) -> tuple:
+        """
+        Returns (new_count, batch_id) so the UI can auto-focus on the new batch.
+        With a `sink`, new influencer IDs are streamed to it as they are saved (see save_to_discovery);
+        the caller is responsible for closing the stream.
+        """
         logger.info(f"Scout starting, platforms: {list(self.providers.keys())}")
 
         if not batch_id:
@@ -220,23 +346,64 @@ Output format: One query per line, no numbering, no extra text."""
                 db.commit()
                 batch_id = batch.id
                 logger.info(f"Created search batch #{batch_id}")
+        usage.set_batch(batch_id)
 
-        # Generate queries (one platform at a time to reduce memory)
-        all_queries = []
-        for provider in self.providers.values():
-            queries = await self.generate_queries(brand_requirement, provider.search_site_filter, brand_name)
-            all_queries.extend(queries)
-
-        logger.info(f"Total {len(all_queries)} queries, searching sequentially...")
-
-        # Execute searches sequentially to avoid SSL crashes on Cloud
-        all_items = []
-        for query in all_queries:
-            items = await self.execute_search(query)
-            all_items.extend(items)
-
-        logger.info(f"Search phase complete, {len(all_items)} raw results")
+        # Generate queries (one platform at a time to reduce memory), ordered/pruned by historical yield
+        planned = []
+        for pname, provider in self.providers.items():
+            if resilience.deadline_expired():
+                break
+            scheduler = QueryScheduler(brand_requirement, pname)
+            try:
+                with tracing.span("scout.generate_queries", platform=pname):
+                    queries = await self.generate_queries(
+                        brand_requirement, provider.search_site_filter, brand_name, angle_hint=scheduler.prompt_hint()
+                    )
+            except resilience.DeadlineExceeded as e:
+                # Keep the queries planned so far; the loop stops once the run deadline itself has passed
+                logger.warning(f"Query generation timed out ({pname}): {e}")
+                continue
+            planned.extend((scheduler, query, angle) for query, angle in scheduler.plan(queries))
+
+        logger.info(f"Total {len(planned)} queries, searching sequentially...")
+
+        # Creators already in the DB don't count as "new" when deciding whether to fetch more pages
+        with tracing.span("db.read", table="influencers"), get_db() as db:
+            seen = set()
+            for row in db.query(Influencer.url, Influencer.creator_key):
+                seen.add(row.creator_key or row.url)
+
+        # Execute searches sequentially to avoid SSL crashes on Cloud. Once a platform's queries are done,
+        # its stats fetch + save starts in the background and overlaps the next platform's searches.
+        saves = []
+        platform_items = []
+        raw_total = 0
+        for i, (scheduler, query, angle) in enumerate(planned):
+            if resilience.deadline_expired():
+                logger.warning(f"Run deadline reached, skipping {len(planned) - i} remaining queries")
+                break
+            stats = {}
+            with tracing.span("scout.search", query=query) as search_span:
+                items = await self.execute_search(query, seen=seen, stats=stats)
+                search_span.set(**stats)
+            query_id = scheduler.record(batch_id, query, angle, stats)
+            for item in items:
+                item["query_id"] = query_id
+            platform_items.extend(items)
+            raw_total += len(items)
+            if i + 1 == len(planned) or planned[i + 1][0] is not scheduler:
+                saves.append(asyncio.create_task(self.save_to_discovery(platform_items, batch_id=batch_id, sink=sink)))
+                platform_items = []
+        if platform_items:
+            saves.append(asyncio.create_task(self.save_to_discovery(platform_items, batch_id=batch_id, sink=sink)))
+
+        logger.info(f"Search phase complete, {raw_total} raw results")
 
-        new_count = await self.save_to_discovery(all_items, batch_id=batch_id)
+        new_count = 0
+        for result in await asyncio.gather(*saves, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Saving candidates failed: {result}")
+            else:
+                new_count += result
         logger.info(f"Scout complete! Added {new_count} candidates.")
         return new_count, batch_id
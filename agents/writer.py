@@ -1,25 +1,20 @@
-import os
 import asyncio
-from google import genai
+from sqlalchemy.orm import undefer
 from database import get_db, Influencer
 from dotenv import load_dotenv
+from agents.base import LoopLocalSemaphore, model_for
+from utils.registry import get_gemini_client
+from utils import resilience, tracing
 from utils.logger import get_logger
-from config import FIT_SCORE_THRESHOLD, MAX_CONCURRENT_API, EMAIL_WORD_LIMIT
+from config import FIT_SCORE_THRESHOLD, MAX_CONCURRENT_API, EMAIL_WORD_LIMIT, LLM_CALL_TIMEOUT
 
 load_dotenv()
 logger = get_logger("writer")
 
-_gemini_client = None
-def _get_client():
-    global _gemini_client
-    if _gemini_client is None:
-        _gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _gemini_client
-
 
 class WriterAgent:
     def __init__(self):
-        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_API)
+        self.semaphore = LoopLocalSemaphore(MAX_CONCURRENT_API)
 
     async def write_draft(self, brand_requirement: str, influencer, brand_name: str = "", brand_website: str = "") -> bool:
         brand_info = ""
@@ -53,9 +48,11 @@ class WriterAgent:
 
         async with self.semaphore:
             try:
-                response = await asyncio.to_thread(
-                    _get_client().models.generate_content,
-                    model="gemini-2.0-flash",
+                model = model_for("email")
+                response = await resilience.call(
+                    get_gemini_client().models.generate_content,
+                    name=f"gemini:{model}", timeout=LLM_CALL_TIMEOUT, hedge=True, api="gemini", task="email",
+                    model=model,
                     contents=prompt
                 )
                 draft = response.text.strip()
@@ -76,7 +73,8 @@ class WriterAgent:
 
     async def run(self, brand_requirement: str, brand_name: str = "", brand_website: str = ""):
         with get_db() as db:
-            pending_list = db.query(Influencer).filter(
+            # fit_reason 是延迟加载列，提示词要用，随查询一起读取
+            pending_list = db.query(Influencer).options(undefer(Influencer.fit_reason)).filter(
                 Influencer.is_confirmed == True,
                 Influencer.email_draft == None
             ).all()
@@ -87,10 +85,24 @@ class WriterAgent:
 
             logger.info(f"开始生成邮件: {len(pending_list)} 位候选人")
 
-            tasks = [self.write_draft(brand_requirement, inf, brand_name, brand_website) for inf in pending_list]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            with tracing.span("writer.drafts", candidates=len(pending_list)):
+                tasks = [self.write_draft(brand_requirement, inf, brand_name, brand_website) for inf in pending_list]
+                results = await asyncio.gather(*tasks, return_exceptions=True)
 
             success = sum(1 for r in results if r is True)
             logger.info(f"邮件生成完成: {success}/{len(pending_list)} 成功")
 
+            with tracing.span("db.write", table="influencers", rows=success):
+                db.commit()
+
+    async def regenerate(self, brand_requirement: str, influencer_id: int,
+                         brand_name: str = "", brand_website: str = "") -> bool:
+        """为单个候选人重新生成邮件草稿。"""
+        with get_db() as db:
+            influencer = db.query(Influencer).options(undefer(Influencer.fit_reason))\
+                .filter_by(id=influencer_id).first()
+            if influencer is None:
+                return False
+            ok = await self.write_draft(brand_requirement, influencer, brand_name, brand_website)
             db.commit()
+            return ok
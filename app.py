@@ -1,19 +1,21 @@
 import os
+from utils import startup
 import streamlit as st
 # config must be imported before agents (injects Streamlit secrets into env vars)
 from config import (
     SUPPORTED_PLATFORMS, DEFAULT_PLATFORMS,
     FIT_SCORE_THRESHOLD, TOP_PICK_THRESHOLD, DEFAULT_MIN_SCORE,
     MAX_SEARCHES_PER_SESSION, SEARCH_COOLDOWN_SECONDS,
-    MAX_EMAIL_GENERATES_PER_SESSION,
+    MAX_EMAIL_GENERATES_PER_SESSION, RUN_DEADLINE_SECONDS, DAILY_QUOTAS,
 )
 import asyncio
-import pandas as pd
 from datetime import datetime
-from database import get_db, Influencer, SearchBatch
-from agents.scout import ScoutAgent
-from agents.analyst import AnalystAgent
-from agents.writer import WriterAgent
+from utils import data_version, tracing
+from utils.registry import get_scout_agent, get_analyst_agent, get_writer_agent, warm_up_in_background
+# pandas / google SDKs / agents / SQLAlchemy (database, read_models, usage, resilience) are imported lazily
+# on first use to keep cold start fast: the page shell and sidebar controls paint before the first query
+
+startup.mark("imports")
 
 st.set_page_config(
     page_title="InfluencerScout",
@@ -168,6 +170,16 @@ if _missing:
             '```\nGEMINI_API_KEY = "your_key"\nGOOGLE_API_KEY = "your_key"\nSEARCH_ENGINE_ID = "your_id"\n```')
     st.stop()
 
+# ======================== Warm-up ========================
+
+@st.cache_resource(show_spinner=False)
+def _start_warmup():
+    """Build agents / providers / API services once per process, off the render path."""
+    return warm_up_in_background(SUPPORTED_PLATFORMS)
+
+_start_warmup()
+startup.mark("warmup_started")
+
 # ======================== Session State ========================
 
 if "current_batch_id" not in st.session_state:
@@ -208,13 +220,62 @@ def format_time(dt):
         return "Yesterday"
     return dt.strftime("%m/%d %H:%M")
 
+def show_stage_timings(run_trace):
+    """Per-stage timing breakdown of one traced run; busy > wall means the stage ran concurrently."""
+    rows = [
+        {
+            "Stage": t.name,
+            "Calls": t.calls,
+            "Busy (s)": round(t.busy, 2),
+            "Wall (s)": round(t.wall, 2),
+            "Errors": t.errors,
+        }
+        for t in run_trace.breakdown()
+    ]
+    if rows:
+        st.caption(f"Stage timings · total {run_trace.root.duration:.1f}s")
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
 async def _run_search_and_score(brand_req, platforms, brand_name, budget_range):
-    scout = ScoutAgent(platforms=platforms)
-    new_count, batch_id = await scout.run(brand_req, brand_name=brand_name)
-    analyst = AnalystAgent()
-    await analyst.run(brand_req, budget_range=budget_range)
+    # Pipelined: the scout streams newly saved candidate IDs to the analyst, which scores them
+    # in micro-batches while the scout keeps fetching stats. Bounded by RUN_DEADLINE_SECONDS:
+    # once it passes, both stop starting new work and what is done so far is kept.
+    from utils.resilience import run_deadline
+    scout = get_scout_agent(platforms)
+    analyst = get_analyst_agent()
+    handoff = asyncio.Queue()
+
+    async def _scout():
+        try:
+            return await scout.run(brand_req, brand_name=brand_name, sink=handoff)
+        finally:
+            await handoff.put(None)  # end of stream, even if the scout fails
+
+    with run_deadline(RUN_DEADLINE_SECONDS):
+        (new_count, batch_id), _ = await asyncio.gather(
+            _scout(), analyst.consume(brand_req, handoff, budget_range=budget_range)
+        )
     return new_count, batch_id
 
+# ======================== Cached Reads ========================
+# Read-model queries are memoized on the data version (bumped on every committed write by agents or UI),
+# so reruns without writes — slider drags, filter changes — render from cache without touching SQLite.
+
+def get_db():
+    """database.get_db, imported on first use (SQLAlchemy + ORM models are the slowest import left)."""
+    from database import get_db as _get_db
+    return _get_db()
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _cached_read(reader_name, args, version):
+    import read_models
+    with get_db() as db:
+        return getattr(read_models, reader_name)(db, *args)
+
+def cached_read(reader_name, *args, table="influencers", batch_id=None):
+    """reader_name: a read_models function name (passed by name so read_models loads on the first read)."""
+    return _cached_read(reader_name, args, data_version.version(table, batch_id))
+
 # ======================== Sidebar ========================
 
 st.sidebar.markdown("#### ✦ InfluencerScout")
@@ -258,10 +319,14 @@ if st.sidebar.button("🔍 Search + Score", type="primary", use_container_width=
         with st.status("Agents working...", expanded=True) as status:
             st.write("Scout Agent is searching across platforms...")
             st.write("Analyst Agent will score candidates automatically...")
+            from utils import usage
+            run_trace = tracing.Trace("search_and_score", platforms=",".join(platforms))
             try:
-                new_count, new_batch_id = asyncio.run(
-                    _run_search_and_score(brand_req, platforms, brand_name, budget_range)
-                )
+                with run_trace, usage.scope():
+                    new_count, new_batch_id = asyncio.run(
+                        _run_search_and_score(brand_req, platforms, brand_name, budget_range)
+                    )
+                    run_trace.root.set(batch_id=new_batch_id, new_candidates=new_count)
                 # Auto-switch view to the new batch
                 st.session_state.current_batch_id = new_batch_id
                 st.session_state.search_count += 1
@@ -269,15 +334,16 @@ if st.sidebar.button("🔍 Search + Score", type="primary", use_container_width=
                 st.write(f"Found {new_count} new candidates — scoring complete.")
             except Exception as e:
                 st.error(f"Search/scoring failed: {e}")
+            show_stage_timings(run_trace)
             status.update(label="Search + Score complete", state="complete")
 
 # Search history
 st.sidebar.markdown("---")
 with st.sidebar.expander("Search History", expanded=False):
     with get_db() as db:
-        recent_batches = db.query(SearchBatch).order_by(SearchBatch.created_at.desc()).limit(10).all()
-        if recent_batches:
-            for b in recent_batches:
+        history = cached_read("recent_batches", 10, table="search_batches")
+        if history:
+            for b in history:
                 bcol1, bcol2 = st.sidebar.columns([4, 1])
                 is_current = (st.session_state.current_batch_id == b.id)
                 with bcol1:
@@ -287,6 +353,7 @@ with st.sidebar.expander("Search History", expanded=False):
                     )
                 with bcol2:
                     if st.button("×", key=f"del_batch_{b.id}", help="Delete this batch"):
+                        from database import Influencer, SearchBatch
                         db.query(Influencer).filter_by(batch_id=b.id).delete()
                         db.query(SearchBatch).filter_by(id=b.id).delete()
                         db.commit()
@@ -296,6 +363,27 @@ with st.sidebar.expander("Search History", expanded=False):
         else:
             st.caption("No search history yet")
 
+# API usage ledger: today's quota burn, and what the current batch spent per endpoint
+with st.sidebar.expander("API Usage", expanded=False):
+    today = datetime.now().strftime("%Y-%m-%d")
+    today_usage = {r.api: r for r in cached_read("usage_by_day", 1, table="api_usage") if r.day == today}
+    for api, quota in DAILY_QUOTAS.items():
+        used = today_usage[api].units if api in today_usage else 0
+        st.caption(f"{api}: {used:,} / {quota:,} units today")
+        st.progress(min(1.0, used / quota) if quota else 0.0)
+    if "gemini" in today_usage:
+        st.caption(f"gemini: {today_usage['gemini'].calls} calls · {today_usage['gemini'].total_tokens:,} tokens today")
+    if st.session_state.current_batch_id:
+        batch_usage = cached_read("usage_by_batch", st.session_state.current_batch_id, table="api_usage")
+        if batch_usage:
+            st.caption(f"Batch #{st.session_state.current_batch_id}")
+            st.dataframe(
+                [{"Endpoint": r.endpoint, "Calls": r.calls, "Units": r.units,
+                  "Tokens in/out": f"{r.prompt_tokens:,} / {r.output_tokens:,}",
+                  "Avg ms": round(r.avg_latency_ms or 0)} for r in batch_usage],
+                hide_index=True, use_container_width=True,
+            )
+
 # ======================== Main Content ========================
 
 # Header
@@ -311,18 +399,19 @@ with get_db() as db:
     current_batch_id = st.session_state.current_batch_id
     if current_batch_id:
         # Show candidates from the current/latest batch
-        batch_inf = db.query(Influencer).filter_by(batch_id=current_batch_id)\
-            .order_by(Influencer.fit_score.desc()).all()
-        all_inf = batch_inf if batch_inf else db.query(Influencer).order_by(Influencer.fit_score.desc()).all()
+        batch_inf = cached_read("candidate_rows", current_batch_id, batch_id=current_batch_id)
+        all_inf = batch_inf if batch_inf else cached_read("candidate_rows")
     else:
-        all_inf = db.query(Influencer).order_by(Influencer.fit_score.desc()).all()
+        all_inf = cached_read("candidate_rows")
 
     if not all_inf:
         st.info("Configure your brand requirements in the sidebar, then click **Search + Score** to get started.")
+        startup.mark("first_render")
+        startup.log_report_once()
         st.stop()
 
     confirmed_count = sum(1 for i in all_inf if i.is_confirmed)
-    draft_count = sum(1 for i in all_inf if i.email_draft)
+    draft_count = sum(1 for i in all_inf if i.has_draft)
     scored = [i for i in all_inf if i.fit_score is not None]
     avg_score = sum(i.fit_score for i in scored) / len(scored) if scored else 0
 
@@ -344,7 +433,7 @@ with get_db() as db:
             <strong>{top_pick.name}</strong> &nbsp;·&nbsp; {top_pick.platform} &nbsp;·&nbsp;
             {format_followers(top_pick.follower_count, top_pick.followers_verified)} followers &nbsp;·&nbsp;
             Score: {top_pick.fit_score} &nbsp;—&nbsp;
-            <em>{top_pick.fit_reason or ''}</em>
+            <em>{cached_read("fit_reason", top_pick.id)}</em>
         </div>
         """, unsafe_allow_html=True)
 
@@ -355,14 +444,14 @@ with get_db() as db:
     st.markdown('<div class="section-title"><span class="step-badge">STEP 1</span> Select Candidates</div>', unsafe_allow_html=True)
 
     # Filters — batch selector + platform + score range
-    view_col, plat_col, score_col = st.columns([1, 1, 1])
+    view_col, plat_col, score_col, sort_col = st.columns([1, 1, 1, 1])
 
     with view_col:
-        all_batches = db.query(SearchBatch).order_by(SearchBatch.created_at.desc()).all()
+        all_batches = cached_read("recent_batches", 10, table="search_batches")[:8]
         view_options = ["All Candidates"]
         batch_map = {}
         default_idx = 0
-        for idx, b in enumerate(all_batches[:8]):
+        for idx, b in enumerate(all_batches):
             label = f"{format_time(b.created_at)} · {b.platforms} ({b.candidate_count or 0})"
             view_options.append(label)
             batch_map[label] = b.id
@@ -372,11 +461,10 @@ with get_db() as db:
 
     # Resolve which candidates to display based on selection
     if view_choice == "All Candidates":
-        display_list = db.query(Influencer).order_by(Influencer.fit_score.desc()).all()
+        display_list = cached_read("candidate_rows")
     else:
         sel_batch_id = batch_map.get(view_choice)
-        display_list = db.query(Influencer).filter_by(batch_id=sel_batch_id)\
-            .order_by(Influencer.fit_score.desc()).all() if sel_batch_id else all_inf
+        display_list = cached_read("candidate_rows", sel_batch_id, batch_id=sel_batch_id) if sel_batch_id else all_inf
 
     all_platforms = list(set(i.platform for i in display_list if i.platform))
     with plat_col:
@@ -387,6 +475,11 @@ with get_db() as db:
         score_range = st.slider(
             "Fit Score", 0, 100, (DEFAULT_MIN_SCORE, 100), label_visibility="collapsed"
         )
+    with sort_col:
+        sort_by = st.selectbox(
+            "Sort by", ["Best Match (budget-aware)", "Fit Score"], label_visibility="collapsed",
+            help="Best Match blends fit score, budget fit, value per dollar, engagement and platform diversity",
+        )
 
     # Apply filters
     filtered = [
@@ -396,6 +489,16 @@ with get_db() as db:
         and (i.follower_count or 0) >= min_followers
     ]
 
+    # Composite ranking over a columnar snapshot (re-ranks in ms when the budget slider moves)
+    match_scores = {}
+    if filtered:
+        from utils.ranking import CandidateSnapshot
+        ranked_ids, ranked_scores = CandidateSnapshot.from_rows(filtered).rank(budget_range)
+        match_scores = dict(zip(ranked_ids.tolist(), (ranked_scores * 100).round().astype(int).tolist()))
+        if sort_by.startswith("Best Match"):
+            position = {inf_id: pos for pos, inf_id in enumerate(ranked_ids.tolist())}
+            filtered.sort(key=lambda i: position[i.id])
+
     # Build table
     data = []
     for inf in filtered:
@@ -405,13 +508,15 @@ with get_db() as db:
             "Name": inf.name or "",
             "Platform": inf.platform or "",
             "Followers": format_followers(inf.follower_count, inf.followers_verified),
+            "Match": match_scores.get(inf.id, 0),
             "Fit Score": inf.fit_score if inf.fit_score else 0,
             "Est. Price": format_price(inf.price_min, inf.price_max),
-            "Reason": (inf.fit_reason or "")[:50],
+            "Reason": inf.reason_preview or "",
             "URL": inf.url or "",
         })
 
     if data:
+        import pandas as pd
         df = pd.DataFrame(data)
         edited_df = st.data_editor(
             df,
@@ -419,9 +524,10 @@ with get_db() as db:
                 "Select": st.column_config.CheckboxColumn(""),
                 "URL": st.column_config.LinkColumn("Link", display_text="Open"),
                 "Fit Score": st.column_config.ProgressColumn(min_value=0, max_value=100),
+                "Match": st.column_config.NumberColumn(width="small", help="Budget-aware composite score"),
                 "ID": st.column_config.NumberColumn(width="small"),
             },
-            disabled=["ID", "Name", "Platform", "Followers", "Fit Score", "Est. Price", "Reason"],
+            disabled=["ID", "Name", "Platform", "Followers", "Match", "Fit Score", "Est. Price", "Reason"],
             hide_index=True,
             use_container_width=True,
             key="main_table"
@@ -431,53 +537,80 @@ with get_db() as db:
         action_col1, action_col2, action_col3 = st.columns([1, 1, 2])
         with action_col1:
             if st.button("💾 Save Selection", use_container_width=True):
-                save_count = 0
-                for _, row in edited_df.iterrows():
-                    target = db.query(Influencer).filter_by(id=row['ID']).first()
-                    if target:
-                        target.is_confirmed = row['Select']
-                        save_count += 1
+                # Only rows whose checkbox changed; one UPDATE per new value
+                changed = edited_df["Select"].ne(df["Select"])
+                changes = dict(zip(edited_df.loc[changed, "ID"].tolist(), edited_df.loc[changed, "Select"].tolist()))
+                from database import update_confirmed
+                save_count = update_confirmed(db, changes) if changes else 0
                 db.commit()
-                st.toast(f"Saved {save_count} candidates")
+                st.toast(f"Saved {save_count} changes" if save_count else "No changes to save")
                 st.rerun()
 
         # Get all confirmed candidates (across all batches) for email generation
-        all_confirmed_no_draft = db.query(Influencer).filter(
-            Influencer.is_confirmed == True,
-            Influencer.email_draft == None
-        ).all()
+        pending_drafts = cached_read("pending_draft_count")
 
         with action_col2:
             _email_limit_hit = st.session_state.email_gen_count >= MAX_EMAIL_GENERATES_PER_SESSION
             if st.button(
-                f"✍️ Generate Emails ({len(all_confirmed_no_draft)})",
+                f"✍️ Generate Emails ({pending_drafts})",
                 use_container_width=True,
-                disabled=len(all_confirmed_no_draft) == 0 or _email_limit_hit,
-                type="primary" if all_confirmed_no_draft and not _email_limit_hit else "secondary",
+                disabled=pending_drafts == 0 or _email_limit_hit,
+                type="primary" if pending_drafts and not _email_limit_hit else "secondary",
             ):
                 if _email_limit_hit:
                     st.error("Email generation limit reached for this session.")
                 else:
-                    with st.spinner(f"Writing emails for {len(all_confirmed_no_draft)} candidates..."):
+                    with st.spinner(f"Writing emails for {pending_drafts} candidates..."):
                         try:
-                            writer = WriterAgent()
-                            asyncio.run(writer.run(
-                                brand_req or "Brand partnership",
-                                brand_name=brand_name,
-                                brand_website=brand_website
-                            ))
+                            from utils import usage
+                            from utils.resilience import run_deadline
+                            writer = get_writer_agent()
+                            with run_deadline(RUN_DEADLINE_SECONDS), tracing.Trace("generate_emails"), usage.scope():
+                                asyncio.run(writer.run(
+                                    brand_req or "Brand partnership",
+                                    brand_name=brand_name,
+                                    brand_website=brand_website
+                                ))
                             st.session_state.email_gen_count += 1
                             st.rerun()
                         except Exception as e:
                             st.error(f"Email generation failed: {e}")
 
         with action_col3:
-            if all_confirmed_no_draft:
+            if pending_drafts:
                 st.caption("Save your selection first, then generate emails")
             elif confirmed_count > 0 and draft_count > 0:
                 st.caption("Emails are ready — scroll down to preview")
             else:
                 st.caption("Select candidates → Save → Generate Emails")
+
+        # Budget-constrained shortlist: best total fit score under a total budget + per-platform caps
+        with st.expander("🎯 Optimize Selection for Budget", expanded=False):
+            opt_platforms = sorted(set(i.platform for i in filtered if i.platform))
+            opt_cols = st.columns(len(opt_platforms) + 1)
+            with opt_cols[0]:
+                total_budget = st.number_input(
+                    "Total budget (USD)", min_value=0, value=int(budget_range[1]), step=500,
+                    help="Candidates without a price estimate are not considered",
+                )
+            quotas = {}
+            for col, platform in zip(opt_cols[1:], opt_platforms):
+                with col:
+                    cap = st.number_input(f"Max {platform}", min_value=0, value=0, step=1,
+                                          help="0 = no limit", key=f"quota_{platform}")
+                    quotas[platform] = cap or None
+            if st.button("Optimize Selection", disabled=total_budget <= 0):
+                from utils.ranking import CandidateSnapshot
+                from utils.shortlist import optimize_shortlist
+                from database import set_confirmed
+                chosen = optimize_shortlist(CandidateSnapshot.from_rows(filtered), total_budget, quotas)
+                set_confirmed(db, [i.id for i in filtered], chosen)
+                db.commit()
+                st.session_state.pop("main_table", None)  # drop stale checkbox edits
+                picked = [i for i in filtered if i.id in set(chosen)]
+                spend = sum(((i.price_min or 0) + (i.price_max or 0)) / 2 for i in picked)
+                st.toast(f"Selected {len(picked)} candidates (est. ${spend:,.0f} of ${total_budget:,})")
+                st.rerun()
     else:
         st.info("No candidates match the current filters. Try lowering the fit score range.")
 
@@ -485,10 +618,7 @@ with get_db() as db:
     # STEP 2: Preview Emails
     # ================================================================
     # Show drafts from all confirmed candidates (not just current batch)
-    all_with_drafts = db.query(Influencer).filter(
-        Influencer.email_draft != None
-    ).order_by(Influencer.fit_score.desc()).all()
-    drafts = [(inf.id, inf.name, inf.platform) for inf in all_with_drafts]
+    drafts = cached_read("draft_options")
 
     if drafts:
         st.markdown("---")
@@ -500,12 +630,12 @@ with get_db() as db:
             label_visibility="collapsed"
         )
         selected_id = int(selected_name.split("ID:")[1].rstrip(")"))
-        selected_inf = db.query(Influencer).filter_by(id=selected_id).first()
+        selected_draft = cached_read("email_draft", selected_id)  # only the selected body is read
 
-        if selected_inf and selected_inf.email_draft:
+        if selected_draft:
             edited_draft = st.text_area(
                 "Email content (editable)",
-                selected_inf.email_draft,
+                selected_draft,
                 height=250,
                 key=f"draft_{selected_id}",
                 label_visibility="collapsed"
@@ -514,7 +644,8 @@ with get_db() as db:
             btn_col1, btn_col2, btn_col3 = st.columns(3)
             with btn_col1:
                 if st.button("💾 Save Draft", key="save_draft"):
-                    selected_inf.email_draft = edited_draft
+                    from read_models import save_email_draft
+                    save_email_draft(db, selected_id, edited_draft)
                     db.commit()
                     st.toast("Draft saved")
             with btn_col2:
@@ -524,17 +655,15 @@ with get_db() as db:
                         st.error("Email generation limit reached for this session.")
                     else:
                         try:
-                            writer = WriterAgent()
-                            async def _regen_single():
-                                await writer.write_draft(
+                            writer = get_writer_agent()
+                            with tracing.Trace("regenerate_email", influencer_id=selected_id):
+                                asyncio.run(writer.regenerate(
                                     brand_req or "Brand partnership",
-                                    selected_inf,
+                                    selected_id,
                                     brand_name=brand_name,
                                     brand_website=brand_website
-                                )
-                            asyncio.run(_regen_single())
+                                ))
                             st.session_state.email_gen_count += 1
-                            db.commit()
                             st.rerun()
                         except Exception as e:
                             st.error(f"Regeneration failed: {e}")
@@ -549,9 +678,10 @@ with get_db() as db:
     export_col1, export_col2 = st.columns(2)
 
     # Export all candidates (across all batches)
-    all_for_export = db.query(Influencer).order_by(Influencer.fit_score.desc()).all()
+    all_for_export = cached_read("export_rows")
 
     with export_col1:
+        import pandas as pd
         export_data = []
         for inf in all_for_export:
             export_data.append({
@@ -573,18 +703,20 @@ with get_db() as db:
         )
 
     with export_col2:
-        confirmed_drafts = [
-            f"To: {inf.name}\nPlatform: {inf.platform}\nURL: {inf.url}\n\n{inf.email_draft}\n\n{'='*50}\n"
-            for inf in all_for_export
-            if inf.is_confirmed and inf.email_draft
+        email_exports = [
+            f"To: {name}\nPlatform: {platform}\nURL: {url}\n\n{draft}\n\n{'='*50}\n"
+            for name, platform, url, draft in cached_read("confirmed_drafts")
         ]
-        if confirmed_drafts:
+        if email_exports:
             st.download_button(
-                f"✉️ Download Emails ({len(confirmed_drafts)})",
-                "\n".join(confirmed_drafts),
+                f"✉️ Download Emails ({len(email_exports)})",
+                "\n".join(email_exports),
                 "email_drafts.txt", "text/plain",
                 use_container_width=True,
             )
         else:
             st.button("Download Emails", disabled=True, use_container_width=True,
                        help="Confirm candidates and generate emails first")
+
+startup.mark("first_render")
+startup.log_report_once()
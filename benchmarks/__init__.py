@@ -0,0 +1 @@
+"""离线基准测试：外部 API 的本地替身（fakes）与端到端运行器（run）。"""
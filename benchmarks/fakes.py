@@ -0,0 +1,356 @@
+"""
+离线基准测试用的本地替身：Gemini、Custom Search、YouTube Data API、Instagram Graph、TikTok Research。
+
+替身通过 utils.registry.override 注入（gemini_client / search_service / youtube_service / http_transport），
+agent 和 provider 的代码路径与线上完全一致，只是请求不出进程。每类 API 的行为由 FakeProfile 控制：
+- latency_ms / jitter：对数正态分布的延迟（中位数 latency_ms，jitter 越大长尾越重）
+- error_rate：请求失败的概率（googleapiclient 风格的异常 / urllib HTTPError）
+- payload：返回内容的规模倍数（搜索摘要、简介、评分理由、邮件正文的长度，最近作品数）
+
+响应内容由 seed 决定，可重复运行；创作者从固定大小的池中抽取，多次查询会出现真实的重复。
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+from types import SimpleNamespace
+from typing import Dict, NamedTuple, Optional
+
+
+class FakeProfile(NamedTuple):
+    latency_ms: float = 50.0
+    jitter: float = 0.5
+    error_rate: float = 0.0
+    payload: int = 1
+
+
+class FakeAPIError(Exception):
+    pass
+
+
+class _Behavior:
+    """按 FakeProfile 模拟延迟和失败；线程安全（调用在线程池中并发执行）。"""
+
+    def __init__(self, name: str, profile: FakeProfile, seed: int):
+        self.name = name
+        self.profile = profile
+        self._rng = random.Random(f"{seed}:{name}")
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def rng(self) -> random.Random:
+        return self._rng
+
+    def simulate(self, endpoint: str) -> None:
+        with self._lock:
+            self.calls += 1
+            delay = 0.0
+            if self.profile.latency_ms > 0:
+                delay = self.profile.latency_ms / 1000 * math.exp(self._rng.gauss(0, self.profile.jitter))
+            fail = self._rng.random() < self.profile.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeAPIError(f"{endpoint}: simulated error")
+
+    def text(self, words: int) -> str:
+        with self._lock:
+            return " ".join(self._rng.choice(_WORDS) for _ in range(words * self.profile.payload))
+
+
+_WORDS = (
+    "pet", "dog", "cat", "review", "vlog", "haul", "unboxing", "tutorial", "daily", "life", "gym", "beauty",
+    "travel", "food", "tech", "budget", "family", "kids", "garden", "home", "style", "fitness", "story",
+)
+
+
+class _Request:
+    def __init__(self, behavior: _Behavior, endpoint: str, fn):
+        self._behavior = behavior
+        self._endpoint = endpoint
+        self._fn = fn
+
+    def execute(self):
+        self._behavior.simulate(self._endpoint)
+        return self._fn()
+
+
+def _creator(rng: random.Random, pool: int) -> str:
+    return f"creator{rng.randrange(pool)}"
+
+
+# ======================== Gemini ========================
+
+_FILTER_RE = re.compile(r"Every query MUST start with exactly: (\S+)")
+_CANDIDATE_RE = re.compile(r"^ID: (\d+)", re.MULTILINE)
+
+
+class _FakeModels:
+    def __init__(self, behavior: _Behavior):
+        self._b = behavior
+
+    def generate_content(self, model: str, contents: str, config: Optional[dict] = None):
+        self._b.simulate(f"gemini:{model}")
+        if "search specialist" in contents:
+            site = _FILTER_RE.search(contents)
+            site = site.group(1) if site else ""
+            text = json.dumps([
+                {"angle": i, "query": f"{site} {self._b.text(2)}"} for i in range(1, 6)
+            ])
+        elif _CANDIDATE_RE.search(contents):
+            rng = self._b.rng()
+            text = json.dumps([
+                {
+                    "id": int(idx),
+                    "fit_score": rng.randint(1, 100),
+                    "fit_reason": self._b.text(8),
+                    "price_min": 100,
+                    "price_max": 400,
+                }
+                for idx in _CANDIDATE_RE.findall(contents)
+            ])
+        else:
+            text = "Subject: Partnership idea\n\n" + self._b.text(90)
+        prompt_tokens = len(contents) // 4
+        output_tokens = len(text) // 4
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_tokens,
+                cached_content_token_count=0,
+                candidates_token_count=output_tokens,
+                total_token_count=prompt_tokens + output_tokens,
+            ),
+        )
+
+
+class FakeGeminiClient:
+    def __init__(self, profile: FakeProfile, seed: int = 0):
+        self.behavior = _Behavior("gemini", profile, seed)
+        self.models = _FakeModels(self.behavior)
+
+
+# ======================== Custom Search ========================
+
+_SITE_LINKS = {
+    "youtube.com": "https://www.youtube.com/@{name}",
+    "instagram.com": "https://www.instagram.com/{name}/",
+    "tiktok.com": "https://www.tiktok.com/@{name}",
+}
+
+
+class FakeSearchService:
+    """cse().list(q, cx, num, start)：按查询里的 site: 过滤生成对应平台的主页链接。"""
+
+    def __init__(self, profile: FakeProfile, seed: int = 0, creators: int = 2000):
+        self.behavior = _Behavior("custom_search", profile, seed)
+        self.creators = creators
+
+    def cse(self):
+        return self
+
+    def list(self, q: str, cx: str = "", num: int = 10, start: int = 1):
+        def respond():
+            rng = self.behavior.rng()
+            template = next((t for site, t in _SITE_LINKS.items() if site in q), _SITE_LINKS["youtube.com"])
+            items = [
+                {
+                    "link": template.format(name=_creator(rng, self.creators)),
+                    "title": self.behavior.text(3),
+                    "snippet": self.behavior.text(25),
+                }
+                for _ in range(num)
+            ]
+            queries = {"nextPage": [{"startIndex": start + num}]} if start + num <= 100 else {}
+            return {"items": items, "queries": queries}
+        return _Request(self.behavior, "cse.list", respond)
+
+
+# ======================== YouTube Data API ========================
+
+def _channel_item(channel_id: str, title: str, rng: random.Random) -> dict:
+    return {
+        "id": channel_id,
+        "snippet": {"title": title},
+        "statistics": {"subscriberCount": str(rng.randint(1_000, 2_000_000))},
+        "contentDetails": {"relatedPlaylists": {"uploads": "UU" + channel_id[2:]}},
+    }
+
+
+class _FakeYouTubeResource:
+    def __init__(self, service: "FakeYouTubeService", kind: str):
+        self._service = service
+        self._kind = kind
+
+    def list(self, **kwargs):
+        return _Request(self._service.behavior, f"youtube.{self._kind}.list",
+                        lambda: getattr(self._service, f"_{self._kind}")(**kwargs))
+
+
+class FakeYouTubeService:
+    def __init__(self, profile: FakeProfile, seed: int = 0):
+        self.behavior = _Behavior("youtube_data", profile, seed)
+
+    def channels(self):
+        return _FakeYouTubeResource(self, "channels")
+
+    def search(self):
+        return _FakeYouTubeResource(self, "search")
+
+    def playlistItems(self):
+        return _FakeYouTubeResource(self, "playlistItems")
+
+    def videos(self):
+        return _FakeYouTubeResource(self, "videos")
+
+    def _channels(self, part: str = "", **kwargs) -> dict:
+        rng = self.behavior.rng()
+        if "forHandle" in kwargs or "forUsername" in kwargs:
+            name = kwargs.get("forHandle") or kwargs.get("forUsername")
+            return {"items": [_channel_item(f"UC{name.lower()}", name, rng)]}
+        ids = kwargs.get("id", "").split(",")
+        return {"items": [_channel_item(cid, cid[2:], rng) for cid in ids if cid]}
+
+    def _search(self, q: str = "", **kwargs) -> dict:
+        name = q.rstrip("/").rsplit("/", 1)[-1].lstrip("@") or "unknown"
+        return {"items": [{"id": {"channelId": f"UC{name.lower()}"}, "snippet": {"title": name}}]}
+
+    def _playlistItems(self, playlistId: str = "", maxResults: int = 10, **kwargs) -> dict:
+        return {"items": [
+            {"contentDetails": {"videoId": f"{playlistId}-{i}"}}
+            for i in range(min(maxResults, 5 * self.behavior.profile.payload))
+        ]}
+
+    def _videos(self, id: str = "", **kwargs) -> dict:
+        rng = self.behavior.rng()
+        return {"items": [
+            {"id": vid, "statistics": {
+                "likeCount": str(rng.randint(0, 5000)),
+                "commentCount": str(rng.randint(0, 500)),
+                "viewCount": str(rng.randint(1000, 200000)),
+            }}
+            for vid in id.split(",") if vid
+        ]}
+
+
+# ======================== urllib 传输层（Instagram Graph / TikTok Research） ========================
+
+class FakeResponse:
+    def __init__(self, payload, headers: Optional[Dict[str, str]] = None):
+        self._body = json.dumps(payload).encode()
+        self.headers = headers or {}
+
+    def read(self) -> bytes:
+        return self._body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_USERNAME_RE = re.compile(r"business_discovery\.username\(([^)]+)\)")
+
+
+class FakeTransport:
+    """替代 urllib.request.urlopen（见 utils.transport），按 URL 路由到 Graph / TikTok 的假响应。"""
+
+    def __init__(self, graph: FakeProfile, tiktok: FakeProfile, seed: int = 0):
+        self.graph = _Behavior("instagram_graph", graph, seed)
+        self.tiktok = _Behavior("tiktok", tiktok, seed)
+
+    def __call__(self, request, timeout: float = None):
+        url = request.full_url
+        behavior = self.tiktok if "tiktokapis.com" in url else self.graph
+        try:
+            behavior.simulate(url.split("?")[0])
+        except FakeAPIError as e:
+            raise urllib.error.HTTPError(url, 500, str(e), {}, None)
+        if "tiktokapis.com" in url:
+            if "/oauth/token/" in url:
+                return FakeResponse({"access_token": "bench-token", "expires_in": 7200})
+            return FakeResponse(self._tiktok_user(json.loads(request.data or b"{}").get("username", "")))
+        if "/oauth/access_token" in url:
+            return FakeResponse({"access_token": "bench-token", "expires_in": 60 * 24 * 3600})
+        if request.data:  # Graph batch POST
+            form = urllib.parse.parse_qs(request.data.decode())
+            batch = json.loads(form["batch"][0])
+            responses = []
+            for sub in batch:
+                m = _USERNAME_RE.search(sub["relative_url"])
+                body = {"business_discovery": self._business_discovery(m.group(1) if m else "")}
+                responses.append({"code": 200, "body": json.dumps(body)})
+            return FakeResponse(responses, {"X-App-Usage": json.dumps({"call_count": 10})})
+        m = _USERNAME_RE.search(urllib.parse.unquote(url))
+        return FakeResponse({"business_discovery": self._business_discovery(m.group(1) if m else "")})
+
+    def _business_discovery(self, username: str) -> dict:
+        rng = self.graph.rng()
+        followers = rng.randint(1_000, 1_000_000)
+        return {
+            "username": username,
+            "name": username,
+            "followers_count": followers,
+            "media_count": rng.randint(10, 2000),
+            "biography": self.graph.text(20),
+            "media": {"data": [
+                {"like_count": rng.randint(0, followers // 10), "comments_count": rng.randint(0, 500)}
+                for _ in range(5 * self.graph.profile.payload)
+            ]},
+        }
+
+    def _tiktok_user(self, username: str) -> dict:
+        rng = self.tiktok.rng()
+        return {
+            "error": {"code": "ok"},
+            "data": {
+                "display_name": username,
+                "bio_description": self.tiktok.text(20),
+                "follower_count": rng.randint(1_000, 5_000_000),
+                "likes_count": rng.randint(10_000, 50_000_000),
+                "video_count": rng.randint(10, 1000),
+            },
+        }
+
+
+# ======================== 注入 ========================
+
+DEFAULT_PROFILES = {
+    "gemini": FakeProfile(latency_ms=600, jitter=0.4),
+    "custom_search": FakeProfile(latency_ms=250, jitter=0.3),
+    "youtube_data": FakeProfile(latency_ms=120, jitter=0.3),
+    "instagram_graph": FakeProfile(latency_ms=300, jitter=0.4),
+    "tiktok": FakeProfile(latency_ms=200, jitter=0.4),
+}
+
+FAKE_ENV = {
+    "GEMINI_API_KEY": "bench",
+    "GOOGLE_API_KEY": "bench",
+    "SEARCH_ENGINE_ID": "bench",
+    "INSTAGRAM_ACCESS_TOKEN": "bench",
+    "INSTAGRAM_USER_ID": "17841400000000000",
+    "TIKTOK_CLIENT_KEY": "bench",
+    "TIKTOK_CLIENT_SECRET": "bench",
+}
+
+
+def install(profiles: Optional[Dict[str, FakeProfile]] = None, seed: int = 0, creators: int = 2000) -> dict:
+    """把所有外部依赖替换为本地替身；返回 {api: fake}，可读取各自的 behavior.calls。"""
+    from utils import registry
+    profiles = {**DEFAULT_PROFILES, **(profiles or {})}
+    fakes = {
+        "gemini": FakeGeminiClient(profiles["gemini"], seed),
+        "custom_search": FakeSearchService(profiles["custom_search"], seed, creators),
+        "youtube_data": FakeYouTubeService(profiles["youtube_data"], seed),
+        "transport": FakeTransport(profiles["instagram_graph"], profiles["tiktok"], seed),
+    }
+    registry.override("gemini_client", fakes["gemini"])
+    registry.override("search_service", fakes["custom_search"])
+    registry.override("youtube_service", fakes["youtube_data"])
+    registry.override("http_transport", fakes["transport"])
+    return fakes
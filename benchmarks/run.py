@@ -0,0 +1,222 @@
+"""
+离线基准测试：用 benchmarks.fakes 的本地替身端到端运行 Scout / Analyst / Writer，
+报告每次运行的耗时和吞吐量，以及各阶段 / 各外部调用的延迟分位数（来自 utils.tracing 的 span）。
+
+不需要任何 API 凭证，也不访问网络；数据库是临时目录中的独立 SQLite 文件（--db 可指定）。
+
+命令行：
+    python -m benchmarks.run [scout|analyst|writer|all] [--repeat 3] [--candidates 100]
+        [--platforms YouTube,Instagram,TikTok] [--latency-scale 1.0] [--jitter 0.4]
+        [--error-rate 0.0] [--payload 1] [--seed 0] [--json results.json]
+        [--record cassette.jsonl.gz | --replay cassette.jsonl.gz [--timing original|zero]]
+
+--latency-scale 0 去掉所有模拟延迟，只测 CPU / 数据库开销。
+--record 把替身的请求 / 响应录制成 cassette；--replay 改用录制的 cassette（如生产环境用
+CASSETTE_MODE=record 录下的真实响应）代替替身，见 utils.cassette。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+SCENARIOS = ("scout", "analyst", "writer")
+BRAND = "Eco-friendly dog toys for young pet owners in the US"
+BUDGET = (500, 5000)
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def _setup_env(db_path: str) -> None:
+    """必须在导入 config / database 之前调用。"""
+    from benchmarks.fakes import FAKE_ENV
+    os.environ.update(FAKE_ENV)
+    os.environ["DB_PATH"] = db_path
+    os.environ["TRACE_FILE"] = ""   # span 只在内存中汇总，不导出
+
+
+def _reset_state() -> None:
+    """每次运行前清空数据和进程内缓存，让每次运行都是冷启动。"""
+    from database import get_db
+    from sqlalchemy import text
+    from utils import cassette, engagement, resilience, youtube_utils
+    with get_db() as db:
+        for table in ("api_usage", "youtube_channels", "influencers", "query_stats", "search_batches"):
+            db.execute(text(f"DELETE FROM {table}"))
+        db.commit()
+    youtube_utils._stats_cache.clear()
+    engagement._cache = engagement.TTLCache(engagement._cache.ttl)
+    resilience._trackers.clear()
+    if cassette.active() is not None:
+        cassette.active().rewind()
+
+
+def _seed_candidates(n: int, confirmed: bool = False) -> None:
+    from database import get_db, Influencer
+    platforms = ("YouTube", "Instagram", "TikTok")
+    with get_db() as db:
+        db.add_all(
+            Influencer(
+                name=f"creator{i}",
+                platform=platforms[i % 3],
+                url=f"https://example.com/creator{i}",
+                follower_count=1000 * (i + 1),
+                followers_verified=True,
+                tags="pet lifestyle reviews and daily vlogs " * 4,
+                fit_score=70 if confirmed else None,
+                fit_reason="Pet niche, strong audience alignment" if confirmed else None,
+                is_confirmed=confirmed,
+            )
+            for i in range(n)
+        )
+        db.commit()
+
+
+async def _scout(args) -> int:
+    from agents.scout import ScoutAgent
+    new_count, _ = await ScoutAgent(platforms=args.platforms).run(BRAND, brand_name="Bench")
+    return new_count
+
+
+async def _analyst(args) -> int:
+    from agents.analyst import AnalystAgent
+    await AnalystAgent().run(BRAND, budget_range=BUDGET)
+    return args.candidates
+
+
+async def _writer(args) -> int:
+    from agents.writer import WriterAgent
+    await WriterAgent().run(BRAND, brand_name="Bench")
+    return args.candidates
+
+
+_RUNNERS = {"scout": _scout, "analyst": _analyst, "writer": _writer}
+
+
+def run_scenario(name: str, args) -> dict:
+    from utils import tracing, usage
+    walls, items = [], []
+    spans: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    for _ in range(args.repeat):
+        _reset_state()
+        if name == "analyst":
+            _seed_candidates(args.candidates)
+        elif name == "writer":
+            _seed_candidates(args.candidates, confirmed=True)
+        trace = tracing.Trace(f"bench:{name}")
+        start = time.perf_counter()
+        with trace, usage.scope():
+            count = asyncio.run(_RUNNERS[name](args))
+        walls.append(time.perf_counter() - start)
+        items.append(count)
+        for s in trace.spans:
+            if s is not trace.root:
+                spans[s.name].append(s.duration)
+                errors[s.name] += 1 if s.error else 0
+
+    return {
+        "scenario": name,
+        "runs": len(walls),
+        "wall_p50": percentile(walls, 50),
+        "wall_max": max(walls),
+        "items": sum(items) / len(items),
+        "throughput": sum(items) / sum(walls) if sum(walls) else 0.0,
+        "spans": {
+            span_name: {
+                "count": len(durations),
+                "errors": errors[span_name],
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "p99": percentile(durations, 99),
+                "max": max(durations),
+            }
+            for span_name, durations in spans.items()
+        },
+    }
+
+
+def format_result(result: dict) -> str:
+    lines = [
+        f"== {result['scenario']}: {result['runs']} run(s), wall p50 {result['wall_p50']:.2f}s "
+        f"(max {result['wall_max']:.2f}s), {result['items']:.0f} items/run, {result['throughput']:.1f} items/s",
+        f"  {'span':<34} {'count':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+    ]
+    for name, s in sorted(result["spans"].items(), key=lambda kv: -kv[1]["p95"]):
+        lines.append(
+            f"  {name:<34} {s['count']:>6} {s['errors']:>4} {s['p50'] * 1000:>9.1f} "
+            f"{s['p95'] * 1000:>9.1f} {s['p99'] * 1000:>9.1f} {s['max'] * 1000:>9.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None) -> List[dict]:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Offline agent benchmarks")
+    parser.add_argument("scenario", nargs="?", default="all", choices=SCENARIOS + ("all",))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=100, help="seeded rows for analyst / writer")
+    parser.add_argument("--platforms", default="YouTube,Instagram,TikTok")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier on default fake latencies")
+    parser.add_argument("--jitter", type=float, default=None, help="lognormal sigma for all fakes")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--payload", type=int, default=1, help="response size multiplier")
+    parser.add_argument("--creators", type=int, default=2000, help="size of the fake creator pool")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default=None, help="SQLite file (default: a temporary file)")
+    parser.add_argument("--json", default=None, help="also write results to this file")
+    tape = parser.add_mutually_exclusive_group()
+    tape.add_argument("--record", default=None, help="record the fakes' traffic to this cassette")
+    tape.add_argument("--replay", default=None, help="serve API calls from this cassette instead of fakes")
+    parser.add_argument("--timing", default="original", choices=("original", "zero"), help="replay latency")
+    args = parser.parse_args(argv)
+    args.platforms = [p.strip() for p in args.platforms.split(",") if p.strip()]
+
+    _setup_env(args.db or os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db"))
+    from benchmarks.fakes import DEFAULT_PROFILES, install
+    profiles = {
+        api: profile._replace(
+            latency_ms=profile.latency_ms * args.latency_scale,
+            jitter=profile.jitter if args.jitter is None else args.jitter,
+            error_rate=args.error_rate,
+            payload=args.payload,
+        )
+        for api, profile in DEFAULT_PROFILES.items()
+    }
+    from utils import cassette
+    if args.replay:
+        cassette.install(cassette.Cassette(args.replay, "replay", args.timing))
+    else:
+        fakes = install(profiles, seed=args.seed, creators=args.creators)
+        if args.record:
+            cassette.install(cassette.Cassette(args.record, "record"), {
+                "gemini_client": fakes["gemini"],
+                "search_service": fakes["custom_search"],
+                "youtube_service": fakes["youtube_data"],
+                "http_transport": fakes["transport"],
+            })
+
+    results = []
+    for name in (SCENARIOS if args.scenario == "all" else (args.scenario,)):
+        result = run_scenario(name, args)
+        results.append(result)
+        print(format_result(result), flush=True)
+
+    if args.record:
+        cassette.active().flush()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -1,31 +1,82 @@
 # Centralized configuration
 import os
+import sys
 from dotenv import load_dotenv
 
 # 1. Load .env (local dev)
 load_dotenv()
 
 # 2. Streamlit Cloud secrets → inject into env vars (deployment)
-try:
-    import streamlit as st
-    for key, val in st.secrets.items():
-        if isinstance(val, str) and key not in os.environ:
-            os.environ[key] = val
-except Exception:
-    pass
+#    Only when running under Streamlit (already imported by app.py) — scripts and
+#    benchmarks importing config should not pay for importing streamlit.
+if "streamlit" in sys.modules:
+    try:
+        import streamlit as st
+        for key, val in st.secrets.items():
+            if isinstance(val, str) and key not in os.environ:
+                os.environ[key] = val
+    except Exception:
+        pass
 
 # Agent config
 BATCH_SIZE = 5
+STREAM_CHUNK_SIZE = 25          # scout saves + hands off candidates to the analyst in chunks of this size
 FIT_SCORE_THRESHOLD = 60
 TOP_PICK_THRESHOLD = 80
 EMAIL_WORD_LIMIT = 120
 
+# Model routing: Gemini model per task (env MODEL_<TASK> overrides). Scoring runs on the fast tier first;
+# borderline scores (within ESCALATION_MARGIN of FIT_SCORE_THRESHOLD / TOP_PICK_THRESHOLD) are re-scored
+# by the escalation model.
+DEFAULT_MODEL = "gemini-2.0-flash"
+MODEL_ROUTES = {
+    "query_generation": os.getenv("MODEL_QUERY_GENERATION", "gemini-2.0-flash-lite"),
+    "scoring": os.getenv("MODEL_SCORING", "gemini-2.0-flash-lite"),
+    "scoring_escalation": os.getenv("MODEL_SCORING_ESCALATION", DEFAULT_MODEL),
+    "email": os.getenv("MODEL_EMAIL", DEFAULT_MODEL),
+}
+ESCALATION_MARGIN = 10
+
 # API concurrency
 MAX_CONCURRENT_API = 3          # reduced for Streamlit Cloud memory limits
 SEARCH_RESULTS_PER_QUERY = 10
+SEARCH_MAX_PAGES = 3            # max result pages per query (each page = 1 Custom Search quota unit)
+SEARCH_MIN_NEW_RATIO = 0.3      # stop paging once < 30% of a page are new creators
 QUERIES_PER_PLATFORM = 5        # balanced for coverage vs memory
 MAX_RETRIES = 3
 
+# Deadlines and hedged requests (see utils/resilience.py)
+LLM_CALL_TIMEOUT = 60           # seconds per Gemini call
+SEARCH_CALL_TIMEOUT = 15        # seconds per Custom Search page
+STATS_CALL_TIMEOUT = 30         # seconds per provider stats request / batch (not per platform)
+RUN_DEADLINE_SECONDS = 300      # whole search + score run; partial results are kept when it expires
+HEDGE_ENABLED = os.getenv("HEDGE_REQUESTS", "1") == "1"
+HEDGE_PERCENTILE = 95           # duplicate an idempotent call once it is slower than this percentile
+HEDGE_MIN_SAMPLES = 20          # latency samples needed before hedging starts
+
+# Tracing (see utils/tracing.py): per-stage spans exported as JSONL, one span per line
+TRACING_ENABLED = os.getenv("TRACING", "1") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", "data/traces.jsonl")
+
+# Record / replay of outbound API calls (see utils/cassette.py)
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")         # off | record | replay
+CASSETTE_FILE = os.getenv("CASSETTE_FILE", "data/cassettes/default.jsonl.gz")
+CASSETTE_TIMING = os.getenv("CASSETTE_TIMING", "original")  # replay: original latency | zero
+
+# Daily API quotas, shown against today's usage from the ledger (see utils/usage.py)
+DAILY_QUOTAS = {
+    "custom_search": int(os.getenv("CSE_DAILY_QUOTA", "100")),        # queries / day (free tier)
+    "youtube_data": int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000")),   # units / day
+}
+
+# Engagement rate from recent posts
+ENGAGEMENT_RECENT_POSTS = 10        # last N videos / media per creator
+ENGAGEMENT_CACHE_TTL = 6 * 3600     # seconds
+
+# YouTube channel resolution (see utils/youtube_utils.py)
+YOUTUBE_SEARCH_UNIT_BUDGET = 500    # per run: search.list costs 100 units, so at most 5 search fallbacks
+YOUTUBE_NEGATIVE_TTL = 7 * 24 * 3600    # seconds before a failed resolution is retried
+
 # Supported platforms
 SUPPORTED_PLATFORMS = ["YouTube", "Instagram", "TikTok"]
 DEFAULT_PLATFORMS = ["YouTube"]
@@ -44,6 +95,23 @@ GLOBAL_URL_BLACKLIST = [
     '/watch?', '/live/', '/community', '/membership',
 ]
 
+# Per-platform URL rules (substring match, case-insensitive)
+# - allow: if non-empty, a URL must contain one of these to be accepted for that platform
+# - deny:  URLs containing any of these are rejected for that platform
+# - deny_handles: path segments that look like handles but are not profiles
+# Extra rules / blacklist entries can be added without code changes via a JSON file
+# at URL_RULES_FILE: {"blacklist": [...], "platforms": {"TikTok": {"deny": [...]}}}
+URL_RULES = {
+    "YouTube": {"allow": [], "deny": [], "deny_handles": []},
+    "Instagram": {
+        "allow": [],
+        "deny": [],
+        "deny_handles": ['p', 'reel', 'reels', 'explore', 'stories', 'accounts', 'about', 'directory', 'tv'],
+    },
+    "TikTok": {"allow": [], "deny": [], "deny_handles": []},
+}
+URL_RULES_FILE = os.getenv("URL_RULES_FILE", "data/url_rules.json")
+
 # Rate limiting (demo protection)
 MAX_SEARCHES_PER_SESSION = 3    # max searches per user session
 SEARCH_COOLDOWN_SECONDS = 60    # min interval between searches
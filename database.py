@@ -1,13 +1,12 @@
 from contextlib import contextmanager
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text, Boolean, DateTime, Index, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import create_engine, inspect, text, update, case, Column, Integer, String, Float, Text, Boolean, DateTime, Index, ForeignKey
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, deferred
 from datetime import datetime
 import os
+import threading
+from utils import data_version
 
-if not os.path.exists('data'):
-    os.makedirs('data')
-
-DB_PATH = "data/memory.db"
+DB_PATH = os.getenv("DB_PATH", "data/memory.db")
 engine = create_engine(
     f"sqlite:///{DB_PATH}?check_same_thread=False",
     pool_pre_ping=True,
@@ -29,6 +28,65 @@ class SearchBatch(Base):
     influencers = relationship("Influencer", back_populates="batch")
 
 
+class QueryStat(Base):
+    """单条搜索查询的产出记录 — 供 QueryScheduler 按历史产出排序 / 剪枝查询"""
+    __tablename__ = 'query_stats'
+
+    id = Column(Integer, primary_key=True)
+    batch_id = Column(Integer, ForeignKey('search_batches.id'))
+    brand_requirement = Column(Text)
+    platform = Column(String)
+    query = Column(String)
+    angle = Column(Integer)             # generate_queries 提示词中的角度编号 (1-5)
+    raw_hits = Column(Integer, default=0)       # 搜索返回的结果数（含翻页）
+    filtered_hits = Column(Integer, default=0)  # 通过黑名单 / 平台规则的结果数
+    new_creators = Column(Integer, default=0)   # 本次运行中首次出现的创作者数
+    avg_fit_score = Column(Float)       # 该查询发现的创作者的平均 fit_score（评分后回填）
+    pages = Column(Integer, default=0)          # 成功取回的结果页数
+    failed = Column(Boolean, default=False)     # 第一页就失败 / 无搜索服务（配额 / 网络 / 截止时间），产出不代表查询本身
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_query_stats_platform', 'platform'),
+        Index('ix_query_stats_query', 'query'),
+    )
+
+
+class ApiUsage(Base):
+    """外部 API 调用台账 — 每次请求一行（见 utils/usage.py），按批次 / 按天汇总配额和 token 消耗"""
+    __tablename__ = 'api_usage'
+
+    id = Column(Integer, primary_key=True)
+    batch_id = Column(Integer, ForeignKey('search_batches.id'))  # 不属于搜索批次的调用（如生成邮件）为空
+    api = Column(String)                # 配额池: "custom_search" / "youtube_data" / "gemini" / ...
+    endpoint = Column(String)           # "cse.list" / "youtube.search.list" / "gemini:<model>" / ...
+    units = Column(Integer, default=1)  # 消耗的配额单位（YouTube search.list = 100，对冲请求按发出次数计）
+    prompt_tokens = Column(Integer)     # Gemini usage_metadata
+    cached_tokens = Column(Integer)
+    output_tokens = Column(Integer)
+    total_tokens = Column(Integer)
+    latency_ms = Column(Integer)
+    ok = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_api_usage_batch_id', 'batch_id'),
+        Index('ix_api_usage_created_at', 'created_at'),
+    )
+
+
+class YouTubeChannel(Base):
+    """YouTube URL 标识 → channelId 的持久映射（含解析失败的负缓存），避免重复花 100 单位的 search.list"""
+    __tablename__ = 'youtube_channels'
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String, unique=True)   # "@handle" / "c/name" / "user/name"（小写），无标识时为 URL
+    channel_id = Column(String)         # 为空表示解析失败（负缓存，YOUTUBE_NEGATIVE_TTL 后重试）
+    resolved_via = Column(String)       # "forHandle" / "forUsername" / "search"
+    failures = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
 class Influencer(Base):
     __tablename__ = 'influencers'
 
@@ -38,24 +96,27 @@ class Influencer(Base):
     platform = Column(String)
     platform_handle = Column(String)
     url = Column(String, unique=True)
+    creator_key = Column(String)  # "platform:handle"，跨 URL 写法的身份去重键（见 utils.url_classifier）
     follower_count = Column(Integer, default=0)
     followers_verified = Column(Boolean, default=False)  # 粉丝数是否经过 API 验证
     engagement_rate = Column(Float)
-    tags = Column(String)
+    tags = deferred(Column(String))  # 大文本列延迟加载：列表查询不读取，需要时 undefer（见 read_models.py）
     niche = Column(String)
     language = Column(String)
 
     fit_score = Column(Integer)
-    fit_reason = Column(Text)
+    fit_reason = deferred(Column(Text))
     price_min = Column(Float)
     price_max = Column(Float)
 
-    email_draft = Column(Text)
+    email_draft = deferred(Column(Text))
     is_confirmed = Column(Boolean, default=False)
     error_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    query_id = Column(Integer, ForeignKey('query_stats.id'))  # 发现该创作者的搜索查询
+
     batch = relationship("SearchBatch", back_populates="influencers")
 
     __table_args__ = (
@@ -63,17 +124,121 @@ class Influencer(Base):
         Index('ix_fit_score', 'fit_score'),
         Index('ix_is_confirmed', 'is_confirmed'),
         Index('ix_batch_id', 'batch_id'),
+        Index('ux_creator_key', 'creator_key', unique=True),
     )
 
 
-Base.metadata.create_all(engine)
 SessionLocal = sessionmaker(bind=engine)
+data_version.install(SessionLocal)  # 提交后递增数据版本号，UI 读缓存据此失效
+
+# Schema 创建 + 迁移只在每个进程第一次访问数据库时执行一次（不在 import 时执行）
+_db_ready = False
+_db_init_lock = threading.Lock()
+
+
+def _migrate(conn):
+    """
+    轻量级增量迁移：create_all 不会修改已存在的表，
+    这里为旧数据库补齐模型中新增的列和索引（SQLite 只支持 ADD COLUMN）。
+    """
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+
+    # 数据回填必须在建唯一索引之前
+    _backfill_creator_keys(conn)
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _backfill_creator_keys(conn):
+    """为旧数据计算 creator_key；同一创作者的重复行保留最早一条的 key，其余留空。"""
+    rows = conn.execute(text(
+        "SELECT id, url FROM influencers WHERE creator_key IS NULL ORDER BY id"
+    )).fetchall()
+    if not rows:
+        return
+
+    from utils.url_classifier import get_classifier, creator_key
+    classifier = get_classifier()
+    taken = {r[0] for r in conn.execute(text(
+        "SELECT creator_key FROM influencers WHERE creator_key IS NOT NULL"
+    ))}
+    for row_id, url in rows:
+        key = creator_key(*classifier.parse(url or ""))
+        if key and key not in taken:
+            taken.add(key)
+            conn.execute(text("UPDATE influencers SET creator_key = :k WHERE id = :id"), {"k": key, "id": row_id})
+
+
+def init_db():
+    """创建表并执行迁移；多次调用安全，只有第一次生效。"""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_init_lock:
+        if _db_ready:
+            return
+        directory = os.path.dirname(DB_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            _migrate(conn)
+        _db_ready = True
 
 
 @contextmanager
 def get_db():
+    init_db()
     session = SessionLocal()
     try:
         yield session
     finally:
         session.close()
+
+
+def update_confirmed(db, changes) -> int:
+    """
+    changes: {influencer_id: is_confirmed}，只含有变化的行。
+    按新值分组，每组一条 UPDATE ... WHERE id IN (...)；返回受影响行数（调用方负责 commit）。
+    """
+    by_value = {}
+    for inf_id, confirmed in changes.items():
+        by_value.setdefault(bool(confirmed), []).append(int(inf_id))
+    updated = 0
+    for confirmed, ids in by_value.items():
+        result = db.execute(
+            update(Influencer)
+            .where(Influencer.id.in_(ids))
+            .values(is_confirmed=confirmed, updated_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        updated += result.rowcount
+    return updated
+
+
+def set_confirmed(db, scope_ids, chosen_ids) -> int:
+    """
+    一条 UPDATE 把 scope_ids 中属于 chosen_ids 的候选人设为已确认，其余取消确认。
+    返回受影响行数（调用方负责 commit）。
+    """
+    scope_ids = list(scope_ids)
+    if not scope_ids:
+        return 0
+    chosen_ids = list(chosen_ids)
+    result = db.execute(
+        update(Influencer)
+        .where(Influencer.id.in_(scope_ids))
+        .values(is_confirmed=case((Influencer.id.in_(chosen_ids), True), else_=False),
+                updated_at=datetime.now())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
@@ -0,0 +1,172 @@
+"""
+UI 读模型：按列投影的查询 + 轻量行元组。
+
+Streamlit 每次交互都会重跑 app.py。直接加载完整的 Influencer 对象会把
+tags / fit_reason / email_draft 这些大文本列连同 ORM 身份映射一起实例化。
+这里的查询只选取页面实际展示的列，结果转为 NamedTuple（无 __dict__）：
+- 候选人表格只读取展示列，理由在 SQL 里截断为预览
+- 邮件预览先列出 (id, name, platform)，正文只为当前选中的草稿读取
+- 导出时才读取完整理由，邮件正文只读取已确认且有草稿的行
+- API 用量台账按批次 / 按天在 SQL 里聚合，不加载明细行
+"""
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+from sqlalchemy import func, update
+from database import ApiUsage, Influencer, SearchBatch
+
+REASON_PREVIEW_CHARS = 50
+
+
+class CandidateRow(NamedTuple):
+    id: int
+    batch_id: Optional[int]
+    name: Optional[str]
+    platform: Optional[str]
+    url: Optional[str]
+    follower_count: Optional[int]
+    followers_verified: Optional[bool]
+    engagement_rate: Optional[float]
+    fit_score: Optional[int]
+    price_min: Optional[float]
+    price_max: Optional[float]
+    is_confirmed: Optional[bool]
+    has_draft: bool
+    reason_preview: Optional[str]
+
+
+_CANDIDATE_COLUMNS = (
+    Influencer.id, Influencer.batch_id, Influencer.name, Influencer.platform, Influencer.url,
+    Influencer.follower_count, Influencer.followers_verified, Influencer.engagement_rate,
+    Influencer.fit_score, Influencer.price_min, Influencer.price_max, Influencer.is_confirmed,
+    Influencer.email_draft.isnot(None),
+    func.substr(Influencer.fit_reason, 1, REASON_PREVIEW_CHARS),
+)
+
+
+class BatchRow(NamedTuple):
+    id: int
+    platforms: Optional[str]
+    candidate_count: Optional[int]
+    created_at: Optional[datetime]
+
+
+class ExportRow(NamedTuple):
+    id: int
+    name: Optional[str]
+    platform: Optional[str]
+    platform_handle: Optional[str]
+    url: Optional[str]
+    follower_count: Optional[int]
+    followers_verified: Optional[bool]
+    fit_score: Optional[int]
+    fit_reason: Optional[str]
+    price_min: Optional[float]
+    price_max: Optional[float]
+    is_confirmed: Optional[bool]
+
+
+class UsageRow(NamedTuple):
+    api: str
+    endpoint: str
+    calls: int
+    units: int
+    prompt_tokens: int
+    cached_tokens: int
+    output_tokens: int
+    avg_latency_ms: float
+    errors: int
+
+
+class DailyUsageRow(NamedTuple):
+    day: str
+    api: str
+    calls: int
+    units: int
+    total_tokens: int
+    errors: int
+
+
+def candidate_rows(db, batch_id: Optional[int] = None) -> List[CandidateRow]:
+    """候选人表格 / 指标用的行，按 fit_score 降序；batch_id 为空时返回全部。"""
+    query = db.query(*_CANDIDATE_COLUMNS)
+    if batch_id is not None:
+        query = query.filter(Influencer.batch_id == batch_id)
+    return [CandidateRow._make(row) for row in query.order_by(Influencer.fit_score.desc())]
+
+
+def fit_reason(db, influencer_id: int) -> str:
+    return db.query(Influencer.fit_reason).filter(Influencer.id == influencer_id).scalar() or ""
+
+
+def recent_batches(db, limit: int = 8) -> List[BatchRow]:
+    query = db.query(SearchBatch.id, SearchBatch.platforms, SearchBatch.candidate_count, SearchBatch.created_at)\
+        .order_by(SearchBatch.created_at.desc()).limit(limit)
+    return [BatchRow._make(row) for row in query]
+
+
+def pending_draft_count(db) -> int:
+    """已确认但还没有草稿的候选人数。"""
+    return db.query(func.count(Influencer.id))\
+        .filter(Influencer.is_confirmed == True, Influencer.email_draft.is_(None)).scalar()
+
+
+def draft_options(db) -> List[Tuple[int, str, str]]:
+    """有草稿的候选人 (id, name, platform)，不读取正文。"""
+    query = db.query(Influencer.id, Influencer.name, Influencer.platform)\
+        .filter(Influencer.email_draft.isnot(None)).order_by(Influencer.fit_score.desc())
+    return [tuple(row) for row in query]
+
+
+def email_draft(db, influencer_id: int) -> Optional[str]:
+    return db.query(Influencer.email_draft).filter(Influencer.id == influencer_id).scalar()
+
+
+def save_email_draft(db, influencer_id: int, draft: str) -> None:
+    """调用方负责 commit。"""
+    db.execute(
+        update(Influencer).where(Influencer.id == influencer_id)
+        .values(email_draft=draft, updated_at=datetime.now())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def export_rows(db) -> List[ExportRow]:
+    query = db.query(
+        Influencer.id, Influencer.name, Influencer.platform, Influencer.platform_handle, Influencer.url,
+        Influencer.follower_count, Influencer.followers_verified, Influencer.fit_score, Influencer.fit_reason,
+        Influencer.price_min, Influencer.price_max, Influencer.is_confirmed,
+    ).order_by(Influencer.fit_score.desc())
+    return [ExportRow._make(row) for row in query]
+
+
+def confirmed_drafts(db) -> List[Tuple[str, str, str, str]]:
+    """已确认且有草稿的 (name, platform, url, email_draft)，按 fit_score 降序。"""
+    query = db.query(Influencer.name, Influencer.platform, Influencer.url, Influencer.email_draft)\
+        .filter(Influencer.is_confirmed == True, Influencer.email_draft.isnot(None))\
+        .order_by(Influencer.fit_score.desc())
+    return [tuple(row) for row in query]
+
+
+def usage_by_batch(db, batch_id: int) -> List[UsageRow]:
+    """某批次按端点汇总的 API 用量，按配额单位降序。"""
+    query = db.query(
+        ApiUsage.api, ApiUsage.endpoint, func.count(ApiUsage.id), func.coalesce(func.sum(ApiUsage.units), 0),
+        func.coalesce(func.sum(ApiUsage.prompt_tokens), 0), func.coalesce(func.sum(ApiUsage.cached_tokens), 0),
+        func.coalesce(func.sum(ApiUsage.output_tokens), 0), func.avg(ApiUsage.latency_ms),
+        func.count(ApiUsage.id).filter(ApiUsage.ok == False),
+    ).filter(ApiUsage.batch_id == batch_id)\
+        .group_by(ApiUsage.api, ApiUsage.endpoint).order_by(func.sum(ApiUsage.units).desc())
+    return [UsageRow._make(row) for row in query]
+
+
+def usage_by_day(db, days: int = 7) -> List[DailyUsageRow]:
+    """最近 days 天按配额池汇总的用量，最近的一天在前。"""
+    day = func.date(ApiUsage.created_at)
+    since = (datetime.now() - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    query = db.query(
+        day, ApiUsage.api, func.count(ApiUsage.id), func.coalesce(func.sum(ApiUsage.units), 0),
+        func.coalesce(func.sum(ApiUsage.total_tokens), 0),
+        func.count(ApiUsage.id).filter(ApiUsage.ok == False),
+    ).filter(ApiUsage.created_at >= since)\
+        .group_by(day, ApiUsage.api).order_by(day.desc(), ApiUsage.api)
+    return [DailyUsageRow._make(row) for row in query]
@@ -0,0 +1,404 @@
+"""
+外部 API 调用的录制 / 回放（cassette）。
+
+所有出站调用都经过注册表中的四个资源：gemini_client、search_service（Custom Search）、
+youtube_service 和 http_transport（Instagram Graph / TikTok 的 urllib 请求）。
+这里把它们包一层代理，不需要改动任何调用点：
+- record：照常发出请求，把 (请求, 响应 / 异常, 耗时) 追加到 gzip 压缩的 JSONL 文件
+- replay：不发任何请求，按请求内容查找录制的响应原样返回（或抛出录制的异常），
+  按 CASSETTE_TIMING 重现原始耗时（original）或立即返回（zero）
+
+回放按规范化后的请求内容（端点 + 参数）匹配；同一请求录制了多次时按顺序依次返回，
+用完后重复最后一次。找不到录制的请求抛出 CassetteMiss，调用方按普通 API 错误处理。
+回放时 usage 台账照常记录调用和延迟，但配额单位记为 0（没有消耗真实配额）。
+
+文件中不保存凭证：URL 参数 / 请求体里的 access_token、client_secret 等字段、
+以及响应里的 access_token 都会被替换为 REDACTED；Authorization 等请求头不录制。
+Gemini 响应只保存代码实际读取的字段（text、usage_metadata）。
+
+启用方式：环境变量 CASSETTE_MODE=record|replay，CASSETTE_FILE 指定文件，
+或在代码中 install(Cassette(path, mode))（见 benchmarks.run 的 --record / --replay）。
+回放时平台 Provider 仍按是否配置了凭证决定是否发起调用，需设置任意占位值。
+"""
+import atexit
+import builtins
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+from email.message import Message
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+from config import CASSETTE_MODE, CASSETTE_FILE, CASSETTE_TIMING
+from utils.logger import get_logger
+
+logger = get_logger("cassette")
+
+FLUSH_EVERY = 50    # 录制时缓冲的交互条数，达到后追加写入一次（退出时写入剩余部分）
+
+_SECRET_PARAMS = re.compile(r"\b(access_token|client_secret|client_key|client_id|fb_exchange_token|key)=[^&\s]*")
+_SECRET_FIELDS = re.compile(r'"(access_token|client_secret|client_key)"(\s*:\s*)"[^"]*"')
+_DROPPED_HEADERS = {"set-cookie"}
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class RecordedError(Exception):
+    """回放录制时抛出的、无法按原类型重建的异常。"""
+
+
+def redact(text: str) -> str:
+    text = _SECRET_PARAMS.sub(r"\1=REDACTED", text)
+    return _SECRET_FIELDS.sub(r'"\1"\2"REDACTED"', text)
+
+
+def _canonical(value):
+    """把请求参数转成可稳定序列化的结构（pydantic 对象、集合等）。"""
+    if hasattr(value, "model_dump"):
+        return _canonical(value.model_dump(mode="json", exclude_none=True))
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(_canonical(v) for v in value)
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def request_key(endpoint: str, request: dict) -> str:
+    payload = json.dumps([endpoint, request], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+# ======================== 异常 ========================
+
+def _dump_error(e: Exception) -> dict:
+    if isinstance(e, urllib.error.HTTPError):
+        try:
+            body = e.read().decode(errors="replace")
+        except Exception:
+            body = ""
+        return {"kind": "urllib_http", "status": e.code, "reason": str(e.reason),
+                "url": redact(e.url or ""), "body": redact(body)}
+    resp = getattr(e, "resp", None)
+    if type(e).__name__ == "HttpError" and resp is not None:
+        content = getattr(e, "content", b"") or b""
+        return {"kind": "google_http", "status": int(getattr(resp, "status", 500)),
+                "uri": redact(getattr(e, "uri", "") or ""), "body": redact(content.decode(errors="replace"))}
+    return {"kind": "exception", "type": type(e).__name__, "message": redact(str(e))}
+
+
+def _load_error(error: dict) -> Exception:
+    if error["kind"] == "urllib_http":
+        return urllib.error.HTTPError(error["url"], error["status"], error["reason"], Message(), None)
+    if error["kind"] == "google_http":
+        try:
+            import httplib2
+            from googleapiclient.errors import HttpError
+            return HttpError(httplib2.Response({"status": error["status"]}), error["body"].encode(), uri=error["uri"])
+        except ImportError:
+            return RecordedError(f"HTTP {error['status']}: {error['body'][:200]}")
+    builtin = getattr(builtins, error["type"], None)
+    if isinstance(builtin, type) and issubclass(builtin, Exception):
+        return builtin(error["message"])
+    return RecordedError(f"{error['type']}: {error['message']}")
+
+
+# ======================== Cassette ========================
+
+class Cassette:
+    def __init__(self, path: str, mode: str, timing: str = "original"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending: List[dict] = []
+        self._tapes: Dict[str, List[dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        if mode == "replay":
+            self._load()
+        else:
+            atexit.register(self.flush)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self) -> None:
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._tapes.setdefault(entry["key"], []).append(entry)
+        logger.info(f"Replaying {sum(len(t) for t in self._tapes.values())} interactions from {self.path}")
+
+    def flush(self) -> None:
+        """把缓冲的交互追加写入文件（gzip 允许多个成员拼接，读取时一并解压）。"""
+        with self._lock:
+            entries, self._pending = self._pending, []
+        if not entries:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._write_lock, gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+
+    def rewind(self) -> None:
+        """回放从头开始（同一进程内多次重放同一段录制时使用）。"""
+        with self._lock:
+            self._cursor.clear()
+
+    def play(self, endpoint: str, request: dict, send: Callable[[], object],
+             encode: Callable[[object], object], decode: Callable[[object], object],
+             scrub: Optional[Callable[[object], object]] = None):
+        """
+        record：执行 send()，保存 encode(响应) 或异常；replay：返回录制的响应。
+        两种模式都返回 decode(encode 的结果)（或抛出重建的异常），调用方看到的结果一致。
+        scrub 只作用于写入文件的副本（去掉凭证）；录制时调用方拿到的仍是真实响应，
+        例如刷新 token 的请求必须返回真实 token，后续调用才能通过认证。
+        """
+        key = request_key(endpoint, request)
+        if self.replaying:
+            entry = self._next(key, endpoint)
+            if self.timing == "original":
+                time.sleep(entry["elapsed"])
+            if "error" in entry:
+                raise _load_error(entry["error"])
+            return decode(entry["response"])
+
+        start = time.perf_counter()
+        entry = {"key": key, "endpoint": endpoint, "request": request}
+        data = error = None
+        try:
+            data = encode(send())
+            entry["response"] = scrub(data) if scrub else data
+        except Exception as e:
+            error = e
+            entry["error"] = _dump_error(e)
+        entry["elapsed"] = round(time.perf_counter() - start, 4)
+        with self._lock:
+            self._pending.append(entry)
+            full = len(self._pending) >= FLUSH_EVERY
+        if full:
+            self.flush()
+        if error is not None:
+            raise _load_error(entry["error"]) from error
+        return decode(data)
+
+    def _next(self, key: str, endpoint: str) -> dict:
+        with self._lock:
+            tape = self._tapes.get(key)
+            if not tape:
+                raise CassetteMiss(f"No recorded {endpoint} request matching {key}")
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            return tape[min(index, len(tape) - 1)]
+
+
+# ======================== Gemini ========================
+
+def _encode_generation(response) -> dict:
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "text": getattr(response, "text", None),
+        "usage_metadata": None if usage is None else {
+            field: getattr(usage, field, None)
+            for field in ("prompt_token_count", "cached_content_token_count",
+                          "candidates_token_count", "total_token_count")
+        },
+    }
+
+
+def _decode_generation(data: dict):
+    usage = data.get("usage_metadata")
+    return SimpleNamespace(text=data["text"], usage_metadata=SimpleNamespace(**usage) if usage else None)
+
+
+class _GeminiModels:
+    def __init__(self, cassette: Cassette, client):
+        self._cassette = cassette
+        self._client = client
+
+    def generate_content(self, model: str, contents, config=None):
+        return self._cassette.play(
+            f"gemini:{model}",
+            {"model": model, "contents": _canonical(contents), "config": _canonical(config)},
+            lambda: self._client.models.generate_content(model=model, contents=contents, config=config),
+            _encode_generation, _decode_generation,
+        )
+
+
+class GeminiProxy:
+    """genai.Client 的录制 / 回放代理（models.generate_content）。"""
+
+    def __init__(self, cassette: Cassette, client=None):
+        self.models = _GeminiModels(cassette, client)
+
+
+# ======================== googleapiclient ========================
+
+class _Request:
+    def __init__(self, cassette: Cassette, endpoint: str, kwargs: dict, send: Callable[[], dict]):
+        self._cassette = cassette
+        self._endpoint = endpoint
+        self._kwargs = kwargs
+        self._send = send
+
+    def execute(self, **_):
+        return self._cassette.play(self._endpoint, _canonical(self._kwargs), self._send, lambda r: r, lambda r: r)
+
+
+class _Resource:
+    def __init__(self, service: "ServiceProxy", name: str):
+        self._service = service
+        self._name = name
+
+    def __getattr__(self, method: str):
+        def build(**kwargs):
+            service = self._service
+
+            def send():
+                resource = getattr(service._inner, self._name)()
+                return getattr(resource, method)(**kwargs).execute()
+            return _Request(service._cassette, f"{service._api}.{self._name}.{method}", kwargs, send)
+        return build
+
+
+class ServiceProxy:
+    """googleapiclient service 的代理：service.<resource>().<method>(**kwargs).execute()。"""
+
+    def __init__(self, cassette: Cassette, inner=None, api: str = ""):
+        self._cassette = cassette
+        self._inner = inner
+        self._api = api
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda: _Resource(self, name)
+
+
+# ======================== urllib ========================
+
+class CassetteResponse:
+    """录制的 HTTP 响应；接口与 urlopen 的返回值一致（with / read / status / headers.get）。"""
+
+    def __init__(self, data: dict):
+        self.status = data["status"]
+        self.headers = Message()
+        for name, value in data["headers"].items():
+            self.headers[name] = value
+        self._body = data["body"].encode()
+
+    def read(self) -> bytes:
+        return self._body
+
+    def getcode(self) -> int:
+        return self.status
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def _encode_http(resp) -> dict:
+    with resp:
+        body = resp.read().decode(errors="replace")
+        headers = resp.headers.items() if hasattr(resp.headers, "items") else []
+        return {
+            "status": getattr(resp, "status", 200),
+            "headers": {k: v for k, v in headers if k.lower() not in _DROPPED_HEADERS},
+            "body": body,
+        }
+
+
+class TransportProxy:
+    """http_transport（见 utils.transport）的代理。"""
+
+    def __init__(self, cassette: Cassette, inner=None):
+        self._cassette = cassette
+        self._inner = inner
+
+    def __call__(self, request, timeout: Optional[float] = None):
+        url = redact(request.full_url)
+        body = redact(request.data.decode(errors="replace")) if request.data else None
+        return self._cassette.play(
+            f"http:{url.split('?')[0]}",
+            {"method": request.get_method(), "url": url, "body": body},
+            lambda: self._inner(request, timeout=timeout),
+            _encode_http, CassetteResponse, scrub=lambda data: {**data, "body": redact(data["body"])},
+        )
+
+
+# ======================== 注入 ========================
+
+_PROXIES = {
+    "gemini_client": GeminiProxy,
+    "search_service": lambda cassette, inner: ServiceProxy(cassette, inner, "customsearch"),
+    "youtube_service": lambda cassette, inner: ServiceProxy(cassette, inner, "youtube"),
+    "http_transport": TransportProxy,
+}
+
+_active: Optional[Cassette] = None
+_configured = False
+_active_lock = threading.Lock()
+
+
+def active() -> Optional[Cassette]:
+    """当前生效的 cassette；首次调用时按 CASSETTE_MODE / CASSETTE_FILE 创建（off 时为 None）。"""
+    global _active, _configured
+    with _active_lock:
+        if not _configured:
+            _configured = True
+            if CASSETTE_MODE in ("record", "replay"):
+                _active = Cassette(CASSETTE_FILE, CASSETTE_MODE, CASSETTE_TIMING)
+                logger.info(f"Cassette {CASSETTE_MODE}: {CASSETTE_FILE} (timing={CASSETTE_TIMING})")
+        return _active
+
+
+def replaying() -> bool:
+    cassette = active()
+    return cassette is not None and cassette.replaying
+
+
+def wrap(key: str, factory: Callable[[], object]):
+    """注册表资源工厂的包装：未启用时原样构建；录制时包住真实对象；回放时不构建真实对象。"""
+    cassette = active()
+    if cassette is None or key not in _PROXIES:
+        return factory()
+    inner = None if cassette.replaying else factory()
+    if inner is None and not cassette.replaying:
+        return None
+    return _PROXIES[key](cassette, inner)
+
+
+def install(cassette: Optional[Cassette], backends: Optional[Dict[str, object]] = None) -> None:
+    """
+    在代码中启用（或传 None 停用）cassette，替换注册表中的四个资源。
+    backends 为 {资源 key: 真实对象}（如 benchmarks.fakes 的替身），录制时包住它们；
+    不提供时清除已缓存的资源，下次使用时由工厂重新构建。
+    """
+    global _active, _configured
+    from utils import registry
+    with _active_lock:
+        _active, _configured = cassette, True
+    for key in _PROXIES:
+        inner = (backends or {}).get(key)
+        if cassette is not None and (inner is not None or cassette.replaying):
+            registry.override(key, _PROXIES[key](cassette, inner))
+        else:
+            registry.override(key, inner)
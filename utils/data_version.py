@@ -0,0 +1,85 @@
+"""
+进程内数据版本号：每次提交写入后递增，供 UI 的 st.cache_data 作为缓存键。
+
+Streamlit 每次交互都会重跑 app.py；读查询以版本号为参数缓存后，
+只要数据没有变化（例如拖动滑块），重跑直接命中缓存，不访问 SQLite。
+
+版本号在 Session 事件里自动维护（database.py 调用 install 注册），
+agent 和 UI 的写入都经过同一个 SessionLocal，无需在调用处手动递增：
+- after_flush：记录本次 flush 中新增 / 修改 / 删除的对象所属的表和批次
+- do_orm_execute：记录批量 UPDATE / DELETE 语句涉及的表（批次未知）
+- after_commit：提交成功后统一递增；回滚则丢弃记录
+
+版本粒度：
+- version(table)：该表任何写入都会改变
+- version(table, batch_id)：只在该批次的行或范围未知的批量写入时改变
+"""
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+_lock = threading.Lock()
+_total: Dict[str, int] = defaultdict(int)           # 表的任何写入
+_unscoped: Dict[str, int] = defaultdict(int)        # 批次未知的写入（影响所有批次）
+_scoped: Dict[Tuple[str, int], int] = defaultdict(int)
+
+_PENDING_KEY = "data_version_pending"
+
+
+def bump(table: str, batch_id: Optional[int] = None) -> None:
+    """手动递增（绕过 ORM Session 的写入使用）；batch_id 为空表示影响整张表。"""
+    with _lock:
+        _total[table] += 1
+        if batch_id is None:
+            _unscoped[table] += 1
+        else:
+            _scoped[(table, batch_id)] += 1
+
+
+def version(table: str, batch_id: Optional[int] = None):
+    """当前版本号（可哈希，直接作为 st.cache_data 函数的参数）。"""
+    with _lock:
+        if batch_id is None:
+            return _total[table]
+        return _unscoped[table], _scoped[(table, batch_id)]
+
+
+# ======================== Session 事件 ========================
+
+def _pending(session) -> set:
+    return session.info.setdefault(_PENDING_KEY, set())
+
+
+def _after_flush(session, flush_context) -> None:
+    pending = _pending(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            pending.add((table, getattr(obj, "batch_id", None)))
+
+
+def _do_orm_execute(state) -> None:
+    if not (state.is_update or state.is_delete):
+        return
+    mapper = state.bind_mapper
+    if mapper is not None:
+        _pending(state.session).add((mapper.local_table.name, None))
+
+
+def _after_commit(session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    for table, batch_id in pending or ():
+        bump(table, batch_id)
+
+
+def _after_rollback(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def install(session_factory) -> None:
+    """在 sessionmaker 上注册版本号事件。"""
+    from sqlalchemy import event  # 只有 database.py 调用；UI 读版本号时不需要加载 SQLAlchemy
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "do_orm_execute", _do_orm_execute)
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _after_rollback)
@@ -0,0 +1,134 @@
+"""
+googleapiclient discovery 文档的本地缓存。
+
+discovery.build() 每个进程第一次调用时都要获取并解析 discovery 文档。
+这里按以下顺序取文档，然后用 build_from_document() 构建 service，启动时不发起网络请求：
+1. data/discovery/{api}.{version}.json（磁盘缓存，可提交/随镜像分发）
+2. google-api-python-client 自带的静态文档
+3. 最后才从 googleapis.com 下载，并写回磁盘缓存
+
+命令行刷新缓存：python -m utils.discovery_docs [--refresh]
+"""
+import json
+import os
+import sys
+import threading
+import urllib.request
+from typing import Dict, Tuple
+from utils.logger import get_logger
+
+logger = get_logger("discovery")
+
+DISCOVERY_DIR = os.path.join("data", "discovery")
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest"
+
+# 应用使用到的 API
+REQUIRED_APIS = [("customsearch", "v1"), ("youtube", "v3")]
+
+_documents: Dict[Tuple[str, str], dict] = {}
+_lock = threading.Lock()
+
+
+def _cache_path(api: str, version: str) -> str:
+    return os.path.join(DISCOVERY_DIR, f"{api}.{version}.json")
+
+
+def _read_disk(api: str, version: str):
+    path = _cache_path(api, version)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError as e:
+        logger.warning(f"读取 discovery 缓存失败 ({path}): {e}")
+        return None
+
+
+def _write_disk(api: str, version: str, content: str) -> None:
+    try:
+        os.makedirs(DISCOVERY_DIR, exist_ok=True)
+        with open(_cache_path(api, version), "w", encoding="utf-8") as f:
+            f.write(content)
+    except OSError:
+        pass  # 云环境可能无写权限，仅使用内存缓存
+
+
+def _read_static(api: str, version: str):
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+        return get_static_doc(api, version)
+    except Exception:
+        return None
+
+
+def _download(api: str, version: str) -> str:
+    url = DISCOVERY_URL.format(api=api, version=version)
+    with urllib.request.urlopen(url, timeout=15) as resp:
+        return resp.read().decode()
+
+
+def load_document(api: str, version: str, refresh: bool = False) -> dict:
+    """返回解析后的 discovery 文档（进程内只解析一次）。"""
+    key = (api, version)
+    if not refresh and key in _documents:
+        return _documents[key]
+
+    with _lock:
+        if not refresh and key in _documents:
+            return _documents[key]
+
+        content = None if refresh else _read_disk(api, version)
+        if content is None and not refresh:
+            content = _read_static(api, version)
+            if content is not None:
+                _write_disk(api, version, content)
+        if content is None:
+            logger.info(f"下载 discovery 文档: {api} {version}")
+            content = _download(api, version)
+            _write_disk(api, version, content)
+
+        _documents[key] = json.loads(content)
+        return _documents[key]
+
+
+class ThreadLocalHttp:
+    """
+    每个线程使用自己的 httplib2.Http：httplib2 不是线程安全的，而 service 是进程内共享的。
+    超时 / 被对冲放弃的调用仍在原线程里运行，新的请求落在其他线程上，不会并发使用同一个连接。
+    timeout 是单次请求的 socket 超时，保证放弃的线程最迟在这么久之后结束。
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            from googleapiclient.http import build_http
+            http = build_http()
+            http.timeout = self.timeout
+            self._local.http = http
+        return http
+
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._http(), name)
+
+
+def build_service(api: str, version: str, developer_key: str, timeout: float = None, **kwargs):
+    """build() 的离线版本：基于缓存的 discovery 文档构建 service；给出 timeout 时每个线程独立连接（见 ThreadLocalHttp）。"""
+    from googleapiclient.discovery import build_from_document
+    if timeout is not None:
+        kwargs["http"] = ThreadLocalHttp(timeout)
+    return build_from_document(load_document(api, version), developerKey=developer_key, **kwargs)
+
+
+if __name__ == "__main__":
+    refresh = "--refresh" in sys.argv
+    for api, version in REQUIRED_APIS:
+        doc = load_document(api, version, refresh=refresh)
+        print(f"{api} {version}: revision {doc.get('revision', '?')} → {_cache_path(api, version)}")
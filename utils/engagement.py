@@ -0,0 +1,152 @@
+"""
+基于最近作品的真实互动率计算。
+
+- YouTube：频道 uploads 播放列表 → 最近 N 个视频 ID（playlistItems.list，1 配额/频道），
+  再把多个频道的视频 ID 合并，每 50 个一次 videos().list（1 配额/50 个视频）。
+  互动率 = 平均 (likes + comments) / views × 100
+- Instagram：在 business_discovery 请求里用字段展开取 media{like_count,comments_count}，
+  不产生额外请求。互动率 = 平均 (likes + comments) / followers × 100
+
+YouTube 请求在同一个线程里依次执行：请求已经按 50 个合并，数量很少，并发收益不大；
+单线程只占用一个线程池 worker，且每个请求之前检查运行截止时间，到期即停止发起新请求
+（service 的连接按线程隔离，见 utils.discovery_docs.ThreadLocalHttp）。
+结果按 TTL 缓存，避免放大发现阶段的调用成本；没取到视频统计的频道不缓存（见 youtube_engagement_bulk）。
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import ENGAGEMENT_RECENT_POSTS, ENGAGEMENT_CACHE_TTL
+from utils import resilience
+from utils.usage import metered
+from utils.logger import get_logger
+
+logger = get_logger("engagement")
+
+VIDEOS_PER_REQUEST = 50  # videos().list 单次最多 50 个 ID
+
+
+class TTLCache:
+    """线程安全的简单 TTL 缓存。"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data: Dict[object, Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.time() >= expires_at:
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+
+
+_cache = TTLCache(ENGAGEMENT_CACHE_TTL)
+
+
+def _mean_rate(posts: Iterable[Tuple[int, int, int]]) -> float:
+    """posts: [(likes, comments, denominator)]，denominator 为 0 的作品跳过。"""
+    rates = [(likes + comments) / denom for likes, comments, denom in posts if denom > 0]
+    if not rates:
+        return 0.0
+    return round(sum(rates) / len(rates) * 100, 2)
+
+
+# ======================== Instagram ========================
+
+def instagram_media_fields(limit: int = ENGAGEMENT_RECENT_POSTS) -> str:
+    """business_discovery 的字段展开，随账号数据一起返回最近 N 条作品的互动数。"""
+    return f"media.limit({limit}){{like_count,comments_count}}"
+
+
+def instagram_engagement(biz: dict) -> float:
+    followers = biz.get("followers_count", 0) or 0
+    media = (biz.get("media") or {}).get("data", [])
+    return _mean_rate(
+        (m.get("like_count", 0) or 0, m.get("comments_count", 0) or 0, followers) for m in media
+    )
+
+
+# ======================== YouTube ========================
+
+def _recent_video_ids(youtube, uploads_playlist: str, limit: int) -> List[str]:
+    with metered("youtube.playlistItems.list", api="youtube_data"):
+        res = youtube.playlistItems().list(
+            playlistId=uploads_playlist, part="contentDetails", maxResults=limit
+        ).execute()
+    return [item["contentDetails"]["videoId"] for item in res.get("items", [])]
+
+
+def _video_stats(youtube, video_ids: List[str]) -> Dict[str, Tuple[int, int, int]]:
+    with metered("youtube.videos.list", api="youtube_data", videos=len(video_ids)):
+        res = youtube.videos().list(id=",".join(video_ids), part="statistics").execute()
+    out = {}
+    for item in res.get("items", []):
+        s = item.get("statistics", {})
+        out[item["id"]] = (int(s.get("likeCount", 0)), int(s.get("commentCount", 0)), int(s.get("viewCount", 0)))
+    return out
+
+
+def _youtube_engagement_sync(youtube, misses: Dict[str, str], limit: int):
+    """依次请求（在单个线程中运行）：每个频道最近 N 个视频，再把所有视频按 50 个一批取统计。"""
+    channel_videos: Dict[str, List[str]] = {}
+    for channel_id, playlist in misses.items():
+        if resilience.deadline_expired():
+            break
+        try:
+            channel_videos[channel_id] = _recent_video_ids(youtube, playlist, limit)
+        except Exception as e:
+            logger.warning(f"获取最近视频失败 ({channel_id}): {e}")
+
+    all_ids = [vid for ids in channel_videos.values() for vid in ids]
+    chunks = [all_ids[i:i + VIDEOS_PER_REQUEST] for i in range(0, len(all_ids), VIDEOS_PER_REQUEST)]
+    video_stats: Dict[str, Tuple[int, int, int]] = {}
+    for chunk in chunks:
+        if resilience.deadline_expired():
+            break
+        try:
+            video_stats.update(_video_stats(youtube, chunk))
+        except Exception as e:
+            logger.warning(f"获取视频统计失败: {e}")
+    return channel_videos, video_stats, len(chunks)
+
+
+async def youtube_engagement_bulk(youtube, channels: Dict[str, Optional[str]],
+                                  limit: int = ENGAGEMENT_RECENT_POSTS) -> Dict[str, float]:
+    """
+    channels: {channel_id: uploads_playlist_id}
+    返回 {channel_id: engagement_rate}；缓存命中的频道不再请求。
+    请求失败或截止时间已过、一个视频统计都没取到的频道不在返回值中（互动率未知），也不缓存。
+    """
+    rates: Dict[str, float] = {}
+    misses = {}
+    for channel_id, playlist in channels.items():
+        cached = _cache.get(("YouTube", channel_id))
+        if cached is not None:
+            rates[channel_id] = cached
+        elif playlist:
+            misses[channel_id] = playlist
+    if not misses or youtube is None:
+        return rates
+
+    channel_videos, video_stats, requests = await asyncio.to_thread(_youtube_engagement_sync, youtube, misses, limit)
+
+    for channel_id, ids in channel_videos.items():
+        posts = [video_stats[v] for v in ids if v in video_stats]
+        if ids and not posts:
+            continue  # videos.list 失败 / 被截止时间跳过：0.0 是错的，留给下次重试
+        rate = _mean_rate(posts)
+        rates[channel_id] = rate
+        _cache.set(("YouTube", channel_id), rate)
+
+    logger.info(f"YouTube 互动率计算完成: {len(channel_videos)} 个频道, {requests} 次 videos.list")
+    return rates
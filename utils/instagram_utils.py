@@ -1,14 +1,32 @@
 import os
-import re
 import asyncio
+import urllib.parse
 import urllib.request
 import json
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
+from config import STATS_CALL_TIMEOUT
 from utils.platform_base import PlatformProvider
+from utils.registry import get_resource
+from utils.token_manager import TokenManager
+from utils.engagement import instagram_media_fields, instagram_engagement
+from utils.url_classifier import get_classifier
+from utils import resilience, transport
+from utils.usage import metered
 from utils.logger import get_logger
 
 logger = get_logger("instagram")
 
+GRAPH_VERSION = "v21.0"
+
+# long-lived token 有效期约 60 天，提前 1 天续期
+TOKEN_REFRESH_MARGIN = 24 * 3600
+
+# Graph batch 请求：每个 POST 最多 50 个子请求（每个子请求仍计入调用次数）
+GRAPH_BATCH_SIZE = 50
+APP_USAGE_SLOWDOWN = 75     # X-App-Usage 超过该百分比时，批次之间暂停
+APP_USAGE_STOP = 95         # 超过该百分比时停止本轮查询，避免触发封禁
+THROTTLE_SLEEP_SECONDS = 5
+
 
 class InstagramProvider(PlatformProvider):
     """
@@ -20,6 +38,9 @@ class InstagramProvider(PlatformProvider):
     - INSTAGRAM_ACCESS_TOKEN: Meta Graph API access token
     - INSTAGRAM_USER_ID: 你自己的 Instagram Business 账号 ID（用于发起 business_discovery 查询）
 
+    可选（配置后 long-lived token 会在到期前自动续期）：
+    - INSTAGRAM_APP_ID / INSTAGRAM_APP_SECRET: Meta App 凭证
+
     申请步骤：
     1. https://developers.facebook.com/ 创建 App
     2. 添加 Instagram Graph API 产品
@@ -36,17 +57,12 @@ class InstagramProvider(PlatformProvider):
         return "site:instagram.com"
 
     def validate_url(self, url: str) -> bool:
-        return "instagram.com" in url.lower()
+        return get_classifier().platform_of(url) == "Instagram"
 
     def extract_handle(self, url: str) -> str:
-        """从 Instagram URL 提取用户名"""
-        m = re.search(r'instagram\.com/([a-zA-Z0-9_\.]+)', url, re.IGNORECASE)
-        if m:
-            handle = m.group(1)
-            excluded = {'p', 'reel', 'reels', 'explore', 'stories', 'accounts', 'about', 'directory', 'tv'}
-            if handle.lower() not in excluded:
-                return f"@{handle}"
-        return ""
+        """从 Instagram URL 提取用户名（非主页路径见 config.URL_RULES 的 deny_handles）"""
+        platform, handle = get_classifier().parse(url)
+        return handle if platform == "Instagram" else ""
 
     async def get_stats(self, url: str) -> Tuple[int, str, float]:
         """
@@ -58,8 +74,8 @@ class InstagramProvider(PlatformProvider):
             return 0, "", 0.0
 
         username = handle.lstrip("@")
-        access_token = os.getenv("INSTAGRAM_ACCESS_TOKEN")
         user_id = os.getenv("INSTAGRAM_USER_ID")
+        access_token = await self._get_access_token()
 
         if not access_token or not user_id:
             logger.info(f"Instagram 发现: @{username} (未配置 Graph API token，粉丝数待补充)")
@@ -74,26 +90,188 @@ class InstagramProvider(PlatformProvider):
             logger.warning(f"Instagram API 查询失败 (@{username}): {e}")
             return 0, username, 0.0
 
-    def _fetch_business_discovery(self, username: str, user_id: str, access_token: str) -> Tuple[int, str, float]:
-        """通过 Business Discovery 端点获取公开商业账号数据"""
-        fields = f"business_discovery.username({username}){{username,name,followers_count,media_count,biography}}"
-        api_url = (
-            f"https://graph.facebook.com/v21.0/{user_id}"
-            f"?fields={fields}"
-            f"&access_token={access_token}"
+    async def _get_access_token(self) -> str:
+        """
+        返回可用的 Graph API token。
+        配置了 App 凭证时由 TokenManager 管理：先使用环境变量中的 token，并在后台换取新的
+        long-lived token（约 60 天），之后每次到期前自动续期；否则直接使用环境变量中的 token。
+        换取一直失败（App secret 错误、权限被撤销等）、TokenManager 没有可用 token 时，
+        回退为环境变量中的 token，与未配置 App 凭证时的行为一致。
+        """
+        seed = os.getenv("INSTAGRAM_ACCESS_TOKEN")
+        app_id = os.getenv("INSTAGRAM_APP_ID")
+        app_secret = os.getenv("INSTAGRAM_APP_SECRET")
+        if not seed or not app_id or not app_secret:
+            return seed or ""
+
+        manager = get_resource(
+            f"token:instagram:{app_id}",
+            lambda: TokenManager(
+                "Instagram",
+                lambda current: self._exchange_long_lived_token(app_id, app_secret, current or seed),
+                refresh_margin=TOKEN_REFRESH_MARGIN,
+                # 环境变量里的 token 到期时间未知：立即进入刷新窗口，先用它、后台换新
+                initial=(seed, TOKEN_REFRESH_MARGIN),
+            ),
         )
+        return await manager.aget() or seed
 
-        req = urllib.request.Request(api_url)
-        with urllib.request.urlopen(req, timeout=15) as resp:
+    def _exchange_long_lived_token(self, app_id: str, app_secret: str, current_token: str) -> Tuple[str, float]:
+        """用当前 token 换取新的 long-lived token，返回 (token, expires_in)"""
+        query = urllib.parse.urlencode({
+            "grant_type": "fb_exchange_token",
+            "client_id": app_id,
+            "client_secret": app_secret,
+            "fb_exchange_token": current_token,
+        })
+        req = urllib.request.Request(f"https://graph.facebook.com/{GRAPH_VERSION}/oauth/access_token?{query}")
+        with metered("instagram.oauth.exchange", api="instagram_graph"), transport.urlopen(req, timeout=15) as resp:
             data = json.loads(resp.read().decode())
+        return data.get("access_token", ""), data.get("expires_in", 60 * 24 * 3600)
+
+    def _discovery_fields(self, username: str) -> str:
+        # media 字段展开：随账号数据一起返回最近作品互动数，计算互动率不需要额外请求
+        return (
+            f"business_discovery.username({username})"
+            f"{{username,name,followers_count,media_count,biography,{instagram_media_fields()}}}"
+        )
 
+    def _parse_business_discovery(self, username: str, data: dict) -> Tuple[int, str, float]:
         biz = data.get("business_discovery", {})
         followers = biz.get("followers_count", 0)
         name = biz.get("name", username)
         media_count = biz.get("media_count", 0)
 
-        # 简单估算互动率（后续可用 media edge 获取精确值）
-        engagement = 0.0
+        # 最近 N 条作品的平均 (likes + comments) / followers
+        engagement = instagram_engagement(biz)
 
-        logger.info(f"Instagram 查询成功: @{username} → {name} ({followers:,} followers, {media_count} posts)")
+        logger.info(
+            f"Instagram 查询成功: @{username} → {name} "
+            f"({followers:,} followers, {media_count} posts, {engagement}% engagement)"
+        )
         return followers, name, engagement
+
+    def _fetch_business_discovery(self, username: str, user_id: str, access_token: str) -> Tuple[int, str, float]:
+        """通过 Business Discovery 端点获取公开商业账号数据"""
+        api_url = (
+            f"https://graph.facebook.com/{GRAPH_VERSION}/{user_id}"
+            f"?fields={self._discovery_fields(username)}"
+            f"&access_token={access_token}"
+        )
+
+        req = urllib.request.Request(api_url)
+        with metered("instagram.business_discovery", api="instagram_graph"), \
+                transport.urlopen(req, timeout=STATS_CALL_TIMEOUT) as resp:
+            data = json.loads(resp.read().decode())
+
+        return self._parse_business_discovery(username, data)
+
+    # ======================== 批量查询 ========================
+
+    async def get_stats_bulk(self, urls: List[str]) -> Dict[str, Tuple[int, str, float]]:
+        """
+        通过 Graph API batch 请求批量查询：每个 POST 最多包含 50 个 business_discovery 子请求。
+        单个子请求失败不影响其他项；超时（返回 null）的子请求会在下一批重试一次。
+        根据 X-App-Usage 响应头的使用率主动减速，接近上限时停止本轮查询。
+        """
+        results: Dict[str, Tuple[int, str, float]] = {}
+        by_username: Dict[str, List[str]] = {}
+        for url in urls:
+            handle = self.extract_handle(url)
+            if not handle:
+                results[url] = (0, "", 0.0)
+                continue
+            by_username.setdefault(handle.lstrip("@"), []).append(url)
+
+        user_id = os.getenv("INSTAGRAM_USER_ID")
+        access_token = await self._get_access_token()
+        stats: Dict[str, Tuple[int, str, float]] = {}
+
+        if not access_token or not user_id:
+            logger.info(f"Instagram 发现: {len(by_username)} 个账号 (未配置 Graph API token，粉丝数待补充)")
+        else:
+            pending = list(by_username)
+            retried = set()
+            while pending:
+                if resilience.deadline_expired():
+                    logger.warning(f"运行截止时间已到，跳过剩余 {len(pending)} 个 Instagram 账号")
+                    break
+                chunk, pending = pending[:GRAPH_BATCH_SIZE], pending[GRAPH_BATCH_SIZE:]
+                try:
+                    chunk_stats, usage = await asyncio.to_thread(
+                        self._fetch_business_discovery_batch, chunk, user_id, access_token
+                    )
+                except Exception as e:
+                    logger.warning(f"Instagram batch 请求失败 ({len(chunk)} 个账号): {e}")
+                    continue
+
+                for username, result in chunk_stats.items():
+                    if result is not None:
+                        stats[username] = result
+                    elif username not in retried:
+                        retried.add(username)
+                        pending.append(username)
+
+                if usage >= APP_USAGE_STOP:
+                    logger.warning(f"Instagram App 使用率 {usage}%，停止本轮查询（剩余 {len(pending)} 个账号）")
+                    break
+                if usage >= APP_USAGE_SLOWDOWN and pending:
+                    await asyncio.sleep(THROTTLE_SLEEP_SECONDS)
+
+        for username, username_urls in by_username.items():
+            for url in username_urls:
+                results[url] = stats.get(username, (0, username, 0.0))
+        return results
+
+    def _fetch_business_discovery_batch(self, usernames: List[str], user_id: str,
+                                        access_token: str) -> Tuple[Dict[str, Optional[Tuple[int, str, float]]], int]:
+        """
+        发送一个 Graph batch 请求。
+        返回 ({username: stats 或 None(超时，可重试)}, App 使用率百分比)。
+        子请求返回错误的账号按"无数据"处理，不重试。
+        """
+        batch = [
+            {"method": "GET", "relative_url": f"{user_id}?fields={self._discovery_fields(u)}"}
+            for u in usernames
+        ]
+        body = urllib.parse.urlencode({
+            "access_token": access_token,
+            "batch": json.dumps(batch),
+            "include_headers": "false",
+        }).encode()
+        req = urllib.request.Request(f"https://graph.facebook.com/{GRAPH_VERSION}/", data=body, method="POST")
+        with metered("instagram.batch", api="instagram_graph", units=len(usernames)) as batch_span, \
+                transport.urlopen(req, timeout=STATS_CALL_TIMEOUT) as resp:
+            responses = json.loads(resp.read().decode())
+            usage = _app_usage_percent(resp.headers.get("X-App-Usage"))
+            batch_span.set(app_usage=usage)
+
+        results: Dict[str, Optional[Tuple[int, str, float]]] = {}
+        for username, item in zip(usernames, responses):
+            if item is None:
+                results[username] = None
+                continue
+            try:
+                data = json.loads(item.get("body") or "{}")
+            except ValueError:
+                data = {}
+            if item.get("code") != 200:
+                message = data.get("error", {}).get("message", f"HTTP {item.get('code')}")
+                logger.warning(f"Instagram API 查询失败 (@{username}): {message}")
+                results[username] = (0, username, 0.0)
+                continue
+            results[username] = self._parse_business_discovery(username, data)
+
+        logger.info(f"Instagram batch 查询完成: {len(usernames)} 个账号, App 使用率 {usage}%")
+        return results, usage
+
+
+def _app_usage_percent(header: Optional[str]) -> int:
+    """解析 X-App-Usage 头 ({"call_count": 28, "total_time": 25, "total_cputime": 25})，取最大值。"""
+    if not header:
+        return 0
+    try:
+        usage = json.loads(header)
+        return int(max(usage.values())) if usage else 0
+    except (ValueError, TypeError):
+        return 0
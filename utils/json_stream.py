@@ -0,0 +1,101 @@
+"""
+容错的增量 JSON 数组解析。
+
+LLM 输出即使声明了 response_schema，也可能被截断（达到 max tokens）或夹带多余文本。
+整体 json.loads 失败时不再丢弃整批结果，而是用 JSONDecoder.raw_decode 逐个元素解析：
+- 数组前的说明文字 / markdown 代码块标记被跳过
+- 完整的元素立即返回，截断的最后一个元素被丢弃
+- 中间某个元素损坏时，跳到下一个 "{" 继续解析后面的元素
+
+JSONArrayParser 支持分块输入（feed），可直接用于流式响应。
+"""
+import json
+from typing import List
+
+_decoder = json.JSONDecoder()
+_SEPARATORS = " \t\r\n,"
+
+
+class JSONArrayParser:
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self.skipped = 0    # 跳过的损坏元素数
+
+    def _skip_separators(self) -> int:
+        pos = self._pos
+        while pos < len(self._buf) and self._buf[pos] in _SEPARATORS:
+            pos += 1
+        self._pos = pos
+        return pos
+
+    def _find_start(self) -> bool:
+        if not self._started:
+            start = self._buf.find("[", self._pos)
+            if start < 0:
+                self._pos = len(self._buf)
+                return False
+            self._pos = start + 1
+            self._started = True
+        return True
+
+    def feed(self, chunk: str) -> list:
+        """追加一段文本，返回本次新解析出的完整元素；不完整的元素留到后续输入。"""
+        self._buf += chunk
+        items = []
+        if not self._find_start():
+            return items
+        while not self._done:
+            pos = self._skip_separators()
+            if pos >= len(self._buf):
+                break
+            if self._buf[pos] == "]":
+                self._done = True
+                break
+            try:
+                obj, end = _decoder.raw_decode(self._buf, pos)
+            except json.JSONDecodeError:
+                break  # 元素尚未完整（或已损坏，close 时处理）
+            if end >= len(self._buf):
+                break  # 恰好在块边界结束的数字可能还没读完，等后续输入确认
+            items.append(obj)
+            self._pos = end
+        return items
+
+    def close(self) -> list:
+        """输入结束：跳过损坏的元素，返回剩余能恢复的元素。"""
+        items = []
+        if not self._find_start():
+            return items
+        while not self._done:
+            pos = self._skip_separators()
+            if pos >= len(self._buf):
+                break
+            if self._buf[pos] == "]":
+                self._done = True
+                break
+            try:
+                obj, self._pos = _decoder.raw_decode(self._buf, pos)
+                items.append(obj)
+            except json.JSONDecodeError:
+                nxt = self._buf.find("{", pos + 1)
+                if nxt < 0:
+                    break  # 截断的最后一个元素
+                self.skipped += 1
+                self._pos = nxt
+        return items
+
+
+def parse_json_array(text: str) -> List:
+    """整体解析成功直接返回；否则逐元素恢复。非数组 / 完全无法解析时返回空列表。"""
+    text = text or ""
+    try:
+        result = json.loads(text)
+        if isinstance(result, list):
+            return result
+    except json.JSONDecodeError:
+        pass
+    parser = JSONArrayParser()
+    return parser.feed(text) + parser.close()
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+from utils import resilience
 
 
 class PlatformProvider(ABC):
@@ -19,9 +20,26 @@ class PlatformProvider(ABC):
     async def get_stats(self, url: str) -> Tuple[int, str, float]:
         """
         获取频道/账号统计数据
-        返回: (follower_count, channel_name, engagement_rate)
+        返回: (follower_count, channel_name, engagement_rate)；互动率未取到时为 None
         """
 
+    async def get_stats_bulk(self, urls: List[str]) -> Dict[str, Tuple[int, str, float]]:
+        """
+        批量获取统计数据，返回 {url: (follower_count, channel_name, engagement_rate)}
+        默认逐个调用 get_stats；平台有批量接口时覆盖此方法。
+        运行截止时间已过时不再发起新请求，剩余的返回空统计（覆盖的实现同样遵守）。
+        """
+        results = {}
+        for url in urls:
+            if resilience.deadline_expired():
+                results[url] = (0, "", 0.0)
+                continue
+            try:
+                results[url] = await self.get_stats(url)
+            except Exception:
+                results[url] = (0, "", 0.0)
+        return results
+
     @abstractmethod
     def validate_url(self, url: str) -> bool:
         """验证 URL 是否属于该平台"""
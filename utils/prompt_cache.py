@@ -0,0 +1,27 @@
+"""
+固定提示词前缀。
+
+评分规则（权重、定价档位、平台系数、输出示例）在每批、每次运行中都完全相同，
+只有品牌需求和候选人列表变化。PromptPrefix 把固定部分作为 system_instruction 放在每个请求的最前面，
+可变内容只放在 contents 里：前缀逐字节稳定，长度达到模型的最小缓存长度时可命中 Gemini 的隐式缓存
+（命中的 token 数记在用量台账的 cached_tokens 列）。
+
+不使用显式上下文缓存 (client.caches.create)：显式缓存要求前缀至少 1024 token（pro 模型 2048），
+当前评分规则约 400 token，创建请求只会被拒绝；为凑够长度加长提示词，多出的输入 token 比缓存省下的更多。
+"""
+import hashlib
+
+
+class PromptPrefix:
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.version = hashlib.sha256(text.encode()).hexdigest()[:12]
+
+    def config(self, **extra) -> dict:
+        """generate_content 的 config：前缀作为 system_instruction。"""
+        return {**extra, "system_instruction": self.text}
+
+    def generate(self, client, model: str, contents, **extra):
+        """以该前缀调用 generate_content（同步，需在线程中调用）。"""
+        return client.models.generate_content(model=model, contents=contents, config=self.config(**extra))
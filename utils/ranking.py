@@ -0,0 +1,125 @@
+"""
+候选人向量化排序。
+
+把一批候选人加载为列式快照（NumPy 数组），一次性计算：
+- 预算契合度：估价区间与侧边栏 budget_range 的匹配程度
+- 性价比：fit_score / 估价中位数
+- 综合分：fit、预算契合、性价比、互动率的加权和
+- 平台多样性：同平台排名越靠后衰减越多，避免结果被单一平台占满
+
+5 万行的快照重新排序只需几毫秒，滑块拖动时无需重新查询数据库。
+"""
+from typing import Dict, Iterable, Tuple
+import numpy as np
+
+DEFAULT_WEIGHTS = {
+    "fit": 0.55,
+    "budget": 0.20,
+    "value": 0.15,
+    "engagement": 0.10,
+}
+DIVERSITY_DECAY = 0.9       # 同平台第 k 名的分数乘以 decay^k
+ENGAGEMENT_CAP = 10.0       # 互动率 ≥ 10% 视为满分
+KNAPSACK_BUCKETS = 1000     # 预算离散化的格数（精度 = 预算 / 格数），见 utils.shortlist
+
+
+class CandidateSnapshot:
+    """一批候选人的列式快照；各列为等长 NumPy 数组。"""
+
+    __slots__ = ("ids", "follower_count", "engagement_rate", "fit_score",
+                 "price_min", "price_max", "platform_codes", "platforms")
+
+    def __init__(self, ids, follower_count, engagement_rate, fit_score, price_min, price_max, platform):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.follower_count = np.asarray(follower_count, dtype=np.float64)
+        self.engagement_rate = np.asarray(engagement_rate, dtype=np.float64)
+        self.fit_score = np.asarray(fit_score, dtype=np.float64)
+        self.price_min = np.asarray(price_min, dtype=np.float64)
+        self.price_max = np.asarray(price_max, dtype=np.float64)
+        self.platforms, self.platform_codes = np.unique(np.asarray(platform, dtype=object).astype(str),
+                                                        return_inverse=True)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> "CandidateSnapshot":
+        """rows 需有 id / follower_count / engagement_rate / fit_score / price_min / price_max / platform 属性。"""
+        rows = list(rows)
+
+        def col(name):
+            return [getattr(r, name) for r in rows]
+
+        def num(values):
+            return [np.nan if v is None else v for v in values]
+
+        return cls(
+            ids=col("id"),
+            follower_count=num(col("follower_count")),
+            engagement_rate=num(col("engagement_rate")),
+            fit_score=num(col("fit_score")),
+            price_min=num(col("price_min")),
+            price_max=num(col("price_max")),
+            platform=[p or "" for p in col("platform")],
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ======================== 分项指标 ========================
+
+    @property
+    def price_mid(self) -> np.ndarray:
+        """估价中位数；未估价或估价为 0（粉丝数未验证）时为 NaN。"""
+        mid = (self.price_min + self.price_max) / 2
+        return np.where(mid > 0, mid, np.nan)
+
+    def budget_fit(self, budget_range: Tuple[float, float]) -> np.ndarray:
+        """
+        [0, 1]：估价落在预算区间内为 1；低于下限略降（0.9）；
+        高于上限按 上限/估价 衰减；未知估价为中性 0.5。
+        """
+        lo, hi = budget_range
+        mid = self.price_mid
+        with np.errstate(invalid="ignore", divide="ignore"):
+            over = np.clip(hi / mid, 0, 1) if hi > 0 else np.zeros_like(mid)
+            fit = np.where(mid > hi, over, np.where(mid < lo, 0.9, 1.0))
+        return np.where(np.isnan(mid), 0.5, fit)
+
+    def value_per_dollar(self) -> np.ndarray:
+        """fit_score / 估价，按本批最大值归一化到 [0, 1]；未知为 0。"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            vpd = np.nan_to_num(self.fit_score / self.price_mid, nan=0.0, posinf=0.0)
+        top = vpd.max() if len(vpd) else 0
+        return vpd / top if top > 0 else vpd
+
+    def composite(self, budget_range: Tuple[float, float], weights: Dict[str, float] = None) -> np.ndarray:
+        w = {**DEFAULT_WEIGHTS, **(weights or {})}
+        fit = np.nan_to_num(self.fit_score, nan=0.0) / 100
+        eng = np.clip(np.nan_to_num(self.engagement_rate, nan=0.0) / ENGAGEMENT_CAP, 0, 1)
+        return (
+            w["fit"] * fit
+            + w["budget"] * self.budget_fit(budget_range)
+            + w["value"] * self.value_per_dollar()
+            + w["engagement"] * eng
+        )
+
+    # ======================== 排序 ========================
+
+    def diversify(self, scores: np.ndarray, decay: float = DIVERSITY_DECAY) -> np.ndarray:
+        """同平台内按分数排名 k（从 0 开始），分数乘以 decay^k。"""
+        if not len(scores):
+            return scores
+        order = np.lexsort((-scores, self.platform_codes))  # 先按平台分组，组内分数降序
+        codes = self.platform_codes[order]
+        group_start = np.r_[0, np.flatnonzero(np.diff(codes)) + 1]
+        starts = np.repeat(group_start, np.diff(np.r_[group_start, len(codes)]))
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order)) - starts
+        return scores * decay ** rank
+
+    def rank(self, budget_range: Tuple[float, float], weights: Dict[str, float] = None,
+             diversity: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (按综合分降序的候选人 ID, 对应分数)。"""
+        scores = self.composite(budget_range, weights)
+        if diversity:
+            scores = self.diversify(scores)
+        order = np.argsort(-scores, kind="stable")
+        return self.ids[order], scores[order]
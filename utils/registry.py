@@ -0,0 +1,189 @@
+"""
+进程级资源注册表。
+
+Streamlit 每次交互都会重跑 app.py，但 Python 进程和模块全局变量是所有 session 共享的。
+这里集中缓存构建成本高的对象（Gemini client、googleapiclient service、平台 Provider、Agent），
+每个进程只构建一次，并在日志里记录每个资源的 warm-up 耗时。
+
+共享对象不能持有绑定到某个 event loop 的状态（每次点击都是新的 asyncio.run），
+Agent 的并发信号量见 agents.base.LoopLocalSemaphore。
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from utils.logger import get_logger
+
+logger = get_logger("registry")
+
+_resources: Dict[str, object] = {}
+_warmup_ms: Dict[str, float] = {}
+_key_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(key: str) -> threading.Lock:
+    with _locks_guard:
+        lock = _key_locks.get(key)
+        if lock is None:
+            lock = _key_locks[key] = threading.Lock()
+        return lock
+
+
+def get_resource(key: str, factory: Callable[[], object]):
+    """
+    返回 key 对应的单例；不存在时调用 factory 构建。
+    每个 key 单独加锁：并发请求同一资源时只构建一次，其余线程等待结果；
+    不同资源之间互不阻塞。factory 返回 None（如缺少 API key）时不缓存，下次重试。
+    """
+    resource = _resources.get(key)
+    if resource is not None:
+        return resource
+
+    with _lock_for(key):
+        resource = _resources.get(key)
+        if resource is not None:
+            return resource
+
+        start = time.perf_counter()
+        resource = factory()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if resource is not None:
+            _resources[key] = resource
+            _warmup_ms[key] = elapsed_ms
+            logger.info(f"Warm-up {key}: {elapsed_ms:.0f}ms")
+        return resource
+
+
+def override(key: str, resource) -> None:
+    """直接注入资源（用于替换为 fake / 录制回放对象）。传 None 则移除。"""
+    with _lock_for(key):
+        if resource is None:
+            _resources.pop(key, None)
+            _warmup_ms.pop(key, None)
+        else:
+            _resources[key] = resource
+            _warmup_ms[key] = 0.0
+
+
+def reset() -> None:
+    """清空所有已缓存资源。"""
+    with _locks_guard:
+        _resources.clear()
+        _warmup_ms.clear()
+
+
+def warmup_report() -> Dict[str, float]:
+    """已构建资源及其 warm-up 耗时（毫秒）。"""
+    return dict(_warmup_ms)
+
+
+# ======================== 资源工厂 ========================
+
+def _build_gemini_client():
+    from google import genai
+    return genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+
+def _build_search_service():
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        return None
+    from config import SEARCH_CALL_TIMEOUT
+    from utils.discovery_docs import build_service
+    return build_service("customsearch", "v1", developer_key=api_key, timeout=SEARCH_CALL_TIMEOUT)
+
+
+def _build_youtube_service():
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        return None
+    from config import STATS_CALL_TIMEOUT
+    from utils.discovery_docs import build_service
+    return build_service("youtube", "v3", developer_key=api_key, timeout=STATS_CALL_TIMEOUT)
+
+
+def _build_http_transport():
+    import urllib.request
+    return urllib.request.urlopen
+
+
+def _build_provider(name: str):
+    if name == "YouTube":
+        from utils.youtube_utils import YouTubeProvider
+        return YouTubeProvider()
+    if name == "Instagram":
+        from utils.instagram_utils import InstagramProvider
+        return InstagramProvider()
+    if name == "TikTok":
+        from utils.tiktok_utils import TikTokProvider
+        return TikTokProvider()
+    return None
+
+
+def _recordable(key: str, factory: Callable[[], object]):
+    """出站 API 资源：启用录制 / 回放时包上 cassette 代理（见 utils.cassette）。"""
+    def build():
+        from utils import cassette
+        return cassette.wrap(key, factory)
+    return get_resource(key, build)
+
+
+def get_gemini_client():
+    return _recordable("gemini_client", _build_gemini_client)
+
+
+def get_search_service():
+    return _recordable("search_service", _build_search_service)
+
+
+def get_youtube_service():
+    return _recordable("youtube_service", _build_youtube_service)
+
+
+def get_http_transport():
+    """urllib 请求的发送函数（见 utils.transport）。"""
+    return _recordable("http_transport", _build_http_transport)
+
+
+def get_provider(name: str):
+    return get_resource(f"provider:{name}", lambda: _build_provider(name))
+
+
+def get_scout_agent(platforms: Optional[List[str]] = None):
+    from agents.scout import ScoutAgent
+    key = "agent:scout:" + ",".join(platforms or ["YouTube"])
+    return get_resource(key, lambda: ScoutAgent(platforms=platforms))
+
+
+def get_analyst_agent():
+    from agents.analyst import AnalystAgent
+    return get_resource("agent:analyst", AnalystAgent)
+
+
+def get_writer_agent():
+    from agents.writer import WriterAgent
+    return get_resource("agent:writer", WriterAgent)
+
+
+def warm_up(platforms: Iterable[str] = ("YouTube",)) -> Dict[str, float]:
+    """预先构建常用资源，让第一次点击不再承担 client / service 的初始化成本。"""
+    start = time.perf_counter()
+    for fn in (get_gemini_client, get_search_service, get_youtube_service):
+        try:
+            fn()
+        except Exception as e:
+            logger.warning(f"Warm-up failed ({fn.__name__}): {e}")
+    for name in platforms:
+        get_provider(name)
+    get_analyst_agent()
+    get_writer_agent()
+    logger.info(f"Warm-up complete in {(time.perf_counter() - start) * 1000:.0f}ms")
+    return warmup_report()
+
+
+def warm_up_in_background(platforms: Iterable[str] = ("YouTube",)) -> threading.Thread:
+    """在后台线程 warm-up，不阻塞首屏渲染；期间的请求会等待对应资源的单次构建完成。"""
+    thread = threading.Thread(target=warm_up, args=(tuple(platforms),), daemon=True, name="registry-warmup")
+    thread.start()
+    return thread
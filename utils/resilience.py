@@ -0,0 +1,179 @@
+"""
+请求截止时间与对冲请求（hedged requests），控制尾延迟。
+
+- 单次调用截止时间：每个外部调用都有超时，一次慢响应不会拖住整个 asyncio.gather
+- 运行截止时间：run_deadline(seconds) 在当前上下文（含其中创建的 task / 线程）设置整体截止时间，
+  单次调用的超时会被截短到剩余时间；到期后 deadline_expired() 为真，
+  调用方停止发起新工作并返回已完成的部分结果
+- 对冲请求：幂等调用在等待超过该调用历史 p95 延迟后再并发发出一个副本，取先返回的结果；
+  样本不足 HEDGE_MIN_SAMPLES 时不对冲；延迟样本按 name + task 分开统计
+
+同步函数在线程池中执行；超时 / 被对冲取消的线程无法强制停止，其结果会被丢弃。
+因此被调用的同步函数自身必须有请求级超时，且不能与其他线程共用非线程安全的连接
+（Google API service 见 utils.discovery_docs.ThreadLocalHttp）。
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from config import HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES
+from utils import usage
+from utils.tracing import span
+from utils.logger import get_logger
+
+logger = get_logger("resilience")
+
+LATENCY_WINDOW = 200    # 每类调用保留的最近延迟样本数
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+# ======================== 运行截止时间 ========================
+
+_deadline: ContextVar[Optional[float]] = ContextVar("run_deadline", default=None)
+
+
+@contextmanager
+def run_deadline(seconds: Optional[float]):
+    """在当前上下文设置整体截止时间（嵌套时取更早的一个）；seconds 为空则不限。"""
+    if not seconds:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(outer, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_remaining() -> Optional[float]:
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def deadline_expired() -> bool:
+    remaining = deadline_remaining()
+    return remaining is not None and remaining <= 0
+
+
+def _budget(name: str, timeout: Optional[float]) -> Optional[float]:
+    remaining = deadline_remaining()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"{name}: run deadline already passed")
+    if remaining is None:
+        return timeout
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+# ======================== 延迟统计 ========================
+
+class LatencyTracker:
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    def hedge_delay(self) -> Optional[float]:
+        with self._lock:
+            enough = len(self._samples) >= HEDGE_MIN_SAMPLES
+        return self.percentile(HEDGE_PERCENTILE) if enough else None
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def tracker_for(name: str) -> LatencyTracker:
+    with _trackers_lock:
+        tracker = _trackers.get(name)
+        if tracker is None:
+            tracker = _trackers[name] = LatencyTracker()
+        return tracker
+
+
+# ======================== 调用 ========================
+
+def _start(fn, args, kwargs) -> asyncio.Future:
+    if asyncio.iscoroutinefunction(fn):
+        return asyncio.ensure_future(fn(*args, **kwargs))
+    return asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+
+
+async def call(fn, *args, name: str, timeout: Optional[float] = None, hedge: bool = False,
+               api: Optional[str] = None, task: Optional[str] = None, **kwargs):
+    """
+    执行 fn(*args, **kwargs)（同步函数放到线程池），超时取 timeout 与运行剩余时间的较小值。
+    hedge=True 时只应用于幂等调用：等待超过该 name 的历史 p95 仍未返回，则再发一个副本，取先成功的结果。
+    api 为配额池名称时在用量台账记录这次调用（见 utils.usage）；内部请求自行计量的包装调用不传。
+    task 区分同一 name 下延迟分布不同的调用（如同一模型上的查询生成和写邮件），各自维护对冲用的 p95。
+    超时抛出 DeadlineExceeded；fn 自身的异常原样抛出（另一个副本仍在运行时先等它）。
+    """
+    budget = _budget(name, timeout)
+    with span(name, kind="client", timeout=budget) as call_span:
+        start = time.perf_counter()
+        ok, result = False, None
+        try:
+            result = await _call(fn, args, kwargs, name, f"{name}:{task}" if task else name, budget, hedge, call_span)
+            ok = True
+            return result
+        finally:
+            if api:
+                attempts = 2 if call_span.attrs.get("hedged") else 1
+                usage.record(
+                    api, name, time.perf_counter() - start, ok=ok, units=usage.units_for(name) * attempts,
+                    usage_metadata=getattr(result, "usage_metadata", None),
+                )
+
+
+async def _call(fn, args, kwargs, name: str, tracker_key: str, budget: Optional[float], hedge: bool, call_span):
+    tracker = tracker_for(tracker_key)
+    delay = tracker.hedge_delay() if hedge and HEDGE_ENABLED else None
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    end = None if budget is None else start + budget
+    pending = {_start(fn, args, kwargs)}
+    hedged = False
+    error = None
+    try:
+        while pending:
+            # 等到对冲时刻或截止时间（取较早者）；基于 loop.time() 而不是 asyncio.timeout（3.11+）
+            waits = [] if end is None else [max(0.0, end - loop.time())]
+            if not hedged and delay is not None:
+                waits.append(max(0.0, delay - (loop.time() - start)))
+            done, pending = await asyncio.wait(pending, timeout=min(waits) if waits else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if hedged or delay is None or loop.time() >= end:
+                    tracker.record(loop.time() - start)  # 超时也计入样本，让 p95 反映真实的慢响应
+                    raise DeadlineExceeded(f"{name} timed out after {loop.time() - start:.1f}s")
+                hedged = True
+                call_span.set(hedged=True)
+                logger.info(f"Hedging {name} after {loop.time() - start:.2f}s (p{HEDGE_PERCENTILE} {delay:.2f}s)")
+                pending.add(_start(fn, args, kwargs))
+                continue
+            for task in done:
+                if task.exception() is None:
+                    tracker.record(loop.time() - start)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
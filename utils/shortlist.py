@@ -0,0 +1,126 @@
+"""
+预算约束下的候选人组合优化。
+
+给定总预算和每个平台的人数上限，选出 fit_score 总和最大的候选人组合：
+1. 每个平台内部做"带人数上限的 0/1 背包"，得到该平台在每个预算档位的最优值
+   （按容量维度和人数维度向量化，每个候选人一次数组更新；选择记录按位压缩）
+2. 平台之间做分组背包，把总预算分配给各平台
+3. 回溯得到选中的候选人
+
+预算离散化为 KNAPSACK_BUCKETS 格，成本向上取整，保证结果不超预算。
+候选人过多时，每个平台按性价比和 fit_score 各保留前若干名再求解，可扩展到数千名候选人。
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from utils.ranking import CandidateSnapshot, KNAPSACK_BUCKETS
+
+MAX_CANDIDATES_PER_PLATFORM = 400
+
+Backtrack = Callable[[int], List[int]]
+
+
+def _platform_table(weights: np.ndarray, values: np.ndarray, buckets: int,
+                    limit: Optional[int]) -> Tuple[np.ndarray, Backtrack]:
+    """
+    返回 (best, backtrack)：best[c] 为容量 ≤ c、最多 limit 人时的最优值；
+    backtrack(c) 返回达到 best[c] 的物品下标。
+
+    人数维度只保留到"预算内最多装得下的人数"（更大的上限等于不限人数，省掉该维度）；
+    每个物品的选择记录按位压缩存储（n × 人数 × 容量 / 8 字节）。
+    """
+    n = len(weights)
+    fits = int(np.searchsorted(np.cumsum(np.sort(weights)), buckets, side="right"))
+    counted = limit is not None and limit < fits
+    rows = limit + 1 if counted else 1
+    dp = np.zeros((rows, buckets + 1))
+    take = np.zeros((n, rows - 1 if counted else 1, (buckets + 8) // 8), dtype=np.uint8)
+
+    for i in range(n):
+        w = weights[i]
+        if w > buckets:
+            continue
+        # 有人数维度时第 k 行由第 k-1 行转移；否则只有一行，就地转移
+        source = dp[:-1] if counted else dp
+        target = dp[1:] if counted else dp
+        candidate = source[:, :buckets + 1 - w] + values[i]
+        better = np.zeros((len(target), buckets + 1), dtype=bool)
+        better[:, w:] = candidate > target[:, w:]
+        target[:, w:] = np.where(better[:, w:], candidate, target[:, w:])
+        take[i] = np.packbits(better, axis=1)
+
+    def taken(i: int, row: int, cap: int) -> bool:
+        return bool(take[i, row, cap >> 3] >> (7 - (cap & 7)) & 1)
+
+    def backtrack(cap: int) -> List[int]:
+        chosen = []
+        k = rows - 1
+        for i in range(n - 1, -1, -1):
+            if counted and k == 0:
+                break
+            if taken(i, k - 1 if counted else 0, cap):
+                chosen.append(i)
+                cap -= weights[i]
+                k -= 1
+        return chosen
+
+    return dp[-1], backtrack
+
+
+def _prune(idx: np.ndarray, costs: np.ndarray, values: np.ndarray, keep: int) -> np.ndarray:
+    """保留性价比最高和 fit 最高的候选人（并集），控制 DP 规模。"""
+    if len(idx) <= keep:
+        return idx
+    half = keep // 2
+    by_density = idx[np.argsort(-(values[idx] / costs[idx]))[:half]]
+    by_value = idx[np.argsort(-values[idx])[:half]]
+    return np.union1d(by_density, by_value)
+
+
+def optimize_shortlist(snapshot: CandidateSnapshot, total_budget: float,
+                       quotas: Dict[str, int] = None, values: np.ndarray = None,
+                       buckets: int = KNAPSACK_BUCKETS) -> List[int]:
+    """
+    quotas: {platform: 最多选几人}；未列出或值为 None 的平台不限人数，值为 0 表示不选该平台。
+    values: 每个候选人的价值（默认 fit_score）。返回选中的候选人 ID。
+    未估价 / 估价为 0 的候选人成本未知，不参与优化。
+    """
+    if total_budget <= 0 or not len(snapshot):
+        return []
+    quotas = quotas or {}
+    values = np.nan_to_num(snapshot.fit_score, nan=0.0) if values is None else np.asarray(values, dtype=np.float64)
+    costs = snapshot.price_mid
+    unit = total_budget / buckets
+    eligible = ~np.isnan(costs) & (costs <= total_budget) & (values > 0)
+
+    total = np.zeros(buckets + 1)
+    stages = []  # [(platform_idx, backtrack, split)]
+    for code, platform in enumerate(snapshot.platforms):
+        limit = quotas.get(platform)
+        if limit == 0:
+            continue
+        idx = np.flatnonzero(eligible & (snapshot.platform_codes == code))
+        if not len(idx):
+            continue
+        idx = _prune(idx, costs, values, MAX_CANDIDATES_PER_PLATFORM)
+        weights = np.ceil(costs[idx] / unit - 1e-9).astype(np.int64)
+        best, backtrack = _platform_table(weights, values[idx], buckets, limit)
+
+        # 分组背包：new[c] = max_x total[c - x] + best[x]，只需考虑 best 上升的预算点
+        new = total.copy()
+        split = np.zeros(buckets + 1, dtype=np.int64)
+        rising = np.flatnonzero(np.diff(best) > 0) + 1
+        for x in rising:
+            candidate = total[:buckets + 1 - x] + best[x]
+            better = candidate > new[x:]
+            new[x:] = np.where(better, candidate, new[x:])
+            split[x:][better] = x
+        total = new
+        stages.append((idx, backtrack, split))
+
+    chosen: List[int] = []
+    cap = buckets
+    for idx, backtrack, split in reversed(stages):
+        x = int(split[cap])
+        chosen.extend(idx[backtrack(x)].tolist())
+        cap -= x
+    return snapshot.ids[chosen].tolist()
@@ -0,0 +1,87 @@
+"""
+启动耗时报告。
+
+两种视角：
+1. mark(label) — 应用在启动关键节点打点，report() 输出各阶段耗时（进程内，零额外开销）
+2. importtime_breakdown() — 在子进程中以 `python -X importtime` 导入模块，
+   解析 stderr 得到按累计耗时排序的 import 明细，用于发现冷启动回归
+
+命令行：python -m utils.startup [module ...]   （默认分析 app 依赖的核心模块）
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+from utils.logger import get_logger
+
+logger = get_logger("startup")
+
+_T0 = time.perf_counter()
+_marks: List[Tuple[str, float]] = []
+_finished = False
+
+DEFAULT_MODULES = ["config", "database", "utils.registry", "agents.scout", "agents.analyst", "agents.writer"]
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def mark(label: str) -> None:
+    """记录一个启动节点（距 utils.startup 首次导入的时间）。首轮渲染结束后不再记录。"""
+    if _finished:
+        return
+    _marks.append((label, time.perf_counter() - _T0))
+
+
+def report() -> str:
+    """各节点的累计耗时与阶段耗时。"""
+    lines = ["Startup timing:"]
+    prev = 0.0
+    for label, at in _marks:
+        lines.append(f"  {label:<24} +{(at - prev) * 1000:7.1f}ms  (at {at * 1000:7.1f}ms)")
+        prev = at
+    return "\n".join(lines)
+
+
+def log_report_once() -> None:
+    """结束启动打点；每个进程只输出一次，且仅在设置 STARTUP_REPORT=1 时输出。"""
+    global _finished
+    if _finished:
+        return
+    _finished = True
+    if os.getenv("STARTUP_REPORT") == "1":
+        logger.info(report())
+
+
+def importtime_breakdown(modules: List[str] = None, top: int = 20) -> List[Tuple[str, float, float]]:
+    """
+    在干净的子进程中用 -X importtime 导入 modules，
+    返回 [(module, self_ms, cumulative_ms)]，按累计耗时降序。
+    """
+    modules = modules or DEFAULT_MODULES
+    code = "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)) / 1000, int(m.group(2)) / 1000))
+    rows.sort(key=lambda r: r[2], reverse=True)
+    return rows[:top]
+
+
+def format_breakdown(rows: List[Tuple[str, float, float]]) -> str:
+    lines = [f"{'cumulative':>12} {'self':>10}  module"]
+    for name, self_ms, cum_ms in rows:
+        lines.append(f"{cum_ms:10.1f}ms {self_ms:8.1f}ms  {name}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(format_breakdown(importtime_breakdown(sys.argv[1:] or None)))
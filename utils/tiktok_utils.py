@@ -1,17 +1,21 @@
 import os
-import re
 import asyncio
 import urllib.request
 import json
 from typing import Tuple
+from config import STATS_CALL_TIMEOUT
 from utils.platform_base import PlatformProvider
+from utils.registry import get_resource
+from utils.token_manager import TokenManager
+from utils.url_classifier import get_classifier
+from utils import transport
+from utils.usage import metered
 from utils.logger import get_logger
 
 logger = get_logger("tiktok")
 
-# 缓存 TikTok access token（有效期通常 2 小时）
-_tiktok_token: str = ""
-_tiktok_token_expires: float = 0
+# TikTok client access token 有效期通常 2 小时，提前 5 分钟在后台刷新
+TOKEN_REFRESH_MARGIN = 300
 
 
 class TikTokProvider(PlatformProvider):
@@ -40,14 +44,12 @@ class TikTokProvider(PlatformProvider):
         return "site:tiktok.com/@"
 
     def validate_url(self, url: str) -> bool:
-        return "tiktok.com" in url.lower()
+        return get_classifier().platform_of(url) == "TikTok"
 
     def extract_handle(self, url: str) -> str:
         """从 TikTok URL 提取用户名"""
-        m = re.search(r'tiktok\.com/@([\w\.\-]+)', url, re.IGNORECASE)
-        if m:
-            return f"@{m.group(1)}"
-        return ""
+        platform, handle = get_classifier().parse(url)
+        return handle if platform == "TikTok" else ""
 
     async def get_stats(self, url: str) -> Tuple[int, str, float]:
         """
@@ -67,9 +69,7 @@ class TikTokProvider(PlatformProvider):
             return 0, username, 0.0
 
         try:
-            token = await asyncio.to_thread(
-                self._get_access_token, client_key, client_secret
-            )
+            token = await self._token_manager(client_key, client_secret).aget()
             if not token:
                 return 0, username, 0.0
 
@@ -81,15 +81,23 @@ class TikTokProvider(PlatformProvider):
             logger.warning(f"TikTok API 查询失败 (@{username}): {e}")
             return 0, username, 0.0
 
-    def _get_access_token(self, client_key: str, client_secret: str) -> str:
-        """获取 TikTok client access token (OAuth 2.0 client_credentials)"""
-        global _tiktok_token, _tiktok_token_expires
-        import time
+    def _token_manager(self, client_key: str, client_secret: str) -> TokenManager:
+        """进程内共享的 token 管理器：并发查询只触发一次刷新，到期前后台续期。"""
+        return get_resource(
+            f"token:tiktok:{client_key}",
+            lambda: TokenManager(
+                "TikTok",
+                lambda _current: self._request_access_token(client_key, client_secret),
+                refresh_margin=TOKEN_REFRESH_MARGIN,
+            ),
+        )
 
-        # 如果 token 还没过期，直接返回
-        if _tiktok_token and time.time() < _tiktok_token_expires:
-            return _tiktok_token
+    def _get_access_token(self, client_key: str, client_secret: str) -> str:
+        """获取 TikTok client access token（同步接口，兼容旧调用）"""
+        return self._token_manager(client_key, client_secret).get()
 
+    def _request_access_token(self, client_key: str, client_secret: str) -> Tuple[str, float]:
+        """请求新的 client access token (OAuth 2.0 client_credentials)，返回 (token, expires_in)"""
         body = json.dumps({
             "client_key": client_key,
             "client_secret": client_secret,
@@ -103,19 +111,13 @@ class TikTokProvider(PlatformProvider):
             method="POST"
         )
 
-        with urllib.request.urlopen(req, timeout=15) as resp:
+        with metered("tiktok.oauth.token", api="tiktok"), transport.urlopen(req, timeout=15) as resp:
             data = json.loads(resp.read().decode())
 
-        _tiktok_token = data.get("access_token", "")
-        expires_in = data.get("expires_in", 7200)
-        _tiktok_token_expires = time.time() + expires_in - 60  # 提前 60 秒过期
-
-        if _tiktok_token:
-            logger.info(f"TikTok access token 获取成功 (有效期 {expires_in}s)")
-        else:
+        token = data.get("access_token", "")
+        if not token:
             logger.error(f"TikTok token 获取失败: {data}")
-
-        return _tiktok_token
+        return token, data.get("expires_in", 7200)
 
     def _fetch_user_info(self, username: str, access_token: str) -> Tuple[int, str, float]:
         """
@@ -136,7 +138,7 @@ class TikTokProvider(PlatformProvider):
             method="POST"
         )
 
-        with urllib.request.urlopen(req, timeout=15) as resp:
+        with metered("tiktok.research.user_info", api="tiktok"), transport.urlopen(req, timeout=STATS_CALL_TIMEOUT) as resp:
             data = json.loads(resp.read().decode())
 
         if data.get("error", {}).get("code") != "ok":
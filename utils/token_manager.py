@@ -0,0 +1,128 @@
+"""
+Access token 管理：单次刷新 (single-flight) + 到期前后台主动刷新。
+
+原先 TikTok token 存在无锁的模块全局变量里，多个查询同时遇到过期 token 时会各自去刷新。
+TokenManager 保证：
+- 同一时刻最多一个刷新请求，其余调用方等待并共享结果（跨线程、跨 event loop 均安全）
+- 进入刷新窗口（到期前 refresh_margin 秒）时继续返回旧 token，同时在后台刷新
+- 刷新成功后安排定时器，在下一次进入刷新窗口时自动后台刷新，token 刷新不占用查询延迟
+"""
+import asyncio
+import threading
+import time
+from typing import Callable, Optional, Tuple
+from utils.logger import get_logger
+
+logger = get_logger("token")
+
+RETRY_COOLDOWN = 30  # 刷新失败后，至少间隔这么久再重试（前台等待的调用方共享这次失败）
+
+# fetch(current_token) 返回 (token, expires_in_seconds)；token 为空表示获取失败。
+# current_token 供"用旧 token 换新 token"的刷新方式使用（如 Meta long-lived token）
+TokenFetcher = Callable[[str], Tuple[str, float]]
+
+
+class TokenManager:
+    def __init__(self, name: str, fetch: TokenFetcher, refresh_margin: float = 300,
+                 initial: Optional[Tuple[str, float]] = None, proactive: bool = True):
+        self.name = name
+        self._fetch = fetch
+        self._margin = refresh_margin
+        self._proactive = proactive
+        self._token = ""
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._last_attempt = 0.0
+        self._failed_at = 0.0      # 最近一次刷新失败的时间；成功后清零
+        if initial and initial[0]:
+            self._token = initial[0]
+            self._expires_at = time.time() + initial[1]
+
+    # ---------------- 状态 ----------------
+
+    def _fresh(self, now: float) -> bool:
+        return bool(self._token) and now < self._expires_at - self._margin
+
+    def _usable(self, now: float) -> bool:
+        return bool(self._token) and now < self._expires_at
+
+    # ---------------- 刷新 ----------------
+
+    def _refresh_locked(self) -> None:
+        """调用方必须持有 self._lock。"""
+        self._last_attempt = time.time()
+        try:
+            token, expires_in = self._fetch(self._token)
+        except Exception as e:
+            logger.warning(f"{self.name} token 刷新失败: {e}")
+            self._failed_at = self._last_attempt
+            return
+        if not token:
+            logger.error(f"{self.name} token 获取失败")
+            self._failed_at = self._last_attempt
+            return
+        self._failed_at = 0.0
+        self._token = token
+        self._expires_at = time.time() + expires_in
+        logger.info(f"{self.name} access token 刷新成功 (有效期 {int(expires_in)}s)")
+        self._schedule(expires_in)
+
+    def _schedule(self, expires_in: float) -> None:
+        if not self._proactive:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        delay = max(1.0, expires_in - self._margin)
+        self._timer = threading.Timer(delay, self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_in_background(self) -> None:
+        # 已有刷新在进行就直接跳过（它的结果会被所有调用方共享）
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if not self._fresh(time.time()):
+                self._refresh_locked()
+        finally:
+            self._lock.release()
+
+    def _kick_background_refresh(self) -> None:
+        if time.time() - self._last_attempt < RETRY_COOLDOWN:
+            return
+        threading.Thread(target=self._refresh_in_background, daemon=True, name=f"{self.name}-token").start()
+
+    # ---------------- 对外接口 ----------------
+
+    def get(self) -> str:
+        """同步获取 token（可能阻塞等待唯一一次刷新）。失败返回空字符串。"""
+        now = time.time()
+        if self._fresh(now):
+            return self._token
+        if self._usable(now):
+            # 进入刷新窗口：旧 token 仍有效，后台刷新，不阻塞调用方
+            self._kick_background_refresh()
+            return self._token
+
+        with self._lock:
+            now = time.time()
+            if not self._usable(now):
+                if now - self._failed_at < RETRY_COOLDOWN:
+                    # 刚失败过（可能就是前面排队的调用方发起的那次）：共享失败结果，不再各自重试
+                    return ""
+                self._refresh_locked()
+            return self._token if self._usable(time.time()) else ""
+
+    async def aget(self) -> str:
+        """异步获取 token：有效时直接返回，不切换线程；需要阻塞刷新时放到线程池里等待。"""
+        now = time.time()
+        if self._fresh(now):
+            return self._token
+        return await asyncio.to_thread(self.get)
+
+    def invalidate(self) -> None:
+        """标记当前 token 失效（例如 API 返回 401），下次 get 会刷新。"""
+        with self._lock:
+            self._token = ""
+            self._expires_at = 0.0
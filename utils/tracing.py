@@ -0,0 +1,169 @@
+"""
+轻量级链路追踪：span 计时 + JSONL 导出 + 按阶段汇总。
+
+日志只有 "Search returned N results" 之类的文本，看不出查询生成、搜索、统计补全、
+数据库写入、评分各花了多少时间。这里提供：
+- Trace：一次运行（如 Search + Score）的根，收集其中所有 span，结束时追加写入 TRACE_FILE
+- span(name, kind=...)：嵌套计时器，父子关系由 ContextVar 维护，
+  asyncio task 和 asyncio.to_thread 的线程会继承当前 span，不需要手动传递
+- Trace.breakdown()：按 span 名称汇总调用次数、累计耗时、墙钟区间，供 UI 展示
+
+kind 为 "internal"（流水线阶段）或 "client"（外部调用）。导出的每行是一个 span，
+字段名与 OTLP JSON 的 Span 一致（traceId / spanId / parentSpanId / startTimeUnixNano ...），
+可直接转换后导入 OpenTelemetry 后端。不在任何 Trace 内的 span 只计时、不记录。
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, NamedTuple, Optional
+from config import TRACING_ENABLED, TRACE_FILE
+from utils.logger import get_logger
+
+logger = get_logger("tracing")
+
+_KINDS = {"internal": "SPAN_KIND_INTERNAL", "client": "SPAN_KIND_CLIENT"}
+
+
+class Span:
+    __slots__ = ("name", "kind", "span_id", "parent_id", "start_ns", "end_ns", "_t0", "duration",
+                 "attrs", "error")
+
+    def __init__(self, name: str, kind: str, parent_id: Optional[str], attrs: dict):
+        self.name = name
+        self.kind = kind
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._t0 = time.perf_counter()
+        self.duration = 0.0
+        self.attrs = attrs
+        self.error: Optional[str] = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def _finish(self) -> None:
+        self.duration = time.perf_counter() - self._t0
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+
+    def to_record(self, trace_id: str) -> dict:
+        return {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": _KINDS.get(self.kind, _KINDS["internal"]),
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attrs,
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error
+                      else {"code": "STATUS_CODE_OK"},
+        }
+
+
+class StageTiming(NamedTuple):
+    name: str
+    kind: str
+    calls: int
+    busy: float     # 各次调用耗时之和（并发时可能大于 wall）
+    wall: float     # 第一次开始到最后一次结束
+    errors: int
+
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """一次运行的 span 收集器；用作 with 语句，退出时导出。"""
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(name, "internal", None, attrs)
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._tokens = None
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def __enter__(self) -> "Trace":
+        self._tokens = (_current_trace.set(self), _current_span.set(self.root))
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        trace_token, span_token = self._tokens
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if exc is not None:
+            self.root.error = f"{exc_type.__name__}: {exc}"
+        self.root._finish()
+        self.add(self.root)
+        self.export()
+
+    def export(self, path: str = TRACE_FILE) -> None:
+        """追加写入 JSONL；云环境可能无写权限，失败只记录警告。"""
+        if not TRACING_ENABLED or not path:
+            return
+        with self._lock:
+            lines = [json.dumps(s.to_record(self.trace_id), ensure_ascii=False, default=str) for s in self.spans]
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logger.warning(f"Trace export failed ({path}): {e}")
+
+    def breakdown(self) -> List[StageTiming]:
+        """按 span 名称汇总（不含根 span），按首次开始时间排序。"""
+        groups: Dict[str, List[Span]] = {}
+        with self._lock:
+            for s in self.spans:
+                if s is not self.root:
+                    groups.setdefault(s.name, []).append(s)
+        rows = []
+        for name, spans in groups.items():
+            first = min(s.start_ns for s in spans)
+            last = max(s.end_ns for s in spans)
+            rows.append((first, StageTiming(
+                name=name,
+                kind=spans[0].kind,
+                calls=len(spans),
+                busy=sum(s.duration for s in spans),
+                wall=(last - first) / 1e9,
+                errors=sum(1 for s in spans if s.error),
+            )))
+        return [row for _, row in sorted(rows, key=lambda r: r[0])]
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attrs):
+    """
+    计时一段代码（同步 / 异步代码中都可使用），yield 的 Span 可用 set() 补充属性。
+    异常会记录到 span 上并原样抛出（取消不算错误，如被对冲请求取消的副本）。
+    """
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    s = Span(name, kind, parent.span_id if parent else None, attrs)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        s._finish()
+        if trace is not None and TRACING_ENABLED:
+            trace.add(s)
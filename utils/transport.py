@@ -0,0 +1,16 @@
+"""
+urllib 请求的传输层接口。
+
+TikTok / Instagram 的 HTTP 调用都经过这里的 urlopen，而不是直接调用 urllib.request.urlopen。
+实际发送请求的函数是 registry 中的 "http_transport" 资源，默认就是 urllib.request.urlopen；
+基准测试 / 录制回放通过 registry.override("http_transport", fn) 换成本地实现，调用点不需要改动。
+
+传输函数的签名与 urllib.request.urlopen 相同：fn(request, timeout=...)，
+返回支持 with 语句、read() 和 headers.get() 的响应对象。
+"""
+import urllib.request
+from utils.registry import get_http_transport
+
+
+def urlopen(request: urllib.request.Request, timeout: float):
+    return get_http_transport()(request, timeout=timeout)
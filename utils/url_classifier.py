@@ -0,0 +1,198 @@
+"""
+编译后的 URL 分类器：黑名单过滤 + 平台识别 + handle 提取，一次遍历完成。
+
+原先每个 URL 要先对 GLOBAL_URL_BLACKLIST 做 O(patterns) 次子串查找，
+再依次调用各 Provider 的 validate_url / extract_handle（各自一次线性扫描或正则）。
+这里把所有黑名单词编译成一个正则 alternation，把三个平台的域名和 handle 规则
+编译成一个带命名分组的正则，进程内只编译一次（见 get_classifier）。
+
+平台规则来自 config.URL_RULES，并可通过 URL_RULES_FILE 指向的 JSON 文件追加，无需改代码。
+"""
+import json
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional
+from config import GLOBAL_URL_BLACKLIST, URL_RULES, URL_RULES_FILE
+from utils.logger import get_logger
+
+logger = get_logger("url_classifier")
+
+# 平台域名 + handle 形式（与各 Provider 原有的 extract_handle 规则一致）
+_PLATFORM_PATTERN = r"""
+    (?P<YouTube>youtube\.com)
+        (?:/(?:@(?P<yt_handle>[\w\-\.]+)|c/(?P<yt_custom>[\w\-\.]+)|channel/(?P<yt_channel>[\w\-]+)))?
+  | (?P<Instagram>instagram\.com)
+        (?:/(?P<ig_handle>[a-zA-Z0-9_\.]+))?
+  | (?P<TikTok>tiktok\.com)
+        (?:/@(?P<tt_handle>[\w\.\-]+))?
+"""
+
+PLATFORMS = ("YouTube", "Instagram", "TikTok")
+
+# YouTube 频道 ID：UC + 22 位 base64url。/c/ 自定义名也可能以 "UC" 开头（如 /c/UCBerkeley），不能只看前缀
+_CHANNEL_ID_RE = re.compile(r"UC[\w\-]{22}")
+
+
+class URLClass(NamedTuple):
+    platform: str           # "YouTube" / "Instagram" / "TikTok" / "Unknown"
+    handle: str             # "@foo"、YouTube 自定义名或 UC 频道 ID；无法提取时为 ""
+    blocked: Optional[str]  # 被拒绝的原因（命中的规则）；None 表示通过
+
+    @property
+    def accepted(self) -> bool:
+        return self.blocked is None and self.platform != "Unknown"
+
+    @property
+    def creator_key(self) -> Optional[str]:
+        return creator_key(self.platform, self.handle)
+
+    @property
+    def canonical_url(self) -> Optional[str]:
+        return canonical_url(self.platform, self.handle)
+
+
+def is_channel_id(handle: str) -> bool:
+    """handle 是否为 YouTube 频道 ID（而不是 /c/ 自定义名）。"""
+    return _CHANNEL_ID_RE.fullmatch(handle) is not None
+
+
+def creator_key(platform: str, handle: str) -> Optional[str]:
+    """
+    创作者身份键："platform:identity"，用于跨 URL 写法去重。
+    - YouTube/Instagram/TikTok 的 @handle 与用户名不区分大小写 → 小写
+    - YouTube 频道 ID (UCxxxx) 区分大小写 → 保留原样
+    - YouTube /c/ 自定义名 → "c/<name>" 小写
+    无法提取 handle 时返回 None（不参与身份去重）。
+    """
+    if not handle or platform not in PLATFORMS:
+        return None
+    prefix = platform.lower()
+    if platform == "YouTube" and not handle.startswith("@"):
+        if is_channel_id(handle):
+            return f"{prefix}:channel/{handle}"
+        return f"{prefix}:c/{handle.lower()}"
+    return f"{prefix}:{handle.lower()}"
+
+
+def canonical_url(platform: str, handle: str) -> Optional[str]:
+    """规范化的主页 URL（去掉 m./www. 变体、子页面路径和查询参数）。"""
+    if not handle:
+        return None
+    if platform == "YouTube":
+        if handle.startswith("@"):
+            return f"https://www.youtube.com/{handle}"
+        if is_channel_id(handle):
+            return f"https://www.youtube.com/channel/{handle}"
+        return f"https://www.youtube.com/c/{handle}"
+    if platform == "Instagram":
+        return f"https://www.instagram.com/{handle.lstrip('@')}/"
+    if platform == "TikTok":
+        return f"https://www.tiktok.com/{handle}"
+    return None
+
+
+def _compile_any(words: List[str]):
+    """把子串列表编译成一个不区分大小写的 alternation；空列表返回 None。"""
+    words = [w for w in words if w]
+    if not words:
+        return None
+    # 长词优先，避免前缀词抢先匹配导致命中原因不准确
+    words = sorted(set(words), key=len, reverse=True)
+    return re.compile("|".join(re.escape(w) for w in words), re.IGNORECASE)
+
+
+def load_rules(path: str = URL_RULES_FILE) -> dict:
+    """合并 config.URL_RULES 与 JSON 规则文件，返回 {"blacklist": [...], "platforms": {...}}。"""
+    blacklist = list(GLOBAL_URL_BLACKLIST)
+    platforms = {name: {k: list(v) for k, v in rules.items()} for name, rules in URL_RULES.items()}
+
+    if path and os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                extra = json.load(f)
+            blacklist.extend(extra.get("blacklist", []))
+            for name, rules in extra.get("platforms", {}).items():
+                target = platforms.setdefault(name, {"allow": [], "deny": [], "deny_handles": []})
+                for kind, values in rules.items():
+                    target.setdefault(kind, []).extend(values)
+            logger.info(f"已加载 URL 规则文件: {path}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"URL 规则文件解析失败 ({path}): {e}")
+
+    return {"blacklist": blacklist, "platforms": platforms}
+
+
+class URLClassifier:
+    def __init__(self, rules: dict = None):
+        rules = rules or load_rules()
+        self._blacklist = _compile_any(rules["blacklist"])
+        self._platform_re = re.compile(_PLATFORM_PATTERN, re.IGNORECASE | re.VERBOSE)
+
+        self._allow: Dict[str, Optional[re.Pattern]] = {}
+        self._deny: Dict[str, Optional[re.Pattern]] = {}
+        self._deny_handles: Dict[str, set] = {}
+        for name in PLATFORMS:
+            platform_rules = rules["platforms"].get(name, {})
+            self._allow[name] = _compile_any(platform_rules.get("allow", []))
+            self._deny[name] = _compile_any(platform_rules.get("deny", []))
+            self._deny_handles[name] = {h.lower() for h in platform_rules.get("deny_handles", [])}
+
+    @staticmethod
+    def _platform(m: re.Match) -> str:
+        # 平台分组包住了 handle 分组，lastgroup 可能是 handle，所以按平台名逐个判断
+        for name in PLATFORMS:
+            if m.group(name):
+                return name
+        return "Unknown"
+
+    def _handle(self, platform: str, m: re.Match) -> str:
+        if platform == "YouTube":
+            if m.group("yt_handle"):
+                return f"@{m.group('yt_handle')}"
+            return m.group("yt_custom") or m.group("yt_channel") or ""
+        raw = m.group("ig_handle") if platform == "Instagram" else m.group("tt_handle")
+        if raw and raw.lower() not in self._deny_handles[platform]:
+            return f"@{raw}"
+        return ""
+
+    def platform_of(self, url: str) -> str:
+        """只识别平台，不做黑名单 / 规则判断。"""
+        m = self._platform_re.search(url)
+        return self._platform(m) if m else "Unknown"
+
+    def parse(self, url: str):
+        """识别平台并提取 handle，不做黑名单 / 规则判断。返回 (platform, handle)。"""
+        m = self._platform_re.search(url)
+        if not m:
+            return "Unknown", ""
+        platform = self._platform(m)
+        return platform, self._handle(platform, m)
+
+    def classify(self, url: str) -> URLClass:
+        hit = self._blacklist.search(url) if self._blacklist else None
+        if hit:
+            return URLClass("Unknown", "", f"blacklist:{hit.group(0).lower()}")
+
+        m = self._platform_re.search(url)
+        if not m:
+            return URLClass("Unknown", "", None)
+
+        platform = self._platform(m)
+        handle = self._handle(platform, m)
+
+        deny = self._deny[platform]
+        if deny is not None:
+            hit = deny.search(url)
+            if hit:
+                return URLClass(platform, handle, f"deny:{hit.group(0).lower()}")
+        allow = self._allow[platform]
+        if allow is not None and not allow.search(url):
+            return URLClass(platform, handle, "not_allowed")
+
+        return URLClass(platform, handle, None)
+
+
+def get_classifier() -> URLClassifier:
+    """进程内共享的分类器（规则只加载、编译一次）。"""
+    from utils.registry import get_resource
+    return get_resource("url_classifier", URLClassifier)
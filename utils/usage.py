@@ -0,0 +1,160 @@
+"""
+API 用量台账：每次外部调用记录一行 api_usage（端点、配额单位、Gemini token、延迟、批次）。
+
+配额是硬上限：Custom Search 每天 100 次免费查询，YouTube Data API 每天 10k 单位
+（search.list 一次 100 单位，channels / videos / playlistItems.list 各 1 单位），
+Gemini 按 token 计费。台账让每个批次、每天的消耗可查，便于按"每单位配额的产出"调优。
+
+记录来源：
+- metered(endpoint, api)：包住一次同步 HTTP / SDK 调用，同时打开 tracing 的 client span
+- resilience.call(..., api=...)：经由 resilience 的调用（Gemini、Custom Search），
+  token 数从返回值的 usage_metadata 读取；对冲请求按实际发出的次数计单位
+- 包装层（如 stats:YouTube）不计量，只计量其内部的实际请求
+
+scope(batch_id) 在一次运行内缓冲记录，退出时一次性写入；批次在运行中才创建时用 set_batch 补上。
+不在 scope 内的调用直接写入一行。scope 同时承载每次运行的配额预算（reserve）。
+回放 cassette（见 utils.cassette）时照常记录，但单位记为 0。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+from database import get_db, ApiUsage
+from utils import cassette
+from utils.tracing import span
+from utils.logger import get_logger
+
+logger = get_logger("usage")
+
+# 各端点每次请求消耗的配额单位（未列出的按 1 计）
+ENDPOINT_UNITS = {
+    "youtube.search.list": 100,
+    "youtube.channels.list": 1,
+    "youtube.playlistItems.list": 1,
+    "youtube.videos.list": 1,
+    "cse.list": 1,
+}
+
+
+def units_for(endpoint: str) -> int:
+    return ENDPOINT_UNITS.get(endpoint, 1)
+
+
+def _tokens(usage_metadata) -> dict:
+    if usage_metadata is None:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage_metadata, "prompt_token_count", None),
+        "cached_tokens": getattr(usage_metadata, "cached_content_token_count", None),
+        "output_tokens": getattr(usage_metadata, "candidates_token_count", None),
+        "total_tokens": getattr(usage_metadata, "total_token_count", None),
+    }
+
+
+class UsageScope:
+    def __init__(self, batch_id: Optional[int] = None):
+        self.batch_id = batch_id
+        self.rows: List[dict] = []
+        self.reserved: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, row: dict) -> None:
+        with self._lock:
+            self.rows.append(row)
+
+    def reserve(self, endpoint: str, units: int, budget: int) -> bool:
+        with self._lock:
+            spent = self.reserved.get(endpoint, 0)
+            if spent + units > budget:
+                return False
+            self.reserved[endpoint] = spent + units
+            return True
+
+    def drain(self) -> List[dict]:
+        with self._lock:
+            rows, self.rows = self.rows, []
+        for row in rows:
+            row["batch_id"] = row["batch_id"] or self.batch_id
+        return rows
+
+
+_scope: ContextVar[Optional[UsageScope]] = ContextVar("usage_scope", default=None)
+
+
+def _write(rows: List[dict]) -> None:
+    if not rows:
+        return
+    try:
+        with get_db() as db:
+            db.add_all(ApiUsage(**row) for row in rows)
+            db.commit()
+    except Exception as e:
+        # 台账不能影响主流程
+        logger.warning(f"Failed to write {len(rows)} API usage rows: {e}")
+
+
+@contextmanager
+def scope(batch_id: Optional[int] = None):
+    """在当前上下文（含其中创建的 task / 线程）缓冲用量记录，退出时一次写入。"""
+    current = UsageScope(batch_id)
+    token = _scope.set(current)
+    try:
+        yield current
+    finally:
+        _scope.reset(token)
+        _write(current.drain())
+
+
+def set_batch(batch_id: int) -> None:
+    """运行中创建批次后调用：当前 scope 中未标注批次的记录都归入该批次。"""
+    current = _scope.get()
+    if current is not None and current.batch_id is None:
+        current.batch_id = batch_id
+
+
+def reserve(endpoint: str, budget: int) -> bool:
+    """
+    在本次运行的预算内预留一次 endpoint 调用的配额单位；超出预算返回 False（调用方跳过这次请求）。
+    不在 scope 内时每次调用单独判断（只要单次消耗不超过预算即可）。
+    """
+    units = units_for(endpoint)
+    current = _scope.get()
+    if current is None:
+        return units <= budget
+    return current.reserve(endpoint, units, budget)
+
+
+def record(api: str, endpoint: str, latency: float, ok: bool = True, units: Optional[int] = None,
+           usage_metadata=None, batch_id: Optional[int] = None) -> None:
+    if cassette.replaying():
+        units = 0   # 回放录制的响应，没有消耗真实配额
+    row = {
+        "api": api,
+        "endpoint": endpoint,
+        "units": units_for(endpoint) if units is None else units,
+        "latency_ms": int(latency * 1000),
+        "ok": ok,
+        "batch_id": batch_id,
+        "created_at": datetime.now(),
+        **_tokens(usage_metadata),
+    }
+    current = _scope.get()
+    if current is not None:
+        current.add(row)
+    else:
+        _write([row])
+
+
+@contextmanager
+def metered(endpoint: str, api: str, units: Optional[int] = None, **attrs):
+    """计量一次同步调用（client span + 台账一行）；失败的请求同样计入。"""
+    start = time.perf_counter()
+    ok = False
+    try:
+        with span(endpoint, kind="client", **attrs) as s:
+            yield s
+        ok = True
+    finally:
+        record(api, endpoint, time.perf_counter() - start, ok=ok, units=units)
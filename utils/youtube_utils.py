@@ -1,10 +1,18 @@
 import os
 import re
 import asyncio
-from typing import Tuple
-from googleapiclient.discovery import build
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from config import YOUTUBE_SEARCH_UNIT_BUDGET, YOUTUBE_NEGATIVE_TTL
+from database import get_db, YouTubeChannel
 from utils.platform_base import PlatformProvider
+from utils.url_classifier import get_classifier, is_channel_id
+from utils.registry import get_youtube_service
+from utils.engagement import youtube_engagement_bulk
+from utils import resilience, usage
+from utils.usage import metered
 from utils.logger import get_logger
 
 load_dotenv()
@@ -13,17 +21,11 @@ logger = get_logger("youtube")
 # 缓存：避免重复 API 调用
 _stats_cache: dict = {}
 
-# 缓存 YouTube service 对象（build() 很慢，只需初始化一次）
-_youtube_service = None
+# YouTube service 对象由 utils.registry 在进程内缓存（build() 很慢，只需初始化一次）
 
-
-def _get_youtube_service():
-    global _youtube_service
-    if _youtube_service is None:
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if api_key:
-            _youtube_service = build("youtube", "v3", developerKey=api_key)
-    return _youtube_service
+CHANNEL_IDS_PER_REQUEST = 50    # channels.list(id=...) 单次最多 50 个 ID
+_CHANNEL_PARTS = "id,snippet,statistics,contentDetails"
+_USER_RE = re.compile(r"youtube\.com/user/([\w\-\.]+)", re.IGNORECASE)
 
 
 class YouTubeProvider(PlatformProvider):
@@ -37,98 +39,260 @@ class YouTubeProvider(PlatformProvider):
         return "site:youtube.com/@"
 
     def validate_url(self, url: str) -> bool:
-        return "youtube.com" in url.lower()
+        return get_classifier().platform_of(url) == "YouTube"
 
     def extract_handle(self, url: str) -> str:
-        """从 YouTube URL 提取 @handle 或 /c/name"""
-        m = re.search(r'youtube\.com/@([\w\-\.]+)', url, re.IGNORECASE)
-        if m:
-            return f"@{m.group(1)}"
-        m = re.search(r'youtube\.com/c/([\w\-\.]+)', url, re.IGNORECASE)
-        if m:
-            return m.group(1)
-        m = re.search(r'youtube\.com/channel/([\w\-]+)', url, re.IGNORECASE)
-        if m:
-            return m.group(1)
-        return ""
+        """从 YouTube URL 提取 @handle、/c/name 或 /channel/UCxxxx"""
+        platform, handle = get_classifier().parse(url)
+        return handle if platform == "YouTube" else ""
 
     async def get_stats(self, url: str) -> Tuple[int, str, float]:
-        """获取 YouTube 频道统计。使用缓存 + 单例 service。"""
-        if url in _stats_cache:
-            return _stats_cache[url]
+        """获取 YouTube 频道统计（含最近视频互动率）。使用缓存 + 单例 service。"""
+        results = await self.get_stats_bulk([url])
+        return results.get(url, (0, "", 0.0))
 
+    async def get_stats_bulk(self, urls: List[str]) -> Dict[str, Tuple[int, str, float]]:
+        """
+        批量解析频道（见 _resolve_channels，优先走 1 单位的 channels.list），再把所有频道最近视频的统计
+        合并成批量 videos().list 请求计算互动率（见 utils.engagement）。
+        """
+        results: Dict[str, Tuple[int, str, float]] = {}
+        resolved: Dict[str, dict] = {}
         api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key or not self.validate_url(url):
-            return 0, "", 0.0
 
-        try:
-            result = await asyncio.to_thread(self._fetch_stats_sync, url)
-            _stats_cache[url] = result
-            return result
-        except Exception as e:
-            logger.error(f"YouTube API 错误 ({url}): {e}")
-            return 0, "", 0.0
+        pending = []
+        for url in urls:
+            if url in _stats_cache:
+                results[url] = _stats_cache[url]
+            elif not api_key or not self.validate_url(url):
+                results[url] = (0, "", 0.0)
+            else:
+                pending.append(url)
+
+        channels = {}
+        if pending:
+            try:
+                channels = await asyncio.to_thread(self._resolve_channels, pending)
+            except Exception as e:
+                logger.error(f"YouTube API 错误 ({len(pending)} 个频道): {e}")
+        for url in pending:
+            channel = channels.get(url, {"name": ""})
+            if channel.get("id"):
+                resolved[url] = channel
+            else:
+                # 未解析的不放进进程缓存：失败的已写入持久负缓存，预算跳过 / 出错的下次重试
+                results[url] = (0, channel.get("name", ""), 0.0)
+
+        if resolved:
+            rates = await youtube_engagement_bulk(
+                get_youtube_service(), {c["id"]: c.get("uploads") for c in resolved.values()}
+            )
+            for url, channel in resolved.items():
+                rate = rates.get(channel["id"])  # None：互动率未取到，不放进进程缓存，下次重试
+                results[url] = (channel["subs"], channel["name"], rate)
+                if rate is not None:
+                    _stats_cache[url] = results[url]
+
+        return results
 
     def _fetch_stats_sync(self, url: str) -> Tuple[int, str, float]:
-        """同步获取频道统计（在线程中运行），复用全局 service"""
-        youtube = _get_youtube_service()
-        if not youtube:
-            return 0, "", 0.0
+        """同步获取频道统计（不含互动率），复用全局 service"""
+        channel = self._resolve_channel(url)
+        return channel.get("subs", 0), channel.get("name", ""), 0.0
 
-        handle = self.extract_handle(url)
+    def _parse_channel(self, item: dict, fallback_name: str = "") -> dict:
+        return {
+            "id": item["id"],
+            "name": item["snippet"]["title"] or fallback_name,
+            "subs": int(item["statistics"].get("subscriberCount", 0)),
+            "uploads": item.get("contentDetails", {}).get("relatedPlaylists", {}).get("uploads"),
+        }
 
-        # 方式1: @handle → forHandle 直接查询（1 次 API）
+    def _resolve_channel(self, url: str) -> dict:
+        """同步解析单个频道（在线程中运行），见 _resolve_channels。"""
+        return self._resolve_channels([url]).get(url, {"name": ""})
+
+    def _lookup(self, url: str) -> Tuple[str, str, str]:
+        """
+        返回 (kind, value, key)：kind 为 "id" / "handle" / "custom" / "user" / "url"，
+        key 是持久映射表中的键（handle / 自定义名不区分大小写）。
+        """
+        handle = self.extract_handle(url)
         if handle.startswith("@"):
+            return "handle", handle[1:], handle.lower()
+        if is_channel_id(handle):
+            return "id", handle, handle
+        if handle:
+            return "custom", handle, f"c/{handle.lower()}"
+        m = _USER_RE.search(url)
+        if m:
+            return "user", m.group(1), f"user/{m.group(1).lower()}"
+        return "url", url, url
+
+    def _resolve_channels(self, urls: List[str]) -> Dict[str, dict]:
+        """
+        同步批量解析频道（在线程中运行），按配额成本从低到高：
+        1. /channel/UCxxxx 或持久映射表中已知的 channelId → 最后合并为 channels.list(id=最多 50 个) 批量查询
+        2. @handle → forHandle；/user/ → forUsername；/c/ → forHandle 再 forUsername（每次 1 单位，直接返回详情）
+        3. 仍未解析的 → search.list（100 单位），在本次运行的 YOUTUBE_SEARCH_UNIT_BUDGET 内
+        解析失败的标识写入负缓存，YOUTUBE_NEGATIVE_TTL 内不再尝试；请求出错不写入（下次重试）。
+        返回 {url: {"id", "name", "subs", "uploads"}}；找不到频道时只有 "name"（可能为空）。
+        """
+        youtube = get_youtube_service()
+        if not youtube:
+            return {url: {"name": ""} for url in urls}
+
+        out: Dict[str, dict] = {}
+        lookups = {url: self._lookup(url) for url in urls}
+        known = _load_resolutions({key for kind, _, key in lookups.values() if kind != "id"})
+        now = datetime.now()
+
+        channel_ids: Dict[str, str] = {}    # url → 已知 channelId，详情最后批量查询
+        names: Dict[str, str] = {}          # search 结果中的频道名（详情缺失时的回退）
+        found: Dict[str, Tuple[str, str]] = {}  # key → (channelId, resolved_via)，待写入映射表
+        failed = set()
+        leftovers = []
+
+        for url, (kind, value, key) in lookups.items():
+            if kind == "id":
+                channel_ids[url] = value
+                continue
+            if resilience.deadline_expired():
+                out[url] = {"name": ""}  # 运行截止时间已过：不再发起新请求（线程可能已被调用方放弃）
+                continue
+            row = known.get(key)
+            if row is not None and row.channel_id:
+                channel_ids[url] = row.channel_id
+                continue
+            if row is not None and (now - row.updated_at).total_seconds() < YOUTUBE_NEGATIVE_TTL:
+                out[url] = {"name": ""}  # 负缓存：近期解析失败过
+                continue
             try:
-                res = youtube.channels().list(
-                    forHandle=handle[1:],
-                    part="id,snippet,statistics"
-                ).execute()
-                if res.get('items'):
-                    item = res['items'][0]
-                    stats = item['statistics']
-                    subs = int(stats.get('subscriberCount', 0))
-                    name = item['snippet']['title']
-                    logger.info(f"查询成功: {handle} → {name} ({subs:,})")
-                    return subs, name, 0.0
+                item, via = self._cheap_lookup(youtube, kind, value)
             except Exception as e:
-                logger.warning(f"forHandle 失败 ({handle}), fallback: {e}")
-
-        # 方式2: /channel/UCxxxx → 直接用 ID
-        channel_id = handle if (handle and handle.startswith("UC")) else None
-        channel_name = ""
-
-        # 方式3: fallback → 搜索
-        if not channel_id:
-            search_res = youtube.search().list(
-                q=url, type="channel", part="id,snippet", maxResults=1
-            ).execute()
-            if not search_res.get('items'):
+                logger.warning(f"频道查询失败 ({url}): {e}")
+                out[url] = {"name": ""}
+                continue
+            if item is not None:
+                out[url] = self._parse_channel(item)
+                found[key] = (item["id"], via)
+                logger.info(f"查询成功 ({via}): {value} → {out[url]['name']} ({out[url]['subs']:,})")
+            else:
+                leftovers.append(url)
+
+        # 少数剩余的才走 search.list，受每次运行的配额预算限制
+        for i, url in enumerate(leftovers):
+            kind, value, key = lookups[url]
+            if resilience.deadline_expired():
+                out[url] = {"name": ""}
+                continue
+            if not usage.reserve("youtube.search.list", YOUTUBE_SEARCH_UNIT_BUDGET):
+                logger.warning(f"search.list 预算 ({YOUTUBE_SEARCH_UNIT_BUDGET} 单位) 已用完，跳过 {len(leftovers) - i} 个频道")
+                for rest in leftovers[i:]:
+                    out[rest] = {"name": ""}
+                break
+            try:
+                with metered("youtube.search.list", api="youtube_data"):
+                    res = youtube.search().list(q=value, type="channel", part="id,snippet", maxResults=1).execute()
+            except Exception as e:
+                logger.warning(f"搜索频道失败 ({url}): {e}")
+                out[url] = {"name": ""}
+                continue
+            if not res.get('items'):
                 logger.warning(f"搜索未找到: {url}")
-                return 0, "", 0.0
-            channel_id = search_res['items'][0]['id']['channelId']
-            channel_name = search_res['items'][0]['snippet']['title']
+                failed.add(key)
+                out[url] = {"name": ""}
+                continue
+            channel_ids[url] = res['items'][0]['id']['channelId']
+            names[url] = res['items'][0]['snippet']['title']
+            found[key] = (channel_ids[url], "search")
 
-        detail_res = youtube.channels().list(
-            id=channel_id, part="statistics,snippet"
-        ).execute()
-        if not detail_res.get('items'):
-            return 0, channel_name, 0.0
+        if channel_ids:
+            try:
+                items = self._channels_by_id(youtube, list(dict.fromkeys(channel_ids.values())))
+            except Exception as e:
+                logger.warning(f"批量查询频道详情失败 ({len(channel_ids)} 个): {e}")
+                items = None
+            for url, channel_id in channel_ids.items():
+                item = items.get(channel_id) if items is not None else None
+                if item is None:
+                    out[url] = {"name": names.get(url, "")}
+                    kind, _, key = lookups[url]
+                    if items is not None and kind != "id":
+                        failed.add(key)  # 映射到的频道已不存在
+                        found.pop(key, None)
+                    continue
+                out[url] = self._parse_channel(item, names.get(url, ""))
 
-        item = detail_res['items'][0]
-        subs = int(item['statistics'].get('subscriberCount', 0))
-        name = item['snippet']['title'] or channel_name
-        logger.info(f"查询成功: {name} ({subs:,})")
-        return subs, name, 0.0
+        _save_resolutions(found, failed)
+        return out
 
+    def _cheap_lookup(self, youtube, kind: str, value: str) -> Tuple[Optional[dict], str]:
+        """1 单位的 channels.list 查询；返回 (频道 item 或 None, 查询方式)。"""
+        attempts = {
+            "handle": ("forHandle",),
+            "user": ("forUsername",),
+            "custom": ("forHandle", "forUsername"),  # 多数 /c/ 自定义名与 @handle 或旧用户名相同
+        }.get(kind, ())
+        for via in attempts:
+            with metered("youtube.channels.list", api="youtube_data", lookup=via):
+                res = youtube.channels().list(part=_CHANNEL_PARTS, **{via: value}).execute()
+            if res.get('items'):
+                return res['items'][0], via
+        return None, ""
+
+    def _channels_by_id(self, youtube, channel_ids: List[str]) -> Dict[str, dict]:
+        """channels.list(id=...) 每次最多 50 个 ID，1 单位。"""
+        items = {}
+        for i in range(0, len(channel_ids), CHANNEL_IDS_PER_REQUEST):
+            chunk = channel_ids[i:i + CHANNEL_IDS_PER_REQUEST]
+            with metered("youtube.channels.list", api="youtube_data", lookup="id", channels=len(chunk)):
+                res = youtube.channels().list(
+                    id=",".join(chunk), part=_CHANNEL_PARTS, maxResults=CHANNEL_IDS_PER_REQUEST
+                ).execute()
+            for item in res.get('items', []):
+                items[item['id']] = item
+        return items
 
-# 向后兼容
-_provider = YouTubeProvider()
 
+def _load_resolutions(keys) -> Dict[str, YouTubeChannel]:
+    if not keys:
+        return {}
+    with get_db() as db:
+        rows = db.query(YouTubeChannel).filter(YouTubeChannel.key.in_(list(keys))).all()
+        db.expunge_all()
+    return {row.key: row for row in rows}
 
+
+def _save_resolutions(found: Dict[str, Tuple[str, str]], failed: set) -> None:
+    """写入 / 更新映射表；并发写入同一键时放弃本次写入（只是缓存）。"""
+    if not found and not failed:
+        return
+    keys = set(found) | failed
+    try:
+        with get_db() as db:
+            rows = {row.key: row for row in db.query(YouTubeChannel).filter(YouTubeChannel.key.in_(list(keys)))}
+            for key in keys:
+                row = rows.get(key)
+                if row is None:
+                    row = YouTubeChannel(key=key, failures=0)
+                    db.add(row)
+                if key in found:
+                    row.channel_id, row.resolved_via = found[key]
+                else:
+                    row.channel_id = None
+                    row.failures = (row.failures or 0) + 1
+                row.updated_at = datetime.now()
+            db.commit()
+    except IntegrityError as e:
+        logger.warning(f"频道映射写入冲突，已跳过: {e}")
+
+
+# 向后兼容
 def get_youtube_stats(url: str) -> Tuple[int, str]:
     """兼容旧接口"""
     if not os.getenv("GOOGLE_API_KEY") or "youtube.com" not in url.lower():
         return 0, ""
-    subs, name, _ = _provider._fetch_stats_sync(url)
+    from utils.registry import get_provider
+    subs, name, _ = get_provider("YouTube")._fetch_stats_sync(url)
     return subs, name